@@ -1,19 +1,24 @@
 import os
+import csv
 import json
 import logging
 import re
 import hmac
 import hashlib
+import queue
+import tempfile
 import threading
 import unicodedata
 import uuid
 import time
-from collections import deque
+import zlib
+from collections import OrderedDict, deque
+from contextlib import contextmanager
 from datetime import datetime, timezone, timedelta
 
 import requests
 import openai
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from dotenv import load_dotenv
 
 import whatsapp_interactive as wai
@@ -51,6 +56,14 @@ except ImportError:
     _redis_libs = False
     log.warning("⚠️ redis no instalado. Persistencia en memoria.")
 
+try:
+    import numpy as np
+    _numpy_libs = True
+except ImportError:
+    np = None
+    _numpy_libs = False
+    log.warning("⚠️ numpy no instalado. Propuestas IMSS en lote en modo escalar.")
+
 # ── Variables de entorno ──────────────────────────────────────────────────────
 load_dotenv()
 
@@ -86,6 +99,9 @@ class StateStore:
         self._state_mem = {}
         self._data_mem = {}
         self._aux_mem = {}
+        self._aux_sets = {}
+        self._aux_zsets = {}
+        self._aux_lock = threading.Lock()
         redis_url = (os.getenv("KV_URL", "").strip() or os.getenv("REDIS_URL", "").strip())
         if redis_url and _redis_libs:
             try:
@@ -200,6 +216,108 @@ class StateStore:
         except Exception:
             return None
 
+    # Lectura-modificacion-escritura atomica de una clave auxiliar: `fn`
+    # recibe el valor actual (o None) y devuelve el nuevo. En Redis es una
+    # transaccion optimista (WATCH/MULTI, reintenta si otro proceso escribio
+    # en medio); en memoria, un lock. Mismo contrato best-effort: False si no
+    # se pudo, nunca una excepcion.
+    def aux_update(self, key: str, fn, ttl: int) -> bool:
+        try:
+            if self._redis:
+                k = f"vicky:{key}"
+                with self._redis.pipeline() as pipe:
+                    for _ in range(5):
+                        try:
+                            pipe.watch(k)
+                            nuevo = fn(pipe.get(k))
+                            pipe.multi()
+                            pipe.setex(k, max(int(ttl), 1), nuevo)
+                            pipe.execute()
+                            return True
+                        except redis.WatchError:
+                            continue
+                return False
+            with self._aux_lock:
+                return self.aux_set(key, fn(self.aux_get(key)), ttl)
+        except Exception:
+            return False
+
+    # Conjuntos auxiliares (indices de trabajos pendientes). Mismo contrato
+    # best-effort que aux_set/aux_get: nunca propagan la excepcion.
+    def aux_sadd(self, key: str, member: str, ttl: int) -> bool:
+        try:
+            if self._redis:
+                self._redis.sadd(f"vicky:{key}", member)
+                self._redis.expire(f"vicky:{key}", max(int(ttl), 1))
+                return True
+            self._aux_sets.setdefault(key, set()).add(member)
+            return True
+        except Exception:
+            return False
+
+    def aux_srem(self, key: str, member: str) -> bool:
+        try:
+            if self._redis:
+                self._redis.srem(f"vicky:{key}", member)
+                return True
+            self._aux_sets.get(key, set()).discard(member)
+            return True
+        except Exception:
+            return False
+
+    def aux_smembers(self, key: str) -> set:
+        try:
+            if self._redis:
+                return set(self._redis.smembers(f"vicky:{key}") or ())
+            return set(self._aux_sets.get(key, ()))
+        except Exception:
+            return set()
+
+    # Conjuntos ordenados auxiliares (colas por "cuando toca"): el score es un
+    # timestamp. aux_zrem devuelve True solo si ESTE llamador quito el
+    # miembro, asi dos workers no procesan la misma entrada.
+    def aux_zadd(self, key: str, member: str, score: float, ttl: int) -> bool:
+        try:
+            if self._redis:
+                self._redis.zadd(f"vicky:{key}", {member: float(score)})
+                self._redis.expire(f"vicky:{key}", max(int(ttl), 1))
+                return True
+            with self._aux_lock:
+                self._aux_zsets.setdefault(key, {})[member] = float(score)
+            return True
+        except Exception:
+            return False
+
+    def aux_zrem(self, key: str, member: str) -> bool:
+        try:
+            if self._redis:
+                return bool(self._redis.zrem(f"vicky:{key}", member))
+            with self._aux_lock:
+                return self._aux_zsets.get(key, {}).pop(member, None) is not None
+        except Exception:
+            return False
+
+    def aux_zvencidos(self, key: str, hasta: float, limite: int) -> list:
+        """[(miembro, score)] con score <= hasta, del mas antiguo al mas nuevo."""
+        try:
+            if self._redis:
+                return [(m, float(sc)) for m, sc in self._redis.zrangebyscore(
+                    f"vicky:{key}", "-inf", hasta, start=0, num=limite, withscores=True)]
+            with self._aux_lock:
+                items = sorted(((sc, m) for m, sc in self._aux_zsets.get(key, {}).items()
+                                if sc <= hasta))
+            return [(m, sc) for sc, m in items[:limite]]
+        except Exception:
+            return []
+
+    def aux_zcard(self, key: str) -> int:
+        try:
+            if self._redis:
+                return int(self._redis.zcard(f"vicky:{key}") or 0)
+            return len(self._aux_zsets.get(key, {}))
+        except Exception:
+            return 0
+
     def _aux_prune(self) -> None:
         # Solo en modo memoria: acota el diccionario cuando Redis no esta
         # disponible, para que un proceso de larga vida no acumule claves
@@ -523,6 +641,49 @@ def _report_upsert_lead(phone: str, **campos) -> None:
     except Exception:
         log.exception("❌ Error en reporte de leads")
 
+
+_REPORTE_LOTE_FILAS = 500
+
+
+def _report_telefonos_existentes() -> set:
+    """Telefonos (10 digitos) que ya tienen fila en el reporte de leads. Una
+    sola lectura de la columna A; vacio si Sheets no esta disponible."""
+    if not _srdy:
+        return set()
+    try:
+        filas = _svc.spreadsheets().values().get(
+            spreadsheetId=SHEET_ID, range=f"{SHEET_TAB_REPORTE}!A:A").execute().get("values", [])
+        return {re.sub(r"\D", "", f[0])[-10:] for f in filas[1:] if f and f[0]}
+    except Exception:
+        log.exception("❌ Error leyendo reporte de leads")
+        return set()
+
+
+def _report_append_leads(leads: list) -> int:
+    """Alta de muchos leads nuevos en el reporte: un append por cada
+    _REPORTE_LOTE_FILAS filas en vez de un GET+append por lead como
+    _report_upsert_lead(). Solo para telefonos que aun no tienen fila.
+    Devuelve cuantas filas se escribieron."""
+    if not _srdy or not leads:
+        return 0
+    ahora = now_mx()
+    escritas = 0
+    for i in range(0, len(leads), _REPORTE_LOTE_FILAS):
+        bloque = [[str({
+            "Telefono": lead.get("telefono", ""), "Nombre": lead.get("nombre", ""),
+            "Producto": lead.get("producto", ""), "Estado": lead.get("estado", ""),
+            "Fecha inicio": ahora, "Ultima actualizacion": ahora,
+        }.get(h, "")) for h in _HDR_REPORTE] for lead in leads[i:i + _REPORTE_LOTE_FILAS]]
+        try:
+            _svc.spreadsheets().values().append(
+                spreadsheetId=SHEET_ID, range=f"{SHEET_TAB_REPORTE}!A:K",
+                valueInputOption="RAW", insertDataOption="INSERT_ROWS",
+                body={"values": bloque}).execute()
+            escritas += len(bloque)
+        except Exception:
+            log.exception("❌ Error en reporte de leads (lote)")
+    return escritas
+
 # ── WhatsApp helpers ──────────────────────────────────────────────────────────
 _WA_BASE = "https://graph.facebook.com/v20.0"
 
@@ -650,7 +811,7 @@ def send_imss_dynamic_flow(phone: str) -> str:
         log.error(f"flow_send_failed reason=invalid_payload detail={e}")
         return IMSS_FLOW_FALLIDO
 
-    if not _state_store.aux_set(f"imss_flow_token:{token}", _digits(phone), _IMSS_FLOW_TOKEN_TTL):
+    if not _imss_flow_sesion_crear(token, _digits(phone)):
         log.error("flow_send_failed reason=correlation_write_failed")
         return IMSS_FLOW_FALLIDO
 
@@ -753,13 +914,21 @@ def _advisor_window_state() -> str:
     return "open" if (time.time() - ts) < _ADV_WINDOW_SECONDS else "closed"
 
 
-def _advisor_wamid_remember(wamid: str, level: str, msg: str) -> None:
+def _advisor_wamid_remember(wamid: str, level: str, msg: str, alertas=None,
+                            reintento: str = "") -> None:
+    registro = {"ts": time.time(), "level": level}
+    if alertas:
+        # wamid de un resumen: ids de cada alerta incluida.
+        registro["alertas"] = list(alertas)
+    if reintento:
+        registro["reintento"] = reintento
     _state_store.aux_set(
         f"adv_wamid:{wamid}",
-        json.dumps({"ts": time.time(), "level": level}, ensure_ascii=False),
+        json.dumps(registro, ensure_ascii=False),
         _ADV_WAMID_TTL,
     )
-    _state_store.aux_set(f"adv_retry:{wamid}", str(msg or "")[:2000], _ADV_RETRY_TTL)
+    limite = _ADV_DIGEST_TEXTO_MAX if alertas else 2000
+    _state_store.aux_set(f"adv_retry:{wamid}", str(msg or "")[:limite], _ADV_RETRY_TTL)
 
 
 def _advisor_wamid_lookup(wamid: str):
@@ -773,7 +942,7 @@ def _advisor_wamid_lookup(wamid: str):
         return None
 
 
-def _advisor_record_send(resp, level: str, msg: str) -> str:
+def _advisor_record_send(resp, level: str, msg: str, alertas=None) -> str:
     """Instrumentacion del envio al asesor. Best-effort y sin excepciones.
 
     Registra lo que antes se perdia por completo: status HTTP real, si el cuerpo
@@ -794,18 +963,20 @@ def _advisor_record_send(resp, level: str, msg: str) -> str:
     except Exception:
         json_valid = False
     log.info(
-        "asesor_envio: nivel=%s http=%s json_valido=%s wamid=%s destino=%s",
+        "asesor_envio: nivel=%s http=%s json_valido=%s wamid=%s destino=%s alertas=%s",
         level, status, json_valid, (wamid[:24] or "ninguno"), _mask_phone(ADVISOR_NUM),
+        ",".join(alertas) if alertas else "-",
     )
     if wamid:
         try:
-            _advisor_wamid_remember(wamid, level, msg)
+            reintento = _advisor_reintento_seguir(wamid, msg, alertas) if ADVISOR_RETRY_ENABLED else ""
+            _advisor_wamid_remember(wamid, level, msg, alertas, reintento)
         except Exception:
             log.warning("asesor_correlacion_no_persistida: wamid=%s", wamid[:24])
     return wamid
 
 
-def _notify_advisor_via_template(msg: str, motivo: str) -> bool:
+def _notify_advisor_via_template(msg: str, motivo: str, alertas=None) -> bool:
     """Nivel 2 — template aprobada.
 
     Unico formato que Meta entrega fuera de la ventana de 24h. Sin
@@ -816,6 +987,19 @@ def _notify_advisor_via_template(msg: str, motivo: str) -> bool:
                     "Define esta variable con el template aprobado en Meta para "
                     "notificaciones fuera de ventana 24h.")
         return False
+    if (alertas and len(alertas) > 1
+            and len(_sanitize_template_param(msg, limit=0)) > _TPL_PARAM_LIMIT):
+        # Un resumen armado para texto libre no cabe en el parametro del
+        # template: se vuelve a partir desde el cuerpo de cada alerta, para
+        # que ninguna quede truncada con su id ligado a un wamid "entregado".
+        # Una sola alerta larga no se puede partir mas: se trunca como
+        # cualquier otro parametro.
+        piezas = [{"id": i, "msg": _state_store.aux_get(f"adv_alerta:{i}")} for i in alertas]
+        if all(p["msg"] for p in piezas):
+            return _advisor_template_por_partes(
+                _advisor_digest_componer(piezas, _TPL_PARAM_LIMIT), motivo)
+        log.warning("asesor_resumen_truncado: sin cuerpo de alertas=%s",
+                    ",".join(p["id"] for p in piezas if not p["msg"]))
     tpl_param = _sanitize_template_param(msg, limit=_TPL_PARAM_LIMIT)
     r2 = _wa_post({"messaging_product": "whatsapp", "to": ADVISOR_NUM,
                    "type": "template", "template": {
@@ -824,7 +1008,7 @@ def _notify_advisor_via_template(msg: str, motivo: str) -> bool:
                                        "parameters": [{"type": "text", "text": tpl_param}]}]}})
     ok = r2.status_code in (200, 201)
     if ok:
-        _advisor_record_send(r2, "template", msg)
+        _advisor_record_send(r2, "template", msg, alertas)
     _log(ADVISOR_NUM, "Asesor", msg, "saliente", "asesor",
          "ok" if ok else "error", "" if ok else r2.text[:200], _mid())
     if ok:
@@ -851,8 +1035,40 @@ def _sanitize_template_param(text: str, limit: int = 1024) -> str:
     return s or _TPL_PARAM_FALLBACK
 
 
-def notify_advisor(msg: str) -> bool:
+def _advisor_template_por_partes(partes: list, motivo: str) -> bool:
+    """Envia por template cada parte [(texto, ids)] de un resumen re-partido.
+
+    Si el envio viene de un reintento (_tl.adv_envio["reintento"]), cada parte
+    queda con su propio registro en el programador, con solo sus alertas: un
+    `delivered` de la parte 1 no confirma la parte 2, y un `failed` de la
+    parte 2 no reenvia las alertas de la parte 1. El registro del resumen
+    completo se retira.
+    """
+    ctx = getattr(_tl, "adv_envio", None) or {}
+    padre = ctx.get("reintento") if ADVISOR_RETRY_ENABLED else ""
+    resultados = []
+    try:
+        for texto, ids in partes:
+            rid = _advisor_reintento_parte(padre, texto, ids) if padre else ""
+            _tl.adv_envio = parte_ctx = {**ctx, "reintento": rid or None}
+            ok = _notify_advisor_via_template(texto, motivo, ids)
+            if rid:
+                _advisor_reintento_tras_envio(rid, ok, parte_ctx)
+            resultados.append(ok)
+    finally:
+        _tl.adv_envio = ctx or None
+    if padre:
+        _advisor_reintento_repartir(padre)
+    return all(resultados)
+
+
+def notify_advisor(msg: str, urgente: bool = False) -> bool:
     """
+    Con ADVISOR_DIGEST_ENABLED, una alerta no urgente no sale sola: se suma al
+    resumen pendiente (_advisor_digest_agregar) y devuelve True en cuanto queda
+    persistida. `urgente=True` (el prospecto pide hablar con alguien ya) la
+    envia de inmediato, como siempre.
+
     Nivel 1 — texto libre (solo se entrega dentro de la ventana 24h del asesor).
     Nivel 2 — template aprobada (ADVISOR_TEMPLATE_NAME), con el parámetro
     sanitizado (_sanitize_template_param), nunca msg crudo.
@@ -869,11 +1085,29 @@ def notify_advisor(msg: str) -> bool:
     """
     if not ADVISOR_NUM:
         return False
+    if ADVISOR_DIGEST_ENABLED:
+        if not urgente and _advisor_digest_agregar(msg):
+            return True
+        with _adv_digest_lock:
+            _adv_digest_contadores["inmediatas"] += 1
+    _tl.adv_envio = {"prioridad": 2 if urgente else 1}
+    try:
+        return _notify_advisor_enviar(msg)
+    finally:
+        _tl.adv_envio = None
+
+
+def _notify_advisor_enviar(msg: str, alertas=None) -> bool:
+    """Envio inmediato al asesor (niveles 1 y 2 de notify_advisor).
+
+    `alertas`: ids de las alertas que viajan en este mensaje cuando es un
+    resumen; quedan ligadas al wamid para el reenvio por `failed`.
+    """
     try:
         if _advisor_window_state() == "closed" and ADV_TPL:
             log.info("asesor_ventana_cerrada: envío directo por template "
                      "(texto libre no se entregaría)")
-            return _notify_advisor_via_template(msg, motivo="ventana_cerrada")
+            return _notify_advisor_via_template(msg, motivo="ventana_cerrada", alertas=alertas)
     except Exception:
         # La contabilidad de la ventana nunca puede impedir un envío: ante
         # cualquier fallo se sigue por el camino histórico.
@@ -882,7 +1116,7 @@ def notify_advisor(msg: str) -> bool:
         r = _wa_post({"messaging_product": "whatsapp", "to": ADVISOR_NUM,
                       "type": "text", "text": {"body": msg}})
         if r.status_code in (200, 201):
-            _advisor_record_send(r, "texto_libre", msg)
+            _advisor_record_send(r, "texto_libre", msg, alertas)
             log.info("✅ Asesor notificado (texto libre)")
             _log(ADVISOR_NUM, "Asesor", msg, "saliente", "asesor", "ok", "", _mid())
             return True
@@ -898,13 +1132,500 @@ def notify_advisor(msg: str) -> bool:
             _log(ADVISOR_NUM, "Asesor", msg, "saliente", "asesor", "error", err1, _mid())
             return False
 
-        return _notify_advisor_via_template(msg, motivo="texto_libre_falló")
+        return _notify_advisor_via_template(msg, motivo="texto_libre_falló", alertas=alertas)
 
     except Exception:
         log.exception("💥 notify_advisor")
         return False
 
 
+# ── Resumen de alertas al asesor (ADVISOR_DIGEST_ENABLED) ─────────────────────
+# Cada lead calificado era un notify_advisor() propio; fuera de la ventana de
+# 24h cada uno es un template de pago, y una rafaga de ellos es justo lo que
+# Meta castiga con 131049 ("healthy ecosystem engagement", ver
+# _advisor_handle_failed). En modo resumen las alertas no urgentes se guardan
+# en adv_digest (StateStore, sobrevive reinicios) y cada
+# ADVISOR_DIGEST_WINDOW_S -- o al juntar ADVISOR_DIGEST_MAX -- salen en UN
+# mensaje numerado. Si no cabe en un mensaje (texto libre ~4096, parametro
+# de template _TPL_PARAM_LIMIT) se parte en los menos posibles.
+# Cada alerta lleva un id; el wamid de cada mensaje guarda los ids que
+# incluyo (adv_wamid:<wamid>.alertas), asi un `failed` de Meta se rastrea
+# hasta cada lead del resumen.
+_ADV_DIGEST_KEY = "adv_digest"
+_ADV_DIGEST_TTL = 7 * 24 * 3600
+_ADV_DIGEST_TEXTO_MAX = 3500
+# Reserva para "📋 RESUMEN DE ALERTAS (n) — parte i/k" dentro del limite.
+_ADV_DIGEST_ENCABEZADO_MAX = 60
+_ADV_DIGEST_BACKOFF_S = (30, 120, 600)
+_adv_digest_contadores = {"encoladas": 0, "inmediatas": 0, "resumenes": 0,
+                          "alertas_resumidas": 0, "reintentos": 0, "perdidas": 0}
+_adv_digest_lock = threading.Lock()
+_adv_digest_timer = None
+
+
+def _advisor_digest_lista(raw) -> list:
+    try:
+        val = json.loads(raw) if raw else []
+    except (TypeError, ValueError):
+        val = []
+    return [a for a in val if isinstance(a, dict) and a.get("msg")] if isinstance(val, list) else []
+
+
+def _advisor_digest_agregar(msg: str) -> bool:
+    """Suma la alerta al resumen pendiente. False si no se pudo persistir
+    (el llamador la envia sola, como antes)."""
+    alerta = {"id": uuid.uuid4().hex[:12], "ts": time.time(), "msg": str(msg), "intentos": 0}
+    total = {"n": 0}
+
+    def _fn(actual):
+        pendientes = _advisor_digest_lista(actual)
+        pendientes.append(alerta)
+        total["n"] = len(pendientes)
+        return json.dumps(pendientes, ensure_ascii=False)
+
+    if not _state_store.aux_update(_ADV_DIGEST_KEY, _fn, _ADV_DIGEST_TTL):
+        return False
+    with _adv_digest_lock:
+        _adv_digest_contadores["encoladas"] += 1
+    log.info("asesor_alerta_en_resumen: id=%s pendientes=%s", alerta["id"], total["n"])
+    if total["n"] >= ADVISOR_DIGEST_MAX:
+        _advisor_digest_programar(0)
+    elif total["n"] == 1:
+        _advisor_digest_programar(ADVISOR_DIGEST_WINDOW_S)
+    return True
+
+
+def _advisor_digest_programar(espera: float) -> None:
+    global _adv_digest_timer
+    with _adv_digest_lock:
+        if _adv_digest_timer is not None:
+            if espera > 0:
+                return
+            _adv_digest_timer.cancel()
+        t = threading.Timer(max(0, espera), _advisor_digest_vaciar)
+        t.daemon = True
+        _adv_digest_timer = t
+    t.start()
+
+
+def _advisor_digest_componer(alertas: list, limite: int) -> list:
+    """Agrupa las alertas en el menor numero de mensajes de hasta `limite`
+    caracteres. Devuelve [(texto, [ids])]."""
+    limite -= _ADV_DIGEST_ENCABEZADO_MAX
+    grupos, actual, largo = [], [], 0
+    for a in alertas:
+        n = len(a["msg"]) + 8
+        if actual and largo + n > limite:
+            grupos.append(actual)
+            actual, largo = [], 0
+        actual.append(a)
+        largo += n
+    if actual:
+        grupos.append(actual)
+    total = len(alertas)
+    mensajes, i = [], 0
+    for grupo in grupos:
+        partes = []
+        for a in grupo:
+            i += 1
+            partes.append(f"{i}) {a['msg']}")
+        encabezado = f"📋 RESUMEN DE ALERTAS ({total})"
+        if len(grupos) > 1:
+            encabezado += f" — parte {len(mensajes) + 1}/{len(grupos)}"
+        mensajes.append((encabezado + "\n\n" + "\n\n".join(partes), [a["id"] for a in grupo]))
+    return mensajes
+
+
+def _advisor_digest_vaciar() -> None:
+    """Toma todas las alertas pendientes (atomico: otro worker que vacie al
+    mismo tiempo recibe la lista vacia) y las envia como resumen."""
+    global _adv_digest_timer
+    with _adv_digest_lock:
+        _adv_digest_timer = None
+    tomadas = []
+
+    def _tomar(actual):
+        tomadas[:] = _advisor_digest_lista(actual)
+        return "[]"
+
+    try:
+        if not _state_store.aux_update(_ADV_DIGEST_KEY, _tomar, _ADV_DIGEST_TTL) or not tomadas:
+            return
+        for a in tomadas:
+            # Cuerpo por alerta: un reenvio por template debe poder volver a
+            # partir el resumen (ver _notify_advisor_via_template).
+            _state_store.aux_set(f"adv_alerta:{a['id']}", a["msg"], _ADV_DIGEST_TTL)
+        cerrada = _advisor_window_state() == "closed" and bool(ADV_TPL)
+        limite = _TPL_PARAM_LIMIT if cerrada else _ADV_DIGEST_TEXTO_MAX
+        por_id = {a["id"]: a for a in tomadas}
+        fallidas = []
+        for texto, ids in _advisor_digest_componer(tomadas, limite):
+            if _notify_advisor_enviar(texto, alertas=ids):
+                with _adv_digest_lock:
+                    _adv_digest_contadores["resumenes"] += 1
+                    _adv_digest_contadores["alertas_resumidas"] += len(ids)
+            else:
+                fallidas.extend(por_id[i] for i in ids)
+        if fallidas:
+            _advisor_digest_reencolar(fallidas)
+    except Exception:
+        log.exception("💥 _advisor_digest_vaciar")
+
+
+def _advisor_digest_reencolar(fallidas: list) -> None:
+    """Un resumen que no salio vuelve al frente de la cola con backoff; tras
+    _ADV_DIGEST_BACKOFF_S la alerta queda registrada como error en Sheets."""
+    vivas = []
+    for a in fallidas:
+        a["intentos"] = int(a.get("intentos") or 0) + 1
+        if a["intentos"] > len(_ADV_DIGEST_BACKOFF_S):
+            log.error("asesor_resumen_agotado: id=%s", a["id"])
+            _log(ADVISOR_NUM, "Asesor", a["msg"], "saliente", "asesor", "error",
+                 "resumen_agotado", a["id"])
+            with _adv_digest_lock:
+                _adv_digest_contadores["perdidas"] += 1
+        else:
+            vivas.append(a)
+    if not vivas:
+        return
+
+    def _fn(actual):
+        return json.dumps(vivas + _advisor_digest_lista(actual), ensure_ascii=False)
+
+    _state_store.aux_update(_ADV_DIGEST_KEY, _fn, _ADV_DIGEST_TTL)
+    with _adv_digest_lock:
+        _adv_digest_contadores["reintentos"] += 1
+    _advisor_digest_programar(_ADV_DIGEST_BACKOFF_S[max(a["intentos"] for a in vivas) - 1])
+
+
+def _advisor_digest_reanudar() -> None:
+    """Arranque: alertas que quedaron en el resumen de un proceso anterior."""
+    if _advisor_digest_lista(_state_store.aux_get(_ADV_DIGEST_KEY)):
+        _advisor_digest_programar(ADVISOR_DIGEST_WINDOW_S)
+
+
+def _advisor_digest_stats() -> dict:
+    with _adv_digest_lock:
+        out = dict(_adv_digest_contadores)
+    out["habilitado"] = ADVISOR_DIGEST_ENABLED
+    out["ventana_s"] = ADVISOR_DIGEST_WINDOW_S
+    out["pendientes"] = len(_advisor_digest_lista(_state_store.aux_get(_ADV_DIGEST_KEY)))
+    return out
+
+
+# ── Programador compartido de trabajos diferidos ─────────────────────────────
+# Reintentos con backoff y reanudaciones tras reinicio (outbox de Boardroom,
+# /ext/lead asincrono, handoffs del Flow IMSS) eran un threading.Timer por
+# evento: sin tope de hilos y, al arrancar, todo el indice disparando a la vez.
+# Ahora cada trabajo es un miembro "<tipo>|<id>" de UN conjunto ordenado
+# (trabajos_programados) cuyo score es "cuando toca"; un solo hilo revisa cada
+# PROGRAMADOR_TICK_S y atiende a lo mas PROGRAMADOR_BATCH vencidos por tick
+# con el handler registrado para su tipo. Mismo esquema que adv_reintentos,
+# cuyo procesamiento corre en este mismo hilo (_programador_cada). Vive en
+# StateStore: un trabajo agendado sobrevive reinicios.
+_PROGRAMADOR_ZSET = "trabajos_programados"
+_PROGRAMADOR_TTL = 7 * 24 * 3600
+_programador_handlers: dict = {}
+_programador_periodicos: list = []
+_programador_contadores = {"agendados": 0, "ejecutados": 0, "fallidos": 0, "sin_handler": 0}
+_programador_lock = threading.Lock()
+_programador_hilo = None
+
+
+def _programador_contar(campo: str) -> None:
+    with _programador_lock:
+        _programador_contadores[campo] += 1
+
+
+def _programador_registrar(tipo: str, fn) -> None:
+    _programador_handlers[tipo] = fn
+
+
+def _programador_agendar(tipo: str, ident: str, espera_s: float) -> bool:
+    """Agenda (o reagenda) el trabajo `tipo`/`ident` para dentro de
+    `espera_s` segundos."""
+    ok = _state_store.aux_zadd(_PROGRAMADOR_ZSET, f"{tipo}|{ident}",
+                               time.time() + max(0.0, espera_s), _PROGRAMADOR_TTL)
+    if ok:
+        _programador_contar("agendados")
+    else:
+        log.error("programador_no_persistido tipo=%s id=%s", tipo, ident)
+    _programador_arrancar()
+    return ok
+
+
+def _programador_cada(fn, intervalo_s: float) -> None:
+    """Corre `fn` en el hilo del programador cada `intervalo_s`."""
+    with _programador_lock:
+        if all(p["fn"] is not fn for p in _programador_periodicos):
+            _programador_periodicos.append(
+                {"fn": fn, "intervalo": intervalo_s, "proxima": time.time() + intervalo_s})
+
+
+def _programador_procesar() -> int:
+    """Un tick: atiende hasta PROGRAMADOR_BATCH trabajos vencidos (los mas
+    antiguos primero) y los periodicos a los que ya les toca."""
+    atendidos = 0
+    for miembro, _ in _state_store.aux_zvencidos(_PROGRAMADOR_ZSET, time.time(), PROGRAMADOR_BATCH):
+        if not _state_store.aux_zrem(_PROGRAMADOR_ZSET, miembro):
+            continue  # otro worker lo tomo
+        atendidos += 1
+        tipo, _, ident = miembro.partition("|")
+        fn = _programador_handlers.get(tipo)
+        if fn is None:
+            log.error("programador_sin_handler tipo=%s id=%s", tipo, ident)
+            _programador_contar("sin_handler")
+            continue
+        try:
+            fn(ident)
+            _programador_contar("ejecutados")
+        except Exception:
+            log.exception("💥 programador tipo=%s id=%s", tipo, ident)
+            _programador_contar("fallidos")
+    ahora = time.time()
+    with _programador_lock:
+        toca = [p for p in _programador_periodicos if p["proxima"] <= ahora]
+        for p in toca:
+            p["proxima"] = ahora + p["intervalo"]
+    for p in toca:
+        try:
+            p["fn"]()
+        except Exception:
+            log.exception("💥 programador periodico %s", getattr(p["fn"], "__name__", "?"))
+    return atendidos
+
+
+def _programador_ciclo() -> None:
+    while True:
+        time.sleep(PROGRAMADOR_TICK_S)
+        try:
+            _programador_procesar()
+        except Exception:
+            log.exception("💥 _programador_procesar")
+
+
+def _programador_arrancar() -> None:
+    global _programador_hilo
+    with _programador_lock:
+        if _programador_hilo is not None:
+            return
+        _programador_hilo = threading.Thread(target=_programador_ciclo, daemon=True)
+    _programador_hilo.start()
+
+
+def _programador_stats() -> dict:
+    with _programador_lock:
+        out = dict(_programador_contadores)
+    out["programados"] = _state_store.aux_zcard(_PROGRAMADOR_ZSET)
+    out["por_tick"] = PROGRAMADOR_BATCH
+    out["tick_s"] = PROGRAMADOR_TICK_S
+    return out
+
+
+# ── Reintentos programados de alertas al asesor (ADVISOR_RETRY_ENABLED) ──────
+# El reenvio reactivo por `statuses[].failed` depende de que Meta mande el
+# estado y de que adv_retry:<wamid> siga vivo (2h). Con el programador, cada
+# alerta aceptada por Meta (con wamid) queda en adv_reintentos, un conjunto
+# ordenado cuyo score es "cuando toca revisarla", con su cuerpo en
+# adv_reintento:<id> (7 dias). `delivered`/`read` la retiran; `failed` la
+# vuelve reintentable. Cada ADVISOR_RETRY_TICK_S, en el hilo del programador
+# compartido, se revisan las vencidas,
+# las atiende por prioridad (urgentes primero) en lotes de
+# ADVISOR_RETRY_BATCH y reenvia con backoff; agotado el backoff, la alerta
+# queda como error en Sheets. Todo vive en StateStore: sobrevive reinicios y
+# no necesita trafico entrante para avanzar.
+# Una alerta sin `failed` solo se reenvia por falta de confirmacion si este
+# numero ya ha recibido statuses del asesor (adv_status_visto); sin esa
+# evidencia, un webhook sin suscripcion a statuses duplicaria cada alerta.
+_ADV_REINTENTO_ZSET = "adv_reintentos"
+_ADV_REINTENTO_TTL = 7 * 24 * 3600
+_ADV_REINTENTO_BACKOFF_S = (300, 1800, 7200)
+_ADV_REINTENTO_LEER_MAX = 200
+_ADV_STATUS_VISTO_KEY = "adv_status_visto"
+_adv_reintento_contadores = {"seguidas": 0, "confirmadas": 0, "reenviadas": 0,
+                             "reenvios_fallidos": 0, "agotadas": 0, "sin_statuses": 0}
+_adv_reintento_lock = threading.Lock()
+
+
+def _advisor_reintento_contar(campo: str) -> None:
+    with _adv_reintento_lock:
+        _adv_reintento_contadores[campo] += 1
+
+
+def _advisor_reintento_cargar(rid: str):
+    raw = _state_store.aux_get(f"adv_reintento:{rid}")
+    try:
+        registro = json.loads(raw) if raw else None
+    except (TypeError, ValueError):
+        return None
+    return registro if isinstance(registro, dict) else None
+
+
+def _advisor_reintento_guardar(registro: dict) -> None:
+    _state_store.aux_set(f"adv_reintento:{registro['id']}",
+                         json.dumps(registro, ensure_ascii=False), _ADV_REINTENTO_TTL)
+
+
+def _advisor_reintento_seguir(wamid: str, msg: str, alertas=None) -> str:
+    """Meta acepto el envio: la alerta queda pendiente de confirmacion. Un
+    reenvio (_tl.adv_envio["reintento"]) actualiza la misma entrada."""
+    ctx = getattr(_tl, "adv_envio", None) or {}
+    rid = ctx.get("reintento") or uuid.uuid4().hex[:12]
+    registro = _advisor_reintento_cargar(rid) or {
+        "id": rid, "msg": str(msg or ""), "alertas": list(alertas or []),
+        "prioridad": int(ctx.get("prioridad") or 1), "intentos": 0, "creado": time.time(),
+    }
+    registro.update({"wamid": wamid, "fase": "confirmacion"})
+    _advisor_reintento_guardar(registro)
+    _state_store.aux_zadd(_ADV_REINTENTO_ZSET, rid, time.time() + ADVISOR_RETRY_CONFIRM_S,
+                          _ADV_REINTENTO_TTL)
+    if ctx:
+        ctx["seguida"] = True
+    if not ctx.get("reintento"):
+        _advisor_reintento_contar("seguidas")
+    return rid
+
+
+def _advisor_reintento_parte(padre: str, msg: str, alertas: list) -> str:
+    """Registro propio de una parte de un resumen re-partido, con llave
+    derivada de sus ids de alerta (estable si la misma parte se vuelve a
+    mandar). Hereda prioridad e intentos del resumen completo."""
+    base = _advisor_reintento_cargar(padre) or {}
+    rid = hashlib.sha1(",".join(sorted(alertas)).encode()).hexdigest()[:12]
+    registro = _advisor_reintento_cargar(rid) or {
+        "id": rid, "msg": str(msg or ""), "alertas": list(alertas),
+        "prioridad": int(base.get("prioridad") or 1),
+        "intentos": int(base.get("intentos") or 0),
+        "creado": base.get("creado") or time.time(),
+    }
+    _advisor_reintento_guardar(registro)
+    return rid
+
+
+def _advisor_reintento_repartir(rid: str) -> None:
+    """El resumen completo ya viaja en partes con registro propio: se retira
+    para que ni `failed` ni el programador lo vuelvan a mandar entero."""
+    _state_store.aux_zrem(_ADV_REINTENTO_ZSET, rid)
+    registro = _advisor_reintento_cargar(rid)
+    if registro:
+        registro["fase"] = "repartida"
+        _advisor_reintento_guardar(registro)
+
+
+def _advisor_reintento_tras_envio(rid: str, ok: bool, ctx: dict) -> None:
+    """Despues de reenviar `rid`: si fallo, backoff; si Meta lo acepto sin
+    wamid, _advisor_reintento_seguir nunca corrio y la alerta se quedaria
+    fuera del programador, asi que vuelve a esperar confirmacion."""
+    registro = _advisor_reintento_cargar(rid)
+    if not registro or registro.get("fase") == "repartida":
+        return
+    if not ok:
+        registro["fase"] = "fallida"
+        _advisor_reintento_guardar(registro)
+        intentos = max(int(registro.get("intentos") or 0) - 1, 0)
+        _state_store.aux_zadd(_ADV_REINTENTO_ZSET, rid,
+                              time.time() + _ADV_REINTENTO_BACKOFF_S[
+                                  min(intentos, len(_ADV_REINTENTO_BACKOFF_S) - 1)],
+                              _ADV_REINTENTO_TTL)
+    elif not ctx.get("seguida"):
+        _state_store.aux_zadd(_ADV_REINTENTO_ZSET, rid, time.time() + ADVISOR_RETRY_CONFIRM_S,
+                              _ADV_REINTENTO_TTL)
+
+
+def _advisor_reintento_confirmar(rid: str) -> None:
+    if _state_store.aux_zrem(_ADV_REINTENTO_ZSET, rid):
+        _advisor_reintento_contar("confirmadas")
+
+
+def _advisor_reintento_fallida(rid: str, inmediato: bool) -> None:
+    """Meta reporto `failed`. `inmediato`: nadie reenvio todavia (sin
+    template o sin cuerpo); si no, el template tambien fallo y toca backoff."""
+    registro = _advisor_reintento_cargar(rid)
+    if not registro or registro.get("fase") == "repartida":
+        return
+    registro["fase"] = "fallida"
+    _advisor_reintento_guardar(registro)
+    intentos = int(registro.get("intentos") or 0)
+    espera = 0 if inmediato else _ADV_REINTENTO_BACKOFF_S[min(intentos, len(_ADV_REINTENTO_BACKOFF_S) - 1)]
+    _state_store.aux_zadd(_ADV_REINTENTO_ZSET, rid, time.time() + espera, _ADV_REINTENTO_TTL)
+
+
+def _advisor_reintento_cuerpo(rid: str) -> str:
+    registro = _advisor_reintento_cargar(rid) if rid else None
+    return (registro or {}).get("msg") or ""
+
+
+def _advisor_reintentos_procesar() -> int:
+    """Un tick: atiende hasta ADVISOR_RETRY_BATCH alertas vencidas, primero
+    las de mayor prioridad y, entre iguales, las mas antiguas."""
+    vencidas = _state_store.aux_zvencidos(_ADV_REINTENTO_ZSET, time.time(), _ADV_REINTENTO_LEER_MAX)
+    cola = []
+    for rid, score in vencidas:
+        registro = _advisor_reintento_cargar(rid)
+        if registro is None or registro.get("fase") == "repartida":
+            _state_store.aux_zrem(_ADV_REINTENTO_ZSET, rid)
+            continue
+        cola.append((-int(registro.get("prioridad") or 1), score, registro))
+    cola.sort(key=lambda t: (t[0], t[1]))
+    atendidas = 0
+    for _, _, registro in cola[:ADVISOR_RETRY_BATCH]:
+        rid = registro["id"]
+        if not _state_store.aux_zrem(_ADV_REINTENTO_ZSET, rid):
+            continue  # otro worker la tomo
+        atendidas += 1
+        if registro.get("fase") == "confirmacion" and \
+                _state_store.aux_get(_ADV_STATUS_VISTO_KEY) is None:
+            _advisor_reintento_contar("sin_statuses")
+            continue
+        intentos = int(registro.get("intentos") or 0)
+        if intentos >= len(_ADV_REINTENTO_BACKOFF_S):
+            log.error("asesor_reintento_agotado: id=%s wamid=%s", rid, str(registro.get("wamid"))[:24])
+            _log(ADVISOR_NUM, "Asesor", registro["msg"], "saliente", "asesor", "error",
+                 "reintento_agotado", str(registro.get("wamid") or rid))
+            _advisor_reintento_contar("agotadas")
+            continue
+        registro["intentos"] = intentos + 1
+        _advisor_reintento_guardar(registro)
+        ctx = {"reintento": rid, "prioridad": registro.get("prioridad")}
+        _tl.adv_envio = ctx
+        try:
+            ok = _notify_advisor_enviar(registro["msg"], alertas=registro.get("alertas") or None)
+        finally:
+            _tl.adv_envio = None
+        log.info("asesor_reintento: id=%s intento=%s ok=%s", rid, intentos + 1, ok)
+        _advisor_reintento_contar("reenviadas" if ok else "reenvios_fallidos")
+        _advisor_reintento_tras_envio(rid, ok, ctx)
+    return atendidas
+
+
+def _advisor_reintentos_arrancar() -> None:
+    if not ADVISOR_RETRY_ENABLED:
+        return
+    _programador_cada(_advisor_reintentos_procesar, ADVISOR_RETRY_TICK_S)
+    _programador_arrancar()
+
+
+def _advisor_reintentos_stats() -> dict:
+    with _adv_reintento_lock:
+        out = dict(_adv_reintento_contadores)
+    out["habilitado"] = ADVISOR_RETRY_ENABLED
+    out["programadas"] = _state_store.aux_zcard(_ADV_REINTENTO_ZSET)
+    return out
+
+
+def _env_int(name: str, default: int, minimo: int = 1) -> int:
+    """Entero de entorno con piso; un valor no numerico cae al default con
+    warning, igual que los flags booleanos."""
+    raw = os.getenv(name, "").strip()
+    if not raw:
+        return default
+    try:
+        return max(minimo, int(raw))
+    except ValueError:
+        log.warning("⚠️ %s valor no reconocido; usando %s", name, default)
+        return default
+
+
 BOARDROOM_URL = os.getenv(
     "BOARDROOM_URL",
     "https://boardroom-engine.onrender.com"
@@ -916,6 +1637,88 @@ _BUS_ACTIVE = os.getenv("BUS_ENABLED", "true").strip().lower() \
               in {"1", "true", "yes", "on"}
 BOARDROOM_IS_AUTHORITY = True
 NEUTRAL_FALLBACK_MESSAGE = "Recibí tu mensaje. En un momento te atiendo."
+# Emisor de fondo hacia el bus / Boardroom: hilos maximos y tope de la cola.
+# Con la cola llena el evento se DESCARTA y se cuenta (ver _EmisorBoardroom).
+BOARDROOM_EMITTER_WORKERS = _env_int("BOARDROOM_EMITTER_WORKERS", 4)
+BOARDROOM_EMITTER_QUEUE = _env_int("BOARDROOM_EMITTER_QUEUE", 500)
+# Observaciones en lote: junta las OBSERVATION_EVENT de una ventana corta y las
+# manda en un solo POST. Default false: una solicitud por mensaje, como siempre.
+BOARDROOM_OBSERVATION_BATCH_ENABLED, _boardroom_obs_batch_flag_invalid = wai.parse_bool_flag(
+    os.getenv("BOARDROOM_OBSERVATION_BATCH_ENABLED")
+)
+if _boardroom_obs_batch_flag_invalid:
+    log.warning("⚠️ BOARDROOM_OBSERVATION_BATCH_ENABLED valor no reconocido; usando false")
+BOARDROOM_OBSERVATION_BATCH_MS = _env_int("BOARDROOM_OBSERVATION_BATCH_MS", 250)
+BOARDROOM_OBSERVATION_BATCH_BYTES = _env_int("BOARDROOM_OBSERVATION_BATCH_BYTES", 256_000)
+# Circuito de la llamada sincrona de autoridad: abre tras N fallas seguidas
+# (timeout / 5xx / error de red) y deja pasar una sonda al cumplirse la pausa.
+BOARDROOM_BREAKER_THRESHOLD = _env_int("BOARDROOM_BREAKER_THRESHOLD", 3)
+BOARDROOM_BREAKER_COOLDOWN_S = _env_int("BOARDROOM_BREAKER_COOLDOWN_S", 30)
+# Ruteo especulativo: la respuesta local candidata se prepara mientras la
+# instruccion de Boardroom esta en vuelo. Default false: la llamada de autoridad
+# sigue siendo estrictamente secuencial, con el fallback neutral de siempre.
+BOARDROOM_SPECULATIVE_ENABLED, _boardroom_speculative_flag_invalid = wai.parse_bool_flag(
+    os.getenv("BOARDROOM_SPECULATIVE_ENABLED")
+)
+if _boardroom_speculative_flag_invalid:
+    log.warning("⚠️ BOARDROOM_SPECULATIVE_ENABLED valor no reconocido; usando false")
+BOARDROOM_SPECULATIVE_DEADLINE_MS = _env_int("BOARDROOM_SPECULATIVE_DEADLINE_MS", 2000)
+# Instrucciones entrantes de Boardroom (/ext/boardroom/instruct[/batch]): un
+# carril FIFO por hash de telefono, cada uno con su cola acotada.
+BOARDROOM_INSTRUCT_LANES = _env_int("BOARDROOM_INSTRUCT_LANES", 8)
+BOARDROOM_INSTRUCT_QUEUE = _env_int("BOARDROOM_INSTRUCT_QUEUE", 500)
+BOARDROOM_INSTRUCT_BATCH_MAX = _env_int("BOARDROOM_INSTRUCT_BATCH_MAX", 1000)
+# Ingesta de imagenes/documentos entrantes: descarga por streaming desde la
+# Graph API, hash de contenido y referencia estable para Boardroom. Default
+# false: solo se reenvia el media_id, como siempre.
+MEDIA_PIPELINE_ENABLED, _media_pipeline_flag_invalid = wai.parse_bool_flag(
+    os.getenv("MEDIA_PIPELINE_ENABLED")
+)
+if _media_pipeline_flag_invalid:
+    log.warning("⚠️ MEDIA_PIPELINE_ENABLED valor no reconocido; usando false")
+MEDIA_STORAGE_DIR = os.getenv("MEDIA_STORAGE_DIR", "").strip() or os.path.join(
+    tempfile.gettempdir(), "vicky_media")
+MEDIA_MAX_BYTES = _env_int("MEDIA_MAX_BYTES", 20 * 1024 * 1024)
+MEDIA_PIPELINE_WORKERS = _env_int("MEDIA_PIPELINE_WORKERS", 2)
+MEDIA_PIPELINE_QUEUE = _env_int("MEDIA_PIPELINE_QUEUE", 100)
+# /ext/lead asincrono: valida, persiste y responde 202; el aviso al asesor y
+# el alta en Boardroom corren en un trabajo con reintentos. Default false:
+# /ext/lead sigue notificando en linea y respondiendo 502 si Meta falla.
+EXT_LEAD_ASYNC_ENABLED, _ext_lead_async_flag_invalid = wai.parse_bool_flag(
+    os.getenv("EXT_LEAD_ASYNC_ENABLED")
+)
+if _ext_lead_async_flag_invalid:
+    log.warning("⚠️ EXT_LEAD_ASYNC_ENABLED valor no reconocido; usando false")
+# Ventana de supresion del indice de leads por telefono: dentro de ella, un
+# segundo aviso "lead nuevo" (asesor o Boardroom) del mismo telefono y
+# producto no se dispara. 0 desactiva el indice.
+LEAD_DEDUPE_WINDOW_S = _env_int("LEAD_DEDUPE_WINDOW_S", 6 * 3600, minimo=0)
+# Resumen de alertas al asesor: las no urgentes se juntan durante
+# ADVISOR_DIGEST_WINDOW_S (o hasta ADVISOR_DIGEST_MAX) y salen en un solo
+# mensaje. Apagado por defecto: cada alerta sale sola, como siempre.
+ADVISOR_DIGEST_ENABLED, _advisor_digest_flag_invalid = wai.parse_bool_flag(
+    os.getenv("ADVISOR_DIGEST_ENABLED")
+)
+if _advisor_digest_flag_invalid:
+    log.warning("⚠️ ADVISOR_DIGEST_ENABLED valor no reconocido; usando false")
+ADVISOR_DIGEST_WINDOW_S = _env_int("ADVISOR_DIGEST_WINDOW_S", 300)
+ADVISOR_DIGEST_MAX = _env_int("ADVISOR_DIGEST_MAX", 10)
+# Reintentos programados de alertas al asesor (adv_reintentos): cada alerta
+# aceptada espera confirmacion ADVISOR_RETRY_CONFIRM_S; un hilo revisa cada
+# ADVISOR_RETRY_TICK_S hasta ADVISOR_RETRY_BATCH vencidas.
+ADVISOR_RETRY_ENABLED, _advisor_retry_flag_invalid = wai.parse_bool_flag(
+    os.getenv("ADVISOR_RETRY_ENABLED")
+)
+if _advisor_retry_flag_invalid:
+    log.warning("⚠️ ADVISOR_RETRY_ENABLED valor no reconocido; usando false")
+ADVISOR_RETRY_CONFIRM_S = _env_int("ADVISOR_RETRY_CONFIRM_S", 1800)
+ADVISOR_RETRY_TICK_S = _env_int("ADVISOR_RETRY_TICK_S", 60)
+ADVISOR_RETRY_BATCH = _env_int("ADVISOR_RETRY_BATCH", 20)
+# Programador compartido de reintentos/reanudaciones (trabajos_programados):
+# un solo hilo revisa cada PROGRAMADOR_TICK_S y atiende a lo mas
+# PROGRAMADOR_BATCH trabajos vencidos por tick.
+PROGRAMADOR_TICK_S = _env_int("PROGRAMADOR_TICK_S", 1)
+PROGRAMADOR_BATCH = _env_int("PROGRAMADOR_BATCH", 20)
 
 # WA-1: feature flag del menu principal como Interactive List Message.
 # Default false (LEGACY_TEXT_MENU) -- show_menu() no cambia de comportamiento
@@ -947,6 +1750,14 @@ WHATSAPP_IMSS_DYNAMIC_FLOW_ENABLED, _wa_imss_dynamic_flow_flag_invalid = wai.par
 )
 if _wa_imss_dynamic_flow_flag_invalid:
     log.warning("⚠️ WHATSAPP_IMSS_DYNAMIC_FLOW_ENABLED valor no reconocido; usando false")
+# Tabla de amortizacion mes a mes como mensaje aparte, despues de la alerta
+# IMSS al asesor. Default false: la alerta sigue siendo la de siempre hasta
+# que se active.
+IMSS_ADVISOR_SCHEDULE_ENABLED, _imss_advisor_schedule_flag_invalid = wai.parse_bool_flag(
+    os.getenv("IMSS_ADVISOR_SCHEDULE_ENABLED")
+)
+if _imss_advisor_schedule_flag_invalid:
+    log.warning("⚠️ IMSS_ADVISOR_SCHEDULE_ENABLED valor no reconocido; usando false")
 # Flow ID real de Meta -- vacio hasta que se cree y publique el Flow. Con el
 # flag en true pero esto vacio, send_imss_dynamic_flow() falla de forma
 # segura y route() cae al funnel IMSS legacy.
@@ -956,9 +1767,19 @@ WHATSAPP_IMSS_FLOW_ID = os.getenv("WHATSAPP_IMSS_FLOW_ID", "").strip()
 # Sin ella, el endpoint /ext/flow/imss no puede procesar nada y responde 421
 # a cualquier solicitud real de Meta (ver _flow_imss_endpoint).
 IMSS_FLOW_PRIVATE_KEY = os.getenv("IMSS_FLOW_PRIVATE_KEY", "").strip()
+# Rotacion de llave: la llave ANTERIOR se sigue aceptando mientras Meta
+# termina de usar la nueva llave publica. Se prueba despues de la vigente y se
+# retira (variable vacia) cuando /ext/metrics muestra que dejo de usarse.
+IMSS_FLOW_PRIVATE_KEY_PREVIOUS = os.getenv("IMSS_FLOW_PRIVATE_KEY_PREVIOUS", "").strip()
 # TTL de correlacion flow_token -> telefono / dedupe de pasos ya procesados.
 # 1h alcanza de sobra para completar un formulario de 4 pantallas.
 _IMSS_FLOW_TOKEN_TTL = 60 * 60
+# Presupuesto de tiempo por solicitud del Flow (ms). Meta corta la solicitud
+# si no recibe respuesta a tiempo y el cliente ve un error generico. Pasada la
+# mitad del presupuesto, los efectos no esenciales (alerta al asesor, reporte
+# en Sheets) se mandan a segundo plano para que la respuesta cifrada salga ya.
+IMSS_FLOW_DEADLINE_MS = _env_int("IMSS_FLOW_DEADLINE_MS", 3000)
+_IMSS_FLOW_DIFERIR_FRACCION = 0.5
 
 _BOARDROOM_ALLOWED_INSTRUCTIONS = {
     "send_message",
@@ -971,6 +1792,142 @@ _BOARDROOM_ALLOWED_INSTRUCTIONS = {
 }
 
 
+# Buckets compartidos por los histogramas de latencia (Flow IMSS, Boardroom).
+_LATENCIA_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class _LatenciaHistograma:
+    """Histograma acumulativo de latencias en ms (buckets fijos + count/sum/max)."""
+
+    def __init__(self, buckets=_LATENCIA_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, ms: float) -> None:
+        i = 0
+        while i < len(self.buckets) and ms > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.sum_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def snapshot(self) -> dict:
+        acumulado, buckets = 0, {}
+        for limite, n in zip(self.buckets, self.counts):
+            acumulado += n
+            buckets[f"le_{limite}"] = acumulado
+        buckets["le_inf"] = self.count
+        return {"count": self.count, "sum_ms": round(self.sum_ms, 2),
+                "max_ms": round(self.max_ms, 2), "buckets": buckets}
+
+
+# ── Emisor de fondo hacia el bus / Boardroom ─────────────────────────────────
+# Antes cada evento del bus, cada Observacion y cada aviso de documento abria
+# su propio hilo y su propia conexion TLS: una rafaga de mensajes eran cientos
+# de hilos efimeros con un handshake cada uno. Ahora:
+#   - un solo requests.Session con keep-alive para el bus y Boardroom
+#     (_boardroom_http_post), compartido por todos los envios;
+#   - a lo mas BOARDROOM_EMITTER_WORKERS hilos vaciando una cola acotada a
+#     BOARDROOM_EMITTER_QUEUE. Un hilo vive mientras haya trabajo y termina
+#     cuando la cola se vacia;
+#   - cola llena => el evento se descarta y se cuenta, nunca se crea un hilo
+#     de mas ni se bloquea el webhook.
+# Cada trabajo se ejecuta UNA vez y nunca se reintenta, asi que la garantia de
+# las Observaciones sigue siendo "maximo un intento por mensaje" (un evento
+# descartado es cero intentos, no dos).
+_boardroom_http_local = {"session": None}
+_boardroom_http_lock = threading.Lock()
+
+
+def _boardroom_http():
+    with _boardroom_http_lock:
+        if _boardroom_http_local["session"] is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=4, pool_maxsize=max(BOARDROOM_EMITTER_WORKERS, 4) * 2)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _boardroom_http_local["session"] = session
+        return _boardroom_http_local["session"]
+
+
+def _boardroom_http_post(url: str, **kwargs):
+    return _boardroom_http().post(url, **kwargs)
+
+
+class _EmisorBoardroom:
+    """Pool elastico y acotado de hilos daemon sobre una cola con tope."""
+
+    def __init__(self, workers: int, capacidad: int):
+        self.workers = workers
+        self.capacidad = capacidad
+        self._cola = queue.Queue(maxsize=capacidad)
+        self._lock = threading.Lock()
+        self._activos = 0
+        self._stats = {"encolados": 0, "descartados": 0, "ejecutados": 0, "fallidos": 0}
+        self._por_tipo: dict = {}
+
+    def _contar(self, tipo: str, campo: str) -> None:
+        self._stats[campo] += 1
+        por_tipo = self._por_tipo.setdefault(tipo, {"encolados": 0, "descartados": 0})
+        if campo in por_tipo:
+            por_tipo[campo] += 1
+
+    def enviar(self, tipo: str, fn, *args, reserva: int = 0) -> bool:
+        """`reserva`: lugares de la cola que este envio no puede ocupar (los
+        trabajos diferibles dejan espacio al trafico en vivo). Rechazado por
+        reserva no cuenta como descartado: quien llama lo reagenda."""
+        lanzar = False
+        with self._lock:
+            if reserva and self._cola.qsize() >= self._cola.maxsize - reserva:
+                return False
+            try:
+                self._cola.put_nowait((tipo, fn, args))
+            except queue.Full:
+                self._contar(tipo, "descartados")
+                log.warning("boardroom_emisor_descartado tipo=%s (cola llena)", tipo)
+                return False
+            self._contar(tipo, "encolados")
+            if self._activos < self.workers:
+                self._activos += 1
+                lanzar = True
+        if lanzar:
+            threading.Thread(target=self._trabajar, daemon=True).start()
+        return True
+
+    def _trabajar(self) -> None:
+        while True:
+            # Vaciar-y-salir bajo el mismo lock que enviar(): un evento nunca
+            # queda en la cola con cero hilos activos.
+            with self._lock:
+                try:
+                    tipo, fn, args = self._cola.get_nowait()
+                except queue.Empty:
+                    self._activos -= 1
+                    return
+            try:
+                fn(*args)
+                campo = "ejecutados"
+            except Exception:
+                log.exception("boardroom_emisor_error tipo=%s", tipo)
+                campo = "fallidos"
+            with self._lock:
+                self._stats[campo] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"workers": self.workers, "activos": self._activos,
+                    "en_cola": self._cola.qsize(), "capacidad": self._cola.maxsize,
+                    **self._stats, "por_tipo": {k: dict(v) for k, v in self._por_tipo.items()}}
+
+
+_boardroom_emisor = _EmisorBoardroom(BOARDROOM_EMITTER_WORKERS, BOARDROOM_EMITTER_QUEUE)
+
+
 def _emit_bus_event(
     phone: str,
     text: str,
@@ -1001,7 +1958,7 @@ def _emit_bus_event(
 
     def _post() -> None:
         try:
-            requests.post(
+            _boardroom_http_post(
                 BUS_URL,
                 json=payload,
                 headers={
@@ -1018,7 +1975,7 @@ def _emit_bus_event(
                 str(exc),
             )
 
-    threading.Thread(target=_post, daemon=True).start()
+    _boardroom_emisor.enviar("bus_event", _post)
 
 
 def _bus_event_url() -> str:
@@ -1139,7 +2096,7 @@ def _request_boardroom_instruction(payload: dict) -> tuple[dict | None, str | No
     if not BUS_INTERNAL_TOKEN:
         return None, "missing_bus_token"
     try:
-        resp = requests.post(
+        resp = _boardroom_http_post(
             _bus_event_url(),
             json=payload,
             headers={
@@ -1206,7 +2163,7 @@ def _confirm_boardroom_execution(body: dict, executed: bool, delivery_status: st
     if not instruction_id or not _BUS_ACTIVE or not BUS_URL or not BUS_INTERNAL_TOKEN:
         return
     try:
-        requests.post(
+        _boardroom_http_post(
             _bus_confirm_url(),
             json={
                 "instruction_id": instruction_id,
@@ -1247,46 +2204,166 @@ def _emit_boardroom_observation(payload: dict) -> None:
     boardroom/rodys/. Si algun dia se agrega dedupe del lado servidor, la
     llave correcta es "message_id" (estable por mensaje de WhatsApp), nunca
     "event_id" (uuid4 nuevo en cada _build_boardroom_event).
+
+    Con BOARDROOM_OBSERVATION_BATCH_ENABLED la Observacion viaja dentro de un
+    lote (_LoteObservaciones) y la garantia es la misma: un intento por
+    evento, ahora compartido con los demas eventos del lote.
     """
     if not _BUS_ACTIVE or not BUS_URL or not BUS_INTERNAL_TOKEN:
         return
+    if BOARDROOM_OBSERVATION_BATCH_ENABLED:
+        _lote_observaciones.agregar(payload)
+        return
+    _boardroom_emisor.enviar("observation", _post_observacion, payload)
 
-    def _post() -> None:
+
+def _post_observacion(payload: dict) -> None:
+    """Un POST de una Observacion suelta (ver _emit_boardroom_observation)."""
+    _lote_observaciones.contar_solicitud("individual")
+    try:
+        resp = _boardroom_http_post(
+            _bus_event_url(),
+            json=payload,
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {BUS_INTERNAL_TOKEN}",
+                "X-Source-System": "vicky",
+                "X-Event-Type": "inbound_message",
+            },
+            timeout=3,
+        )
+        # Un no-2xx no es lo mismo que un timeout. El timeout es transitorio
+        # y cuesta un mensaje; un 400/401/403 es una falla sistemica muda:
+        # Boardroom rechaza TODAS las Observaciones, Rodys se queda ciego y
+        # Vicky sigue operando normal sin que nada lo delate. Ya paso en
+        # produccion un 401 de BUS_INTERNAL_TOKEN en este mismo bus
+        # (incidente SECOM 2026-08-09). Va en nivel error justamente para
+        # poder filtrarlo en Render y enterarse el mismo dia. El hermano
+        # sincrono (_request_boardroom_instruction) ya hacia esta
+        # comprobacion; esta rama se habia quedado sin ella.
+        # No se reintenta a proposito: reintentar rompe la semantica de
+        # maximo un intento por mensaje y puede duplicar Observaciones.
+        if not 200 <= resp.status_code < 300:
+            log.error(
+                "Boardroom observation rechazada http=%s phone_last4=%s",
+                resp.status_code, str(payload.get("phone") or "")[-4:],
+            )
+    except Exception as exc:
+        log.warning(
+            "Boardroom observation emit fallido phone_last4=%s error=%s: %s",
+            str(payload.get("phone") or "")[-4:], type(exc).__name__, str(exc),
+        )
+
+
+class _LoteObservaciones:
+    """Junta Observaciones durante BOARDROOM_OBSERVATION_BATCH_MS y las manda
+    en un solo POST {"event_type": "OBSERVATION_BATCH", "events": [...]} al
+    mismo /bus/event. Cada evento conserva su message_id, la llave de dedupe
+    del lado servidor. Un lote se cierra antes de tiempo si el siguiente
+    evento lo pasaria de BOARDROOM_OBSERVATION_BATCH_BYTES.
+
+    Si el bus rechaza el lote como tal (400/404/405/413/415/422: no entiende
+    el formato), el proceso vuelve a envios sueltos y cada evento del lote se
+    manda UNA vez por separado -- el lote rechazado no llego a procesarse, asi
+    que no es un reintento. Un timeout, un 5xx o un 401 del lote no se
+    reintentan: se registran igual que una Observacion suelta perdida.
+    """
+
+    RECHAZO_DE_FORMATO = (400, 404, 405, 413, 415, 422)
+    _CUBETAS = (1, 2, 5, 10, 25, 50, 100)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._eventos: list = []
+        self._bytes = 0
+        self._timer = None
+        self.soportado = True
+        self._stats = {"solicitudes": {"lote": 0, "individual": 0},
+                       "lotes_rechazados": 0, "eventos_en_lote": 0}
+        self._tamanos = {f"le_{c}": 0 for c in self._CUBETAS}
+        self._tamanos["le_inf"] = 0
+
+    def contar_solicitud(self, tipo: str) -> None:
+        with self._lock:
+            self._stats["solicitudes"][tipo] += 1
+
+    def agregar(self, payload: dict) -> None:
+        peso = len(json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8"))
+        lleno = None
+        with self._lock:
+            if self._eventos and self._bytes + peso > BOARDROOM_OBSERVATION_BATCH_BYTES:
+                lleno = self._tomar()
+            self._eventos.append(payload)
+            self._bytes += peso
+            if self._timer is None:
+                self._timer = threading.Timer(BOARDROOM_OBSERVATION_BATCH_MS / 1000.0, self.vencer)
+                self._timer.daemon = True
+                self._timer.start()
+        if lleno:
+            _boardroom_emisor.enviar("observation_batch", self._enviar, lleno)
+
+    def _tomar(self) -> list:
+        lote, self._eventos, self._bytes = self._eventos, [], 0
+        return lote
+
+    def vencer(self) -> None:
+        with self._lock:
+            self._timer = None
+            lote = self._tomar()
+        if lote:
+            _boardroom_emisor.enviar("observation_batch", self._enviar, lote)
+
+    def _enviar(self, lote: list) -> None:
+        if not self.soportado:
+            for payload in lote:
+                _post_observacion(payload)
+            return
+        with self._lock:
+            self._stats["solicitudes"]["lote"] += 1
+            self._stats["eventos_en_lote"] += len(lote)
+            cubeta = next((f"le_{c}" for c in self._CUBETAS if len(lote) <= c), "le_inf")
+            self._tamanos[cubeta] += 1
         try:
-            resp = requests.post(
+            resp = _boardroom_http_post(
                 _bus_event_url(),
-                json=payload,
+                json={"event_type": "OBSERVATION_BATCH", "events": lote},
                 headers={
                     "Content-Type": "application/json",
                     "Authorization": f"Bearer {BUS_INTERNAL_TOKEN}",
                     "X-Source-System": "vicky",
-                    "X-Event-Type": "inbound_message",
+                    "X-Event-Type": "observation_batch",
                 },
                 timeout=3,
             )
-            # Un no-2xx no es lo mismo que un timeout. El timeout es transitorio
-            # y cuesta un mensaje; un 400/401/403 es una falla sistemica muda:
-            # Boardroom rechaza TODAS las Observaciones, Rodys se queda ciego y
-            # Vicky sigue operando normal sin que nada lo delate. Ya paso en
-            # produccion un 401 de BUS_INTERNAL_TOKEN en este mismo bus
-            # (incidente SECOM 2026-08-09). Va en nivel error justamente para
-            # poder filtrarlo en Render y enterarse el mismo dia. El hermano
-            # sincrono (_request_boardroom_instruction) ya hacia esta
-            # comprobacion; esta rama se habia quedado sin ella.
-            # No se reintenta a proposito: reintentar rompe la semantica de
-            # maximo un intento por mensaje y puede duplicar Observaciones.
-            if not 200 <= resp.status_code < 300:
-                log.error(
-                    "Boardroom observation rechazada http=%s phone_last4=%s",
-                    resp.status_code, str(payload.get("phone") or "")[-4:],
-                )
         except Exception as exc:
-            log.warning(
-                "Boardroom observation emit fallido phone_last4=%s error=%s: %s",
-                str(payload.get("phone") or "")[-4:], type(exc).__name__, str(exc),
-            )
+            log.warning("Boardroom observation batch fallido eventos=%s error=%s: %s",
+                        len(lote), type(exc).__name__, str(exc))
+            return
+        if 200 <= resp.status_code < 300:
+            return
+        if resp.status_code in self.RECHAZO_DE_FORMATO:
+            with self._lock:
+                self.soportado = False
+                self._stats["lotes_rechazados"] += 1
+            log.warning("Boardroom no acepta lotes de Observaciones http=%s; "
+                        "volviendo a envios sueltos", resp.status_code)
+            for payload in lote:
+                _post_observacion(payload)
+            return
+        log.error("Boardroom observation batch rechazado http=%s eventos=%s",
+                  resp.status_code, len(lote))
 
-    threading.Thread(target=_post, daemon=True).start()
+    def stats(self) -> dict:
+        with self._lock:
+            return {"habilitado": BOARDROOM_OBSERVATION_BATCH_ENABLED,
+                    "soportado": self.soportado, "pendientes": len(self._eventos),
+                    "solicitudes": dict(self._stats["solicitudes"]),
+                    "lotes_rechazados": self._stats["lotes_rechazados"],
+                    "eventos_en_lote": self._stats["eventos_en_lote"],
+                    "tamano_lote": dict(self._tamanos)}
+
+
+_lote_observaciones = _LoteObservaciones()
 
 
 def _flush_boardroom_observation() -> None:
@@ -1307,6 +2384,74 @@ def _flush_boardroom_observation() -> None:
     _emit_boardroom_observation(event)
 
 
+class _CircuitoBoardroom:
+    """Circuito alrededor de _request_boardroom_instruction.
+
+    Con Boardroom frio o caido en Render cada turno no resuelto pagaba los 3 s
+    completos del timeout antes del fallback neutral. Tras
+    BOARDROOM_BREAKER_THRESHOLD fallas seguidas (timeout, http_5xx o error de
+    red) el circuito se abre y los turnos van directo al fallback. Pasados
+    BOARDROOM_BREAKER_COOLDOWN_S queda semiabierto: UN turno hace de sonda;
+    si responde se cierra, si falla vuelve a abrirse otra pausa completa.
+    Un 4xx o un cuerpo invalido no cuentan como caida: Boardroom contesto.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.estado = "cerrado"
+        self._fallas = 0
+        self._abierto_en = 0.0
+        self._sonda_en_curso = False
+        self._stats = {"aperturas": 0, "cortocircuitos": 0, "sondas": 0}
+        self._latencia = _LatenciaHistograma()
+
+    @staticmethod
+    def es_falla(error: str | None) -> bool:
+        if error in ("timeout", "exception"):
+            return True
+        return bool(error and error.startswith("http_5"))
+
+    def permitir(self) -> bool:
+        with self._lock:
+            if self.estado == "cerrado":
+                return True
+            if (self.estado == "abierto"
+                    and time.monotonic() - self._abierto_en >= BOARDROOM_BREAKER_COOLDOWN_S):
+                self.estado = "semiabierto"
+            if self.estado == "semiabierto" and not self._sonda_en_curso:
+                self._sonda_en_curso = True
+                self._stats["sondas"] += 1
+                return True
+            self._stats["cortocircuitos"] += 1
+            return False
+
+    def registrar(self, error: str | None, ms: float) -> None:
+        with self._lock:
+            self._latencia.observe(ms)
+            sonda = self._sonda_en_curso
+            self._sonda_en_curso = False
+            if not self.es_falla(error):
+                if self.estado != "cerrado":
+                    log.info("Boardroom circuito cerrado tras sonda exitosa")
+                self.estado, self._fallas = "cerrado", 0
+                return
+            self._fallas += 1
+            if sonda or (self.estado == "cerrado" and self._fallas >= BOARDROOM_BREAKER_THRESHOLD):
+                self.estado = "abierto"
+                self._abierto_en = time.monotonic()
+                self._stats["aperturas"] += 1
+                log.warning("Boardroom circuito abierto fallas_seguidas=%s ultimo_error=%s",
+                            self._fallas, error)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"estado": self.estado, "fallas_seguidas": self._fallas,
+                    **self._stats, "latencia_ms": self._latencia.snapshot()}
+
+
+_circuito_boardroom = _CircuitoBoardroom()
+
+
 def _handle_boardroom_authority(phone: str, msg_obj: dict, mtype: str, text: str) -> bool:
     if not BOARDROOM_IS_AUTHORITY:
         return False
@@ -1320,7 +2465,16 @@ def _handle_boardroom_authority(phone: str, msg_obj: dict, mtype: str, text: str
     # FLUJO_BLOQUEADO cuenta Observaciones consecutivas y Boardroom no
     # deduplica.
     _tl.boardroom_emitted = True
-    body, error = _request_boardroom_instruction(payload)
+    if BOARDROOM_SPECULATIVE_ENABLED:
+        return _handle_boardroom_authority_especulativo(phone, payload, text)
+    # Con el circuito abierto el latch ya esta arriba: el finally de handle()
+    # tampoco manda Observacion, asi que un turno cortocircuitado es cero
+    # intentos hacia Boardroom, nunca uno duplicado.
+    if not _circuito_boardroom.permitir():
+        log.warning("Boardroom authority fallback reason=circuit_open phone_last4=%s", phone[-4:])
+        _send_neutral_fallback(phone)
+        return True
+    body, error = _pedir_instruccion_medida(payload)
     if body is None:
         log.warning("Boardroom authority fallback reason=%s phone_last4=%s", error, phone[-4:])
         _send_neutral_fallback(phone)
@@ -1333,20 +2487,167 @@ def _handle_boardroom_authority(phone: str, msg_obj: dict, mtype: str, text: str
     return True
 
 
-def _notify_boardroom_document(phone: str, media_id: str, doc_type: str) -> None:
-    """Notifica a Boardroom que Vicky Redes recibió un documento."""
+def _pedir_instruccion_medida(payload: dict) -> tuple[dict | None, str | None]:
+    """_request_boardroom_instruction + latencia y resultado hacia el circuito."""
+    t0 = time.perf_counter()
+    body, error = _request_boardroom_instruction(payload)
+    _circuito_boardroom.registrar(error, (time.perf_counter() - t0) * 1000.0)
+    return body, error
+
+
+# ── Ruteo especulativo (BOARDROOM_SPECULATIVE_ENABLED) ───────────────────────
+# A la llamada de autoridad solo llegan turnos que el pre-router local ya no
+# supo resolver (sin menu, sin servicio, sin referral), asi que la unica
+# respuesta local posible es la que daba el router legacy a esos turnos: GPT
+# si el texto trae contexto financiero. Esa llamada es justo la que cuesta,
+# asi que solo se arranca cuando hace falta: si Boardroom falla, o si a la
+# mitad del plazo (_ESPECULACION_ARRANQUE_FRACCION) todavia no contesta; en
+# ese caso corre en su propio hilo MIENTRAS Boardroom decide. Si Boardroom
+# contesta a tiempo, el turno no paga GPT. Si no contesta dentro de
+# BOARDROOM_SPECULATIVE_DEADLINE_MS, sale el candidato si ya esta listo o el
+# fallback neutral. Con el circuito abierto sale el neutral de inmediato.
+_ESPECULACION_ARRANQUE_FRACCION = 0.5
+_especulacion_stats = {"descartados": 0, "comprometidos": 0, "vencidos": 0,
+                       "sin_candidato": 0, "tardios": 0, "candidatos_calculados": 0}
+_especulacion_lock = threading.Lock()
+
+
+def _especulacion_contar(campo: str) -> None:
+    with _especulacion_lock:
+        _especulacion_stats[campo] += 1
+
+
+def _candidato_local(text: str) -> str | None:
+    """Respuesta local para un turno que el pre-router no resolvio, sin
+    efectos: no envia nada ni toca user_state. None => fallback neutral."""
+    n = norm(text) if text else ""
+    if not n or not _oai or not _is_financial_context(n):
+        return None
+    return ask_gpt(text)
+
+
+def _candidato_en_paralelo(text: str) -> tuple:
+    """Arranca _candidato_local en su propio hilo. Devuelve (resultado, listo)."""
+    resultado: dict = {"candidato": None}
+    listo = threading.Event()
+
+    def _calcular() -> None:
+        try:
+            resultado["candidato"] = _candidato_local(text)
+        except Exception:
+            log.exception("💥 _candidato_local")
+        finally:
+            listo.set()
+
+    _especulacion_contar("candidatos_calculados")
+    threading.Thread(target=_calcular, daemon=True).start()
+    return resultado, listo
+
+
+def _candidato_dentro_del_plazo(text: str, en_curso, t0: float) -> str | None:
+    """El candidato si esta listo antes de que venza el plazo del turno; lo
+    arranca si aun no corria. Nunca espera mas alla del plazo."""
+    resultado, listo = en_curso or _candidato_en_paralelo(text)
+    restante = BOARDROOM_SPECULATIVE_DEADLINE_MS / 1000.0 - (time.perf_counter() - t0)
+    listo.wait(max(0.0, restante))
+    return resultado["candidato"] if listo.is_set() else None
+
+
+def _comprometer_candidato(phone: str, candidato: str | None) -> None:
+    if candidato:
+        _especulacion_contar("comprometidos")
+        send_msg(phone, candidato)
+    else:
+        _especulacion_contar("sin_candidato")
+        _send_neutral_fallback(phone)
+
+
+def _handle_boardroom_authority_especulativo(phone: str, payload: dict, text: str) -> bool:
+    """Variante de _handle_boardroom_authority con el candidato local en
+    paralelo. El latch ya esta arriba cuando se llega aqui: ni el cortocircuito
+    ni el vencimiento del plazo producen una Observacion extra."""
+    t0 = time.perf_counter()
+    if not _circuito_boardroom.permitir():
+        log.warning("Boardroom authority fallback reason=circuit_open phone_last4=%s", phone[-4:])
+        _send_neutral_fallback(phone)
+        return True
+
+    resultado: dict = {"abandonado": False}
+    listo = threading.Event()
+    lock = threading.Lock()
+
+    def _pedir() -> None:
+        body, error = _pedir_instruccion_medida(payload)
+        with lock:
+            resultado["body"], resultado["error"] = body, error
+            abandonado = resultado["abandonado"]
+            listo.set()
+        if abandonado and body is not None:
+            # Llego tarde: el turno ya se contesto con el candidato local.
+            # Se le avisa a Boardroom que su instruccion no se ejecuto.
+            _especulacion_contar("tardios")
+            _confirm_boardroom_execution(body, False, "skipped", "speculative_deadline")
+
+    threading.Thread(target=_pedir, daemon=True).start()
+    plazo = BOARDROOM_SPECULATIVE_DEADLINE_MS / 1000.0
+    candidato = None
+    if not listo.wait(plazo * _ESPECULACION_ARRANQUE_FRACCION):
+        # Boardroom va lento: el candidato se prepara en paralelo.
+        candidato = _candidato_en_paralelo(text)
+        listo.wait(max(0.0, plazo - (time.perf_counter() - t0)))
+    with lock:
+        if not listo.is_set():
+            resultado["abandonado"] = True
+    if resultado["abandonado"]:
+        _especulacion_contar("vencidos")
+        log.warning("Boardroom authority fallback reason=speculative_deadline phone_last4=%s",
+                    phone[-4:])
+        _comprometer_candidato(phone, _candidato_dentro_del_plazo(text, candidato, t0))
+        return True
+
+    body = resultado.get("body")
+    if body is None:
+        log.warning("Boardroom authority fallback reason=%s phone_last4=%s",
+                    resultado.get("error"), phone[-4:])
+        _comprometer_candidato(phone, _candidato_dentro_del_plazo(text, candidato, t0))
+        return True
+
+    _especulacion_contar("descartados")
+    executed, delivery_status, exec_error = _execute_boardroom_instruction(phone, body)
+    _confirm_boardroom_execution(body, executed, delivery_status, exec_error)
+    if not executed:
+        _send_neutral_fallback(phone)
+    return True
+
+
+def _boardroom_especulacion_stats() -> dict:
+    with _especulacion_lock:
+        return {"habilitado": BOARDROOM_SPECULATIVE_ENABLED,
+                "plazo_ms": BOARDROOM_SPECULATIVE_DEADLINE_MS, **_especulacion_stats}
+
+
+def _notify_boardroom_document(phone: str, media_id: str, doc_type: str,
+                               event_id: str | None = None, media: dict | None = None) -> bool:
+    """Notifica a Boardroom que Vicky Redes recibió un documento. True solo
+    con 2xx (el outbox decide con eso si reintenta). `media` es la referencia
+    del pipeline de ingesta (media_ref/sha256/mime_type/bytes), si corrio."""
     if not BOARDROOM_URL or not BOARDROOM_API_TOKEN:
         log.warning("boardroom_not_configured: documento no notificado")
-        return
+        return False
     try:
-        resp = requests.post(
+        body = {
+            "phone": phone,
+            "media_id": media_id,
+            "doc_type": doc_type,
+            "source": "vicky_redes"
+        }
+        if event_id:
+            body["event_id"] = event_id
+        if media:
+            body.update(media)
+        resp = _boardroom_http_post(
             f"{BOARDROOM_URL}/api/document/process",
-            json={
-                "phone": phone,
-                "media_id": media_id,
-                "doc_type": doc_type,
-                "source": "vicky_redes"
-            },
+            json=body,
             headers={
                 "Content-Type": "application/json",
                 "X-Boardroom-Token": BOARDROOM_API_TOKEN
@@ -1354,11 +2655,14 @@ def _notify_boardroom_document(phone: str, media_id: str, doc_type: str) -> None
             timeout=5
         )
         log.info("boardroom_doc_notified: phone=%s status=%s", phone, resp.status_code)
+        return 200 <= resp.status_code < 300
     except Exception as e:
         log.error("boardroom_doc_notify_failed: phone=%s error=%s", phone, e)
+        return False
 
 
-def _notify_boardroom_lead_qualified(phone: str, product_code: str, data: dict) -> bool:
+def _notify_boardroom_lead_qualified(phone: str, product_code: str, data: dict,
+                                     event_id: str | None = None) -> bool:
     """Notifica a Boardroom cuando Vicky Redes completa calificación.
 
     Devuelve True SOLO si Boardroom confirmó la recepción (2xx). Sin
@@ -1368,7 +2672,10 @@ def _notify_boardroom_lead_qualified(phone: str, product_code: str, data: dict)
     ignorando el retorno sin cambio alguno. El valor existe porque el Flow
     dinámico necesita saber si el efecto realmente ocurrió antes de marcarlo
     como no-repetible (una notificación fallida marcada como hecha se
-    perdería para siempre en el reintento)."""
+    perdería para siempre en el reintento).
+
+    `event_id` es la llave de idempotencia que fija el outbox para que los
+    reintentos del mismo lead lleguen con el mismo id; sin ella, uuid4 nuevo."""
     if not BOARDROOM_URL or not BOARDROOM_API_TOKEN:
         log.warning("boardroom_not_configured: lead no notificado")
         return False
@@ -1377,7 +2684,7 @@ def _notify_boardroom_lead_qualified(phone: str, product_code: str, data: dict)
         resp = requests.post(
             f"{BOARDROOM_URL}/boardroom/tasks/commercial",
             json={
-                "event_id": str(uuid4()),
+                "event_id": event_id or str(uuid4()),
                 "lead_id": phone,
                 "event_type": "lead_new",
                 "product_code": product_code,
@@ -1414,6 +2721,481 @@ def _notify_boardroom_lead_qualified(phone: str, product_code: str, data: dict)
         log.error("boardroom_lead_notify_failed: phone=%s error=%s", phone, e)
         return False
 
+
+# ── Indice de leads por telefono (dedupe entre canales) ──────────────────────
+# La misma persona llega por /ext/lead, por un anuncio de Meta y por WhatsApp
+# directo en pocas horas. lead_phone:<10 digitos> guarda la primera fuente,
+# el ultimo producto y, por "canal:producto", cuando se aviso por ultima vez
+# (canal = asesor | boardroom). Las altas externas (/ext/lead, importacion)
+# RECLAMAN el aviso antes de dispararlo: una sola lectura-escritura atomica
+# (aux_update), y si ya hubo uno dentro de LEAD_DEDUPE_WINDOW_S el aviso se
+# suprime y se cuenta. Los avisos de calificacion de los funnels y del Flow
+# (con pension, monto, etc.), al asesor y a Boardroom, no se suprimen nunca
+# -- traen informacion nueva --, solo se MARCAN, para que un /ext/lead
+# posterior de la misma persona no repita la alerta.
+# Si el almacen falla, el indice deja pasar el aviso (falla abierta).
+_LEAD_INDICE_TTL = 30 * 24 * 3600
+_lead_indice_contadores = {"reclamados": 0, "suprimidos_asesor": 0, "suprimidos_boardroom": 0}
+_lead_indice_lock = threading.Lock()
+
+
+def _lead_telefono(raw) -> str:
+    """Regla de /ext/lead: ultimos 10 digitos; valido solo si son 10."""
+    return re.sub(r"\D", "", str(raw or ""))[-10:]
+
+
+def _lead_indice_key(phone: str) -> str:
+    return f"lead_phone:{_lead_telefono(phone)}"
+
+
+def _lead_indice_decodificar(raw) -> dict:
+    try:
+        registro = json.loads(raw) if raw else {}
+    except (TypeError, ValueError):
+        registro = {}
+    if not isinstance(registro, dict):
+        registro = {}
+    registro.setdefault("notificaciones", {})
+    return registro
+
+
+def _lead_indice_actualizar(phone: str, cambio) -> bool:
+    def _fn(actual):
+        registro = _lead_indice_decodificar(actual)
+        ahora = time.time()
+        registro.setdefault("telefono", _lead_telefono(phone))
+        registro.setdefault("primer_visto", ahora)
+        cambio(registro, ahora)
+        return json.dumps(registro, ensure_ascii=False)
+
+    return _state_store.aux_update(_lead_indice_key(phone), _fn, _LEAD_INDICE_TTL)
+
+
+def _lead_indice_reclamar(phone: str, canal: str, product_code: str, fuente: str) -> bool:
+    """True si este aviso debe dispararse (y queda registrado); False si es
+    duplicado dentro de la ventana."""
+    if not LEAD_DEDUPE_WINDOW_S or len(_lead_telefono(phone)) != 10:
+        return True
+    llave = f"{canal}:{product_code}"
+    decision = {"disparar": True}
+
+    def _cambio(registro, ahora):
+        registro.setdefault("primera_fuente", fuente)
+        registro["ultimo_producto"] = product_code
+        previo = registro["notificaciones"].get(llave)
+        if previo and ahora - float(previo) < LEAD_DEDUPE_WINDOW_S:
+            decision["disparar"] = False
+            return
+        registro["notificaciones"][llave] = ahora
+        registro["ultima_notificacion"] = ahora
+
+    if not _lead_indice_actualizar(phone, _cambio):
+        return True
+    with _lead_indice_lock:
+        if decision["disparar"]:
+            _lead_indice_contadores["reclamados"] += 1
+        else:
+            _lead_indice_contadores[f"suprimidos_{canal}"] += 1
+    if not decision["disparar"]:
+        log.info("lead_duplicado_suprimido canal=%s producto=%s fuente=%s phone_last4=%s",
+                 canal, product_code, fuente, _lead_telefono(phone)[-4:])
+    return decision["disparar"]
+
+
+def _lead_indice_marcar(phone: str, canal: str, product_code: str, fuente: str) -> None:
+    """Registra un aviso que ya salio por su cuenta (sin suprimirlo)."""
+    if not LEAD_DEDUPE_WINDOW_S or len(_lead_telefono(phone)) != 10:
+        return
+
+    def _cambio(registro, ahora):
+        registro.setdefault("primera_fuente", fuente)
+        registro["ultimo_producto"] = product_code
+        registro["notificaciones"][f"{canal}:{product_code}"] = ahora
+        registro["ultima_notificacion"] = ahora
+
+    _lead_indice_actualizar(phone, _cambio)
+
+
+def _lead_indice_liberar(phone: str, canal: str, product_code: str) -> None:
+    """El aviso reclamado no salio: se borra la marca para que el reintento
+    (o el siguiente canal) no quede suprimido por un aviso que nunca llego."""
+    if not LEAD_DEDUPE_WINDOW_S or len(_lead_telefono(phone)) != 10:
+        return
+    _lead_indice_actualizar(
+        phone, lambda registro, ahora: registro["notificaciones"].pop(f"{canal}:{product_code}", None))
+
+
+def _lead_indice_alta_boardroom(phone: str, product_code: str, data: dict, lead_id: str,
+                                fuente: str, diferido: bool = False) -> str:
+    """Alta lead_new de una entrada externa: solo si el indice la reclama.
+    "" si se suprimio por duplicada."""
+    if not _lead_indice_reclamar(phone, "boardroom", product_code, fuente):
+        return ""
+    return _boardroom_outbox_lead(phone, product_code, data, lead_id=lead_id, fuente=fuente,
+                                  diferido=diferido)
+
+
+def _lead_indice_stats() -> dict:
+    with _lead_indice_lock:
+        return {"ventana_s": LEAD_DEDUPE_WINDOW_S, **_lead_indice_contadores}
+
+
+# ── Outbox durable hacia Boardroom (leads calificados y documentos) ──────────
+# Antes cada aviso era un POST bloqueante de un solo intento: con Boardroom
+# caido el lead se perdia. Ahora el evento se escribe en
+# boardroom_outbox:<event_id> en el mismo punto donde cambia el estado local
+# (funnel completado, /ext/lead aceptado, documento recibido), se indexa en
+# boardroom_outbox y un despachador lo entrega con backoff. El event_id es
+# uuid5 de la llave de idempotencia (lead_id, o telefono+producto+funnel;
+# media_id para documentos): registrar dos veces el mismo evento no lo duplica, y los
+# reintentos llegan a Boardroom con el mismo id. Agotados los reintentos, el
+# evento pasa a boardroom_outbox_dlq para revision manual.
+_BOARDROOM_OUTBOX_TTL = 7 * 24 * 3600
+_BOARDROOM_OUTBOX_INDICE = "boardroom_outbox"
+_BOARDROOM_OUTBOX_DLQ = "boardroom_outbox_dlq"
+_BOARDROOM_OUTBOX_BACKOFF_S = (5, 30, 120, 600, 1800)
+_boardroom_outbox_en_curso: set = set()
+_boardroom_outbox_lock = threading.Lock()
+_boardroom_outbox_contadores = {"registrados": 0, "no_persistidos": 0, "duplicados": 0,
+                                "entregados": 0, "fallidos": 0, "dlq": 0}
+_boardroom_outbox_lag = _LatenciaHistograma(
+    buckets=(1000, 5000, 30000, 60000, 300000, 900000, 3600000))
+
+
+def _boardroom_outbox_key(event_id: str) -> str:
+    return f"boardroom_outbox:{event_id}"
+
+
+def _boardroom_outbox_cargar(event_id: str) -> dict | None:
+    raw = _state_store.aux_get(_boardroom_outbox_key(event_id))
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except (TypeError, ValueError):
+        return None
+
+
+def _boardroom_outbox_guardar(registro: dict) -> bool:
+    return _state_store.aux_set(_boardroom_outbox_key(registro["event_id"]),
+                                json.dumps(registro, ensure_ascii=False, default=str),
+                                _BOARDROOM_OUTBOX_TTL)
+
+
+def _boardroom_outbox_contar(campo: str) -> None:
+    with _boardroom_outbox_lock:
+        _boardroom_outbox_contadores[campo] += 1
+
+
+def _boardroom_outbox_event_id(tipo: str, clave: str) -> str:
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"vicky:{tipo}:{clave}"))
+
+
+def _boardroom_outbox_registrar(tipo: str, clave: str, args: dict, diferido: bool = False) -> str:
+    """Escribe el evento (una sola vez por llave) y lanza su primer intento.
+    `diferido` (altas en volumen, p. ej. /ext/leads/import): el primer intento
+    tambien pasa por el programador, que los drena por lotes."""
+    event_id = _boardroom_outbox_event_id(tipo, clave)
+    nuevo = {"event_id": event_id, "tipo": tipo, "clave": clave, "args": args,
+             "estado": "pendiente", "intentos": 0, "creado": time.time()}
+    existente = {}
+
+    def _crear(actual):
+        if actual:
+            existente["registro"] = actual
+            return actual
+        return json.dumps(nuevo, ensure_ascii=False, default=str)
+
+    if not _state_store.aux_update(_boardroom_outbox_key(event_id), _crear, _BOARDROOM_OUTBOX_TTL):
+        log.error("boardroom_outbox_no_persistido tipo=%s event_id=%s "
+                  "(se intenta igual, sin recuperacion tras reinicio)", tipo, event_id)
+        _boardroom_outbox_contar("no_persistidos")
+    elif existente:
+        _boardroom_outbox_contar("duplicados")
+        return event_id
+    else:
+        _boardroom_outbox_contar("registrados")
+        _state_store.aux_sadd(_BOARDROOM_OUTBOX_INDICE, event_id, _BOARDROOM_OUTBOX_TTL)
+        if diferido:
+            _boardroom_outbox_programar(event_id, 0)
+            return event_id
+    if not _boardroom_emisor.enviar("outbox", _boardroom_outbox_entregar, event_id, nuevo):
+        _boardroom_outbox_programar(event_id, _BOARDROOM_OUTBOX_BACKOFF_S[0])
+    return event_id
+
+
+# Funnels de chat que dan de alta cada producto (parte de la llave del outbox).
+_BOARDROOM_FUNNELS_POR_PRODUCTO = {
+    "prestamo_imss_ley73": ("imss",),
+    "seguro_vida": ("auto", "vida", "vrim"),
+    "nomina_empresarial": ("emp",),
+}
+
+
+def _boardroom_outbox_lead_clave(phone: str, product_code: str, lead_id: str = "",
+                                 funnel: str = "") -> str:
+    """Llave del alta lead_new en el outbox."""
+    return lead_id or ":".join(filter(None, (_digits(phone), product_code, funnel)))
+
+
+def _boardroom_outbox_lead(phone: str, product_code: str, data: dict, lead_id: str = "",
+                           fuente: str = "", funnel: str = "", diferido: bool = False) -> str:
+    """Alta lead_new en Boardroom via outbox. Nunca la suprime: queda marcada
+    en el indice por telefono (las entradas externas reclaman antes, ver
+    _lead_indice_alta_boardroom).
+
+    Sin lead_id la llave es telefono+producto+funnel: auto, vida y VRIM
+    comparten product_code (seguro_vida) y calificar en uno no debe tapar el
+    alta del otro durante los 7 dias que vive el registro entregado."""
+    fuente = fuente or str((data or {}).get("source") or (data or {}).get("origen") or "whatsapp")
+    _lead_indice_marcar(phone, "boardroom", product_code, fuente)
+    clave = _boardroom_outbox_lead_clave(phone, product_code, lead_id, funnel)
+    return _boardroom_outbox_registrar("lead", clave, {
+        "phone": phone, "product_code": product_code, "data": data}, diferido=diferido)
+
+
+def _boardroom_outbox_documento(phone: str, media_id: str, doc_type: str,
+                                media: dict | None = None) -> str:
+    # Con referencia de contenido, la llave es telefono+sha256: el mismo
+    # archivo reenviado por el mismo cliente no genera un segundo aviso.
+    clave = f"{_digits(phone)}:{media['sha256']}" if media else media_id
+    return _boardroom_outbox_registrar("document", clave, {
+        "phone": phone, "media_id": media_id, "doc_type": doc_type, "media": media})
+
+
+def _boardroom_outbox_enviar(registro: dict) -> bool:
+    a = registro["args"]
+    if registro["tipo"] == "lead":
+        return bool(_notify_boardroom_lead_qualified(
+            a["phone"], a["product_code"], a["data"], event_id=registro["event_id"]))
+    if registro["tipo"] == "document":
+        return bool(_notify_boardroom_document(
+            a["phone"], a["media_id"], a["doc_type"], event_id=registro["event_id"],
+            media=a.get("media")))
+    log.error("boardroom_outbox_tipo_desconocido tipo=%s", registro["tipo"])
+    return False
+
+
+def _boardroom_outbox_entregar(event_id: str, registro: dict = None) -> None:
+    with _boardroom_outbox_lock:
+        if event_id in _boardroom_outbox_en_curso:
+            return
+        _boardroom_outbox_en_curso.add(event_id)
+    try:
+        registro = _boardroom_outbox_cargar(event_id) or registro
+        if not registro or registro.get("estado") != "pendiente":
+            _state_store.aux_srem(_BOARDROOM_OUTBOX_INDICE, event_id)
+            return
+        if _boardroom_outbox_enviar(registro):
+            registro["estado"] = "entregado"
+            _boardroom_outbox_guardar(registro)
+            _state_store.aux_srem(_BOARDROOM_OUTBOX_INDICE, event_id)
+            _boardroom_outbox_contar("entregados")
+            with _boardroom_outbox_lock:
+                _boardroom_outbox_lag.observe((time.time() - registro["creado"]) * 1000.0)
+            return
+        _boardroom_outbox_contar("fallidos")
+        if not BOARDROOM_URL or not BOARDROOM_API_TOKEN:
+            # Sin configuracion no hay a quien reintentar: queda pendiente en
+            # el indice y se retoma en el siguiente arranque ya configurado.
+            return
+        registro["intentos"] = int(registro.get("intentos") or 0) + 1
+        if registro["intentos"] > len(_BOARDROOM_OUTBOX_BACKOFF_S):
+            registro["estado"] = "dlq"
+            _boardroom_outbox_guardar(registro)
+            _state_store.aux_srem(_BOARDROOM_OUTBOX_INDICE, event_id)
+            _state_store.aux_sadd(_BOARDROOM_OUTBOX_DLQ, event_id, _BOARDROOM_OUTBOX_TTL)
+            _boardroom_outbox_contar("dlq")
+            log.error("boardroom_outbox_dlq tipo=%s event_id=%s phone_last4=%s intentos=%s",
+                      registro["tipo"], event_id,
+                      _digits(registro["args"].get("phone", ""))[-4:], registro["intentos"])
+            return
+        _boardroom_outbox_guardar(registro)
+        _boardroom_outbox_programar(event_id, _BOARDROOM_OUTBOX_BACKOFF_S[registro["intentos"] - 1])
+    finally:
+        with _boardroom_outbox_lock:
+            _boardroom_outbox_en_curso.discard(event_id)
+
+
+def _boardroom_outbox_programar(event_id: str, espera_s: float) -> None:
+    _programador_agendar("outbox", event_id, espera_s)
+
+
+def _boardroom_outbox_despachar(event_id: str) -> None:
+    """Handler del programador: la entrega (POST bloqueante) corre en el
+    emisor acotado, nunca en el hilo del programador, y sin ocupar mas de la
+    mitad de su cola (la otra mitad queda para observaciones y eventos del
+    bus de conversaciones en vivo). Si no hay lugar se reagenda sin gastar
+    intento."""
+    if not _boardroom_emisor.enviar("outbox", _boardroom_outbox_entregar, event_id,
+                                    reserva=_boardroom_emisor.capacidad // 2):
+        _boardroom_outbox_programar(event_id, _BOARDROOM_OUTBOX_BACKOFF_S[0])
+
+
+_programador_registrar("outbox", lambda event_id: _boardroom_outbox_despachar(event_id))
+
+
+def _boardroom_outbox_reanudar() -> None:
+    """Arranque: agenda los eventos que quedaron sin entregar; el programador
+    los drena por lotes."""
+    pendientes = _state_store.aux_smembers(_BOARDROOM_OUTBOX_INDICE)
+    for event_id in pendientes:
+        _boardroom_outbox_programar(event_id, 0)
+    if pendientes:
+        log.info("boardroom_outbox_reanudado total=%s", len(pendientes))
+
+
+def _boardroom_outbox_stats() -> dict:
+    pendientes = _state_store.aux_smembers(_BOARDROOM_OUTBOX_INDICE)
+    creados = [r["creado"] for r in map(_boardroom_outbox_cargar, pendientes) if r]
+    with _boardroom_outbox_lock:
+        return {"pendientes": len(pendientes),
+                "dlq": len(_state_store.aux_smembers(_BOARDROOM_OUTBOX_DLQ)),
+                "lag_s": round(time.time() - min(creados), 1) if creados else 0.0,
+                **{f"total_{k}": v for k, v in _boardroom_outbox_contadores.items()},
+                "entrega_lag_ms": _boardroom_outbox_lag.snapshot()}
+
+
+# ── Ingesta de media entrante (MEDIA_PIPELINE_ENABLED) ───────────────────────
+# Imagen/documento: se resuelve la URL en la Graph API, se descarga por
+# streaming en bloques de _MEDIA_CHUNK a un temporal (nunca el archivo entero
+# en memoria) calculando sha256 al vuelo, y se guarda como
+# MEDIA_STORAGE_DIR/<sha[:2]>/<sha>.<ext>. Tipo y tamano se validan contra
+# lo que Meta declara y otra vez contra lo realmente descargado. Boardroom
+# recibe media_ref="sha256:<hash>", estable aunque Meta rote el media_id.
+# Pool propio y acotado: una rafaga de fotos no compite con el emisor del bus
+# ni con el webhook.
+_MEDIA_CHUNK = 64 * 1024
+_MEDIA_TTL = 30 * 24 * 3600
+_MEDIA_TIPOS = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp",
+                "application/pdf": "pdf"}
+_media_pool = _EmisorBoardroom(MEDIA_PIPELINE_WORKERS, MEDIA_PIPELINE_QUEUE)
+_media_contadores = {"descargados": 0, "duplicados": 0, "rechazados_tipo": 0,
+                     "rechazados_tamano": 0, "errores": 0, "bytes": 0}
+_media_lock = threading.Lock()
+
+
+class MediaRechazada(Exception):
+    """El archivo no cumple los limites de tipo/tamano; `motivo` va al contador."""
+
+    def __init__(self, motivo: str, detalle: str = ""):
+        super().__init__(f"{motivo}: {detalle}")
+        self.motivo = motivo
+
+
+def _media_contar(campo: str, n: int = 1) -> None:
+    with _media_lock:
+        _media_contadores[campo] += n
+
+
+def _media_tipo(mime: str) -> str:
+    return str(mime or "").split(";")[0].strip().lower()
+
+
+def _media_resolver(media_id: str) -> dict:
+    """Metadatos de la Graph API: url (firmada, de corta vida), mime_type, file_size."""
+    r = requests.get(f"{_WA_BASE}/{media_id}",
+                     headers={"Authorization": f"Bearer {META_TOKEN}"}, timeout=10)
+    r.raise_for_status()
+    meta = r.json() or {}
+    tipo = _media_tipo(meta.get("mime_type"))
+    if tipo not in _MEDIA_TIPOS:
+        raise MediaRechazada("rechazados_tipo", tipo)
+    if int(meta.get("file_size") or 0) > MEDIA_MAX_BYTES:
+        raise MediaRechazada("rechazados_tamano", str(meta.get("file_size")))
+    return meta
+
+
+def _media_descargar(url: str, tipo: str) -> tuple[str, str, int]:
+    """Streaming a un temporal dentro de MEDIA_STORAGE_DIR. Devuelve
+    (ruta_temporal, sha256, bytes); borra el temporal si algo falla."""
+    os.makedirs(MEDIA_STORAGE_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=MEDIA_STORAGE_DIR, suffix=".part")
+    digest, total = hashlib.sha256(), 0
+    try:
+        with os.fdopen(fd, "wb") as out, requests.get(
+                url, headers={"Authorization": f"Bearer {META_TOKEN}"},
+                stream=True, timeout=(5, 30)) as r:
+            r.raise_for_status()
+            servido = _media_tipo(r.headers.get("Content-Type"))
+            if servido and servido != tipo:
+                raise MediaRechazada("rechazados_tipo", servido)
+            for bloque in r.iter_content(chunk_size=_MEDIA_CHUNK):
+                if not bloque:
+                    continue
+                total += len(bloque)
+                if total > MEDIA_MAX_BYTES:
+                    raise MediaRechazada("rechazados_tamano", f">{MEDIA_MAX_BYTES}")
+                digest.update(bloque)
+                out.write(bloque)
+        return tmp, digest.hexdigest(), total
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _media_ingerir(phone: str, media_id: str) -> dict:
+    """Pipeline completo para un media_id. Devuelve la referencia para
+    Boardroom; idempotente por media_id (reintentos de Meta) y por contenido."""
+    previo = _state_store.aux_get(f"media_id:{media_id}")
+    if previo:
+        try:
+            _media_contar("duplicados")
+            return json.loads(previo)
+        except (TypeError, ValueError):
+            pass
+    meta = _media_resolver(media_id)
+    tipo = _media_tipo(meta.get("mime_type"))
+    tmp, sha, total = _media_descargar(meta["url"], tipo)
+    destino = os.path.join(MEDIA_STORAGE_DIR, sha[:2], f"{sha}.{_MEDIA_TIPOS[tipo]}")
+    if os.path.exists(destino):
+        os.remove(tmp)
+        _media_contar("duplicados")
+    else:
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        os.replace(tmp, destino)
+        _media_contar("descargados")
+        _media_contar("bytes", total)
+    ref = {"media_ref": f"sha256:{sha}", "sha256": sha, "mime_type": tipo, "bytes": total}
+    _state_store.aux_set(f"media_id:{media_id}", json.dumps(ref), _MEDIA_TTL)
+    _state_store.aux_set(f"media:{sha}", json.dumps({**ref, "path": destino}), _MEDIA_TTL)
+    return ref
+
+
+def _media_procesar(phone: str, media_id: str, doc_type: str) -> None:
+    """Corre en _media_pool. Cualquier falla degrada al aviso de siempre (solo
+    media_id): Boardroom nunca deja de enterarse del documento."""
+    ref = None
+    try:
+        ref = _media_ingerir(phone, media_id)
+    except MediaRechazada as exc:
+        _media_contar(exc.motivo)
+        log.warning("media_rechazada phone_last4=%s media_id=%s %s",
+                    _digits(phone)[-4:], media_id, exc)
+    except Exception as exc:
+        _media_contar("errores")
+        log.warning("media_ingesta_fallida phone_last4=%s media_id=%s error=%s: %s",
+                    _digits(phone)[-4:], media_id, type(exc).__name__, exc)
+    _boardroom_outbox_documento(phone, media_id, doc_type, media=ref)
+
+
+def _media_encolar(phone: str, media_id: str, doc_type: str) -> None:
+    if not MEDIA_PIPELINE_ENABLED or not META_TOKEN:
+        _boardroom_outbox_documento(phone, media_id, doc_type)
+        return
+    if not _media_pool.enviar("media", _media_procesar, phone, media_id, doc_type):
+        # Pool lleno: no se descarga, pero el aviso a Boardroom no se pierde.
+        _boardroom_outbox_documento(phone, media_id, doc_type)
+
+
+def _media_stats() -> dict:
+    with _media_lock:
+        return {"habilitado": MEDIA_PIPELINE_ENABLED, **_media_contadores,
+                "pool": _media_pool.stats()}
+
 # ── Utilidades ────────────────────────────────────────────────────────────────
 def norm(text: str) -> str:
     if not text:
@@ -2023,14 +3805,74 @@ _IMSS_REVISION_CTA = (
 )
 
 
+# Tabla de factores por plazo, construida al importar para todo el catalogo
+# IMSS_PLAZOS_DISPONIBLES. Va ligada a las constantes con las que se calculo:
+# si IMSS_TASA_MENSUAL o IMSS_IVA_RATE cambian (recarga de config, pruebas con
+# monkeypatch), la siguiente consulta la reconstruye sola. Un plazo fuera del
+# catalogo se calcula al vuelo y se agrega a la tabla vigente.
+_imss_tabla_factores: dict = {"constantes": None, "plazos": {}}
+_imss_tabla_lock = threading.Lock()
+
+
+def _imss_calcular_factores(plazo: int) -> tuple[float, float]:
+    uno_mas_i = 1 + IMSS_TASA_MENSUAL + IMSS_TASA_MENSUAL * IMSS_IVA_RATE
+    g = uno_mas_i ** plazo
+    return g, (g - 1) / (uno_mas_i - 1)
+
+
+def _imss_tabla_vigente() -> dict:
+    constantes = (IMSS_TASA_MENSUAL, IMSS_IVA_RATE)
+    tabla = _imss_tabla_factores
+    if tabla["constantes"] == constantes:
+        return tabla["plazos"]
+    with _imss_tabla_lock:
+        if tabla["constantes"] != constantes:
+            # Se publica un dict nuevo en vez de mutar el anterior: un lector
+            # concurrente ve la tabla vieja completa o la nueva, nunca mezcla.
+            tabla["plazos"] = {p: _imss_calcular_factores(p) for p in IMSS_PLAZOS_DISPONIBLES}
+            tabla["constantes"] = constantes
+        return tabla["plazos"]
+
+
+def _imss_factores_amortizacion(plazo: int) -> tuple[float, float]:
+    """(g, s) de la forma cerrada del saldo del cotizador.
+
+    Cada mes el saldo hace `saldo -= cuota - interes - interes * IVA`, es
+    decir saldo' = saldo * (1 + i) - cuota con i = tasa * (1 + IVA). Tras
+    `plazo` meses el saldo final es monto * g - cuota * s, con g = (1 + i)^n
+    y s = (g - 1) / i. El factor se arma igual que en el ciclo (tasa + tasa *
+    IVA por separado) para no mover ni un centavo el redondeo."""
+    plazos = _imss_tabla_vigente()
+    factores = plazos.get(plazo)
+    if factores is None:
+        factores = plazos[plazo] = _imss_calcular_factores(plazo)
+    return factores
+
+
+def _imss_monto_maximo_estimado(cuota_max: float, plazo: int) -> float:
+    """Monto maximo analitico (lookup + multiplicacion): cuota_max * s / g.
+
+    NO sustituye a _imss_calcular_monto_maximo en lo que ve el cliente: la
+    biseccion del cotizador se detiene a |cuota - cuota_max| < 0.01, asi que
+    su monto puede diferir de este hasta 0.01 * s / g. Sirve para descartar
+    plazos sin correr la biseccion (ver _imss_primer_plazo_para_monto)."""
+    g, s = _imss_factores_amortizacion(plazo)
+    return cuota_max * s / g
+
+
 def _imss_calcular_cuota(monto: float, plazo: int) -> float:
+    # Misma biseccion y mismo criterio de paro (|saldo| < 0.01) que el
+    # cotizador .jsx; solo cambia como se evalua el saldo final: forma cerrada
+    # O(1) en vez de simular mes a mes. No es identico bit a bit (la forma
+    # cerrada redondea distinto que la suma mes a mes), pero coincide al
+    # centavo con el puerto literal en la rejilla de
+    # tests/test_imss_closed_form_engine.py y en bench/bench_imss_calculadora.py.
+    g, s = _imss_factores_amortizacion(plazo)
+    saldo_sin_pagos = monto * g
     lo, hi = monto / plazo, monto
     for _ in range(120):
         mid = (lo + hi) / 2
-        saldo = monto
-        for _m in range(plazo):
-            interes = saldo * IMSS_TASA_MENSUAL
-            saldo -= mid - interes - interes * IMSS_IVA_RATE
+        saldo = saldo_sin_pagos - mid * s
         if abs(saldo) < 0.01:
             return mid
         if saldo > 0:
@@ -2040,6 +3882,12 @@ def _imss_calcular_cuota(monto: float, plazo: int) -> float:
     return (lo + hi) / 2
 
 def _imss_calcular_monto_maximo(cuota_max: float, plazo: int) -> float:
+    # La inversa sigue siendo la biseccion del cotizador alrededor de
+    # _imss_calcular_cuota. La inversa analitica (cuota_max * s / g, ver
+    # _imss_monto_maximo_estimado) no da las mismas cifras: este criterio de
+    # paro acepta el primer punto medio con |cuota - cuota_max| < 0.01, y en
+    # ~1.3% de una rejilla de 62k pensiones x plazos el monto difiere en mas
+    # de un centavo (hasta ~$0.6). Cada paso interno ya es forma cerrada.
     lo, hi = 0.0, cuota_max * plazo * 2
     for _ in range(120):
         mid = (lo + hi) / 2
@@ -2052,19 +3900,110 @@ def _imss_calcular_monto_maximo(cuota_max: float, plazo: int) -> float:
             lo = mid
     return (lo + hi) / 2
 
-def calcular_propuesta_imss(pension: float, plazo: int = IMSS_PLAZO_MESES) -> dict:
-    cuota_max = pension * IMSS_LIMITE_DESCUENTO
-    monto = _imss_calcular_monto_maximo(cuota_max, plazo)
-    cuota = _imss_calcular_cuota(monto, plazo)
+# ── Memo de propuestas IMSS ───────────────────────────────────────────────────
+# Una misma conversacion recalcula la misma propuesta varias veces (funnel,
+# Flow, cierre, notificacion al asesor) y las pensiones redondas (8000, 10000,
+# 12000) se repiten entre conversaciones. LRU acotado por proceso, con la
+# misma idea de "version" que la tabla de factores: si cambian las
+# constantes financieras, la siguiente consulta vacia el memo completo.
+_IMSS_MEMO_MAX = 2048
+
+
+class _MemoLRU:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key, version):
+        """(True, valor) si hay acierto; (False, None) si no."""
+        with self._lock:
+            if version != self._version:
+                if self._items:
+                    self.invalidations += 1
+                self._items.clear()
+                self._version = version
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return True, self._items[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, version, value) -> None:
+        with self._lock:
+            if version != self._version:
+                return
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._version = None
+            self.hits = self.misses = self.invalidations = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            consultas = self.hits + self.misses
+            return {
+                "size": len(self._items),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / consultas, 4) if consultas else 0.0,
+            }
+
+
+_imss_memo_propuestas = _MemoLRU(_IMSS_MEMO_MAX)
+_imss_memo_plazos = _MemoLRU(_IMSS_MEMO_MAX)
+
+
+def _imss_memo_version() -> tuple:
+    return (IMSS_TASA_MENSUAL, IMSS_IVA_RATE, IMSS_LIMITE_DESCUENTO)
+
+
+def _imss_normalizar_pension(pension: float) -> float:
+    """Pension al centavo: llave del memo y base del calculo. Se calcula con
+    el valor normalizado (no solo se indexa con el) para que un acierto y un
+    fallo del memo devuelvan exactamente las mismas cifras."""
+    return round(float(pension), 2)
+
+
+def _imss_memo_stats() -> dict:
     return {
-        "monto": monto,
-        "cuota": cuota,
-        "total": cuota * plazo,
-        "plazo": plazo,
-        "cuota_max": cuota_max,
+        "propuestas": _imss_memo_propuestas.stats(),
+        "plazos": _imss_memo_plazos.stats(),
     }
 
 
+def calcular_propuesta_imss(pension: float, plazo: int = IMSS_PLAZO_MESES) -> dict:
+    pension = _imss_normalizar_pension(pension)
+    version = _imss_memo_version()
+    hit, propuesta = _imss_memo_propuestas.get((pension, plazo), version)
+    if not hit:
+        cuota_max = pension * IMSS_LIMITE_DESCUENTO
+        monto = _imss_calcular_monto_maximo(cuota_max, plazo)
+        cuota = _imss_calcular_cuota(monto, plazo)
+        propuesta = {
+            "monto": monto,
+            "cuota": cuota,
+            "total": cuota * plazo,
+            "plazo": plazo,
+            "cuota_max": cuota_max,
+        }
+        _imss_memo_propuestas.put((pension, plazo), version, propuesta)
+    # Copia: los call-sites pueden anotar el dict sin ensuciar el memo.
+    return dict(propuesta)
+
+
 def _imss_plazos_texto() -> str:
     """'6, 12, ... 54 y 60 meses' derivado de IMSS_PLAZOS_DISPONIBLES -- la
     lista nunca se escribe literal en una plantilla."""
@@ -2076,12 +4015,30 @@ def _imss_primer_plazo_para_monto(pension: float, monto_objetivo: float):
     """Plazo mas corto de IMSS_PLAZOS_DISPONIBLES cuyo monto maximo estimado
     alcanza `monto_objetivo` con esa pension. Usa la calculadora vigente; no
     hay tabla hardcodeada de montos. Devuelve (plazo, propuesta) o None si
-    ningun plazo disponible lo alcanza."""
-    for p in sorted(IMSS_PLAZOS_DISPONIBLES):
-        propuesta = calcular_propuesta_imss(pension, p)
-        if propuesta["monto"] >= monto_objetivo:
-            return p, propuesta
-    return None
+    ningun plazo disponible lo alcanza.
+
+    Los plazos que ni con la holgura de la biseccion (0.01 de cuota, ver
+    _imss_monto_maximo_estimado) alcanzan el objetivo se descartan con la
+    tabla de factores; la biseccion completa solo corre para los candidatos,
+    que casi siempre son uno. El plazo elegido es el mismo que antes."""
+    pension = _imss_normalizar_pension(pension)
+    version = _imss_memo_version()
+    clave = (pension, monto_objetivo, tuple(IMSS_PLAZOS_DISPONIBLES))
+    hit, encontrado = _imss_memo_plazos.get(clave, version)
+    if not hit:
+        encontrado = None
+        cuota_max = pension * IMSS_LIMITE_DESCUENTO
+        for p in sorted(IMSS_PLAZOS_DISPONIBLES):
+            if _imss_monto_maximo_estimado(cuota_max + 0.02, p) < monto_objetivo:
+                continue
+            propuesta = calcular_propuesta_imss(pension, p)
+            if propuesta["monto"] >= monto_objetivo:
+                encontrado = (p, propuesta)
+                break
+        _imss_memo_plazos.put(clave, version, encontrado)
+    if encontrado is None:
+        return None
+    return encontrado[0], dict(encontrado[1])
 
 
 def _imss_primer_plazo_viable(pension: float):
@@ -2089,6 +4046,163 @@ def _imss_primer_plazo_viable(pension: float):
     return _imss_primer_plazo_para_monto(pension, IMSS_MONTO_MINIMO)
 
 
+# ── Tabla de amortizacion mes a mes (para el asesor) ─────────────────────────
+# Misma recurrencia que el cotizador (ver _imss_factores_amortizacion): el
+# interes del mes sobre saldo insoluto, IVA sobre el interes, y el resto de la
+# cuota va a capital. Es un generador: nada se materializa hasta que alguien
+# itera, asi que puede volcarse directo a CSV/JSONL sin construir la tabla.
+_IMSS_TABLA_CAMPOS = ("mes", "pago", "interes", "iva", "capital", "saldo")
+
+
+def _imss_centavos(x: float) -> float:
+    # +0.0 evita que el residuo final de la biseccion se imprima como -0.00.
+    return round(x, 2) + 0.0
+
+
+def _imss_tabla_amortizacion(monto: float, plazo: int, cuota: float | None = None):
+    """Genera {mes, pago, interes, iva, capital, saldo} para cada mes. Sin
+    `cuota` usa la del cotizador (_imss_calcular_cuota). Cifras sin redondear;
+    el redondeo es cosa del formato de salida."""
+    if cuota is None:
+        cuota = _imss_calcular_cuota(monto, plazo)
+    saldo = monto
+    for mes in range(1, plazo + 1):
+        interes = saldo * IMSS_TASA_MENSUAL
+        iva = interes * IMSS_IVA_RATE
+        capital = cuota - interes - iva
+        saldo -= capital
+        yield {"mes": mes, "pago": cuota, "interes": interes, "iva": iva,
+               "capital": capital, "saldo": saldo}
+
+
+def _imss_tabla_amortizacion_csv(monto: float, plazo: int, cuota: float | None = None):
+    """Lineas CSV (con encabezado y salto de linea), al centavo."""
+    yield ",".join(_IMSS_TABLA_CAMPOS) + "\n"
+    for fila in _imss_tabla_amortizacion(monto, plazo, cuota):
+        yield ",".join([str(fila["mes"])] + [f"{_imss_centavos(fila[c]):.2f}"
+                                             for c in _IMSS_TABLA_CAMPOS[1:]]) + "\n"
+
+
+def _imss_tabla_amortizacion_jsonl(monto: float, plazo: int, cuota: float | None = None):
+    """Un objeto JSON por mes (JSON Lines), al centavo."""
+    for fila in _imss_tabla_amortizacion(monto, plazo, cuota):
+        yield json.dumps({c: (fila[c] if c == "mes" else _imss_centavos(fila[c]))
+                          for c in _IMSS_TABLA_CAMPOS}) + "\n"
+
+
+def _imss_tabla_amortizacion_texto(monto: float, plazo: int, cuota: float | None = None) -> str:
+    """Version compacta para WhatsApp: una linea por mes, sin decimales
+    (~40 caracteres por linea; 60 meses caben holgados en los 4096 de un
+    mensaje de texto)."""
+    lineas = ["Tabla de amortización estimada (mes | pago | interés | IVA | capital | saldo):"]
+    for fila in _imss_tabla_amortizacion(monto, plazo, cuota):
+        lineas.append(
+            f"{fila['mes']:02d} | {fila['pago']:,.0f} | {fila['interes']:,.0f} | "
+            f"{fila['iva']:,.0f} | {fila['capital']:,.0f} | {max(fila['saldo'], 0):,.0f}"
+        )
+    return "\n".join(lineas)
+
+
+# ── Propuestas IMSS en lote (precalificacion de campañas) ────────────────────
+# Replica elemento a elemento la MISMA biseccion de _imss_calcular_cuota /
+# _imss_calcular_monto_maximo, pero sobre arreglos: cada elemento sigue su
+# propio camino lo/hi y se congela en cuanto cumple el criterio de paro. Las
+# operaciones son las mismas sumas/productos IEEE que la version escalar, asi
+# que el resultado es identico, no "aproximadamente igual".
+_IMSS_LOTE_MAX_FILAS = 20000
+
+
+def _imss_factores_lote(plazos):
+    g = np.empty(plazos.shape, dtype=np.float64)
+    s = np.empty(plazos.shape, dtype=np.float64)
+    for plazo in np.unique(plazos):
+        sel = plazos == plazo
+        g[sel], s[sel] = _imss_factores_amortizacion(int(plazo))
+    return g, s
+
+
+def _imss_cuota_lote(montos, plazos, g, s):
+    lo = montos / plazos
+    hi = montos.copy()
+    saldo_sin_pagos = montos * g
+    cuota = np.empty_like(montos)
+    pendiente = np.ones(montos.shape, dtype=bool)
+    for _ in range(120):
+        mid = (lo + hi) / 2
+        saldo = saldo_sin_pagos - mid * s
+        listo = pendiente & (np.abs(saldo) < 0.01)
+        cuota[listo] = mid[listo]
+        pendiente &= ~listo
+        if not pendiente.any():
+            return cuota
+        lo = np.where(pendiente & (saldo > 0), mid, lo)
+        hi = np.where(pendiente & ~(saldo > 0), mid, hi)
+    cuota[pendiente] = ((lo + hi) / 2)[pendiente]
+    return cuota
+
+
+def _imss_monto_maximo_lote(cuotas_max, plazos, g, s):
+    lo = np.zeros_like(cuotas_max)
+    hi = cuotas_max * plazos * 2
+    monto = np.empty_like(cuotas_max)
+    pendiente = np.ones(cuotas_max.shape, dtype=bool)
+    for _ in range(120):
+        mid = (lo + hi) / 2
+        c = np.zeros_like(mid)
+        c[pendiente] = _imss_cuota_lote(mid[pendiente], plazos[pendiente],
+                                        g[pendiente], s[pendiente])
+        listo = pendiente & (np.abs(c - cuotas_max) < 0.01)
+        monto[listo] = mid[listo]
+        pendiente &= ~listo
+        if not pendiente.any():
+            return monto
+        hi = np.where(pendiente & (c > cuotas_max), mid, hi)
+        lo = np.where(pendiente & ~(c > cuotas_max), mid, lo)
+    monto[pendiente] = ((lo + hi) / 2)[pendiente]
+    return monto
+
+
+def calcular_propuestas_imss_lote(pensiones, plazos=None) -> dict:
+    """Version en lote de calcular_propuesta_imss para precalificar listas de
+    leads (cohifis.com, campañas de Meta) antes del primer contacto.
+
+    `pensiones` es una secuencia de pensiones; `plazos` puede omitirse
+    (IMSS_PLAZO_MESES para todas), ser un entero o una secuencia del mismo
+    largo. Devuelve un dict con las mismas llaves que la version escalar
+    ("monto", "cuota", "total", "plazo", "cuota_max"), cada una con un arreglo
+    alineado a `pensiones`. Cada posicion es identica a
+    calcular_propuesta_imss(pensiones[i], plazos[i]).
+
+    Sin numpy cae al calculo escalar elemento por elemento y devuelve listas.
+    """
+    if plazos is None:
+        plazos = IMSS_PLAZO_MESES
+    # Misma normalizacion al centavo que calcular_propuesta_imss, en Python y
+    # no con np.round (que no redondea igual en todos los casos).
+    pensiones = [_imss_normalizar_pension(p) for p in pensiones]
+    if not _numpy_libs:
+        plazos = list(plazos) if isinstance(plazos, (list, tuple)) else [plazos] * len(pensiones)
+        if len(plazos) != len(pensiones):
+            raise ValueError("pensiones y plazos deben tener el mismo largo")
+        propuestas = [calcular_propuesta_imss(p, n) for p, n in zip(pensiones, plazos)]
+        return {k: [pr[k] for pr in propuestas]
+                for k in ("monto", "cuota", "total", "plazo", "cuota_max")}
+
+    pensiones = np.asarray(pensiones, dtype=np.float64)
+    plazos = np.broadcast_to(np.asarray(plazos, dtype=np.int64), pensiones.shape).copy()
+    g, s = _imss_factores_lote(plazos)
+    cuotas_max = pensiones * IMSS_LIMITE_DESCUENTO
+    montos = _imss_monto_maximo_lote(cuotas_max, plazos, g, s)
+    cuotas = _imss_cuota_lote(montos, plazos, g, s)
+    return {
+        "monto": montos,
+        "cuota": cuotas,
+        "total": cuotas * plazos,
+        "plazo": plazos,
+        "cuota_max": cuotas_max,
+    }
+
+
 # ── Propuesta activa: la ULTIMA propuesta valida que el cliente vio ────────────
 # Fuente unica para el cierre, la notificacion principal al asesor y cualquier
 # resumen posterior. Los campos propuesta_* originales se conservan intactos
@@ -2454,6 +4568,8 @@ def _imss_build_closing_statement(data: dict) -> str:
 
 
 def _imss_build_advisor_notification(phone: str, data: dict) -> str:
+    """Alerta al asesor con la propuesta ACTIVA. La tabla de amortizacion va
+    aparte (_imss_advisor_tabla_seguimiento)."""
     lines = ["📣 PROSPECTO IMSS CALIFICADO — LLAMAR", "",
              "Producto: Préstamo IMSS pensionados"]
     if data.get("nombre"):
@@ -2501,6 +4617,41 @@ def _imss_build_advisor_notification(phone: str, data: dict) -> str:
     return "\n".join(lines)
 
 
+def _imss_advisor_tabla_seguimiento(phone: str, data: dict) -> bool:
+    """Con IMSS_ADVISOR_SCHEDULE_ENABLED, manda la tabla de amortizacion de la
+    propuesta activa como mensaje aparte, despues de la alerta.
+
+    Solo por texto libre y con la ventana de 24h abierta: son ~2400
+    caracteres y el parametro de un template (_TPL_PARAM_LIMIT) la cortaria
+    junto con el resto de la alerta. Tampoco se liga al wamid para el
+    reenvio por `failed`, que la mandaria por template. Es un complemento:
+    si no sale, la alerta ya tiene monto, cuota y plazo.
+    """
+    if not IMSS_ADVISOR_SCHEDULE_ENABLED:
+        return False
+    monto_activo, cuota_activa, plazo_activo = _imss_get_propuesta_activa(data)
+    if not (monto_activo and cuota_activa and plazo_activo):
+        return False
+    ventana = _advisor_window_state()
+    if ventana != "open":
+        log.info("imss_tabla_asesor_omitida: ventana=%s phone_last4=%s",
+                 ventana, _digits(phone)[-4:])
+        return False
+    texto = (f"WhatsApp: {phone}\n"
+             + _imss_tabla_amortizacion_texto(float(monto_activo), int(plazo_activo),
+                                              float(cuota_activa)))
+    try:
+        r = _wa_post({"messaging_product": "whatsapp", "to": ADVISOR_NUM,
+                      "type": "text", "text": {"body": texto}})
+    except Exception:
+        log.exception("💥 imss_tabla_asesor")
+        return False
+    ok = r.status_code in (200, 201)
+    _log(ADVISOR_NUM, "Asesor", texto, "saliente", "asesor",
+         "ok" if ok else "error", "" if ok else r.text[:200], _mid())
+    return ok
+
+
 def _imss_report_lead_qualified(phone: str, data: dict) -> None:
     """Actualiza el reporte compacto de leads en el momento de calificacion
     (nombre + ciudad ya capturados). Usa la propuesta ACTIVA, igual que la
@@ -2598,68 +4749,472 @@ def _imss_send_ley73_menu(phone: str) -> bool:
     )
 
 
-def _imss_send_revision_cta(phone: str) -> bool:
-    """CTA 1/2 de revision (pantalla inicial, justo despues de la propuesta/
-    VRIM). Intenta Reply Buttons primero; si el envio interactivo falla,
-    cae al mismo texto _IMSS_REVISION_CTA_FALLBACK que ya se usaba como
-    respaldo antes de que existiera esta funcion -- nunca deja al prospecto
-    sin un CTA que responder."""
-    if send_interactive_buttons(phone, _IMSS_REVISION_CTA_QUESTION, _IMSS_REVISION_CTA_BUTTONS):
-        return True
-    return send_msg(phone, _IMSS_REVISION_CTA_FALLBACK)
+def _imss_send_revision_cta(phone: str) -> bool:
+    """CTA 1/2 de revision (pantalla inicial, justo despues de la propuesta/
+    VRIM). Intenta Reply Buttons primero; si el envio interactivo falla,
+    cae al mismo texto _IMSS_REVISION_CTA_FALLBACK que ya se usaba como
+    respaldo antes de que existiera esta funcion -- nunca deja al prospecto
+    sin un CTA que responder."""
+    if send_interactive_buttons(phone, _IMSS_REVISION_CTA_QUESTION, _IMSS_REVISION_CTA_BUTTONS):
+        return True
+    return send_msg(phone, _IMSS_REVISION_CTA_FALLBACK)
+
+
+def _imss_send_si_no(phone: str, body_text: str) -> bool:
+    """Pregunta cerrada sí/no del funnel IMSS. Los ids "si"/"no" son los
+    mismos tokens que yes_no() ya reconoce nativamente. Con fallback a
+    texto plano si el envio interactivo falla."""
+    if send_interactive_buttons(phone, body_text, [("si", "Sí"), ("no", "No")]):
+        return True
+    return send_msg(phone, body_text)
+
+
+# ── Handlers de negocio del Flow dinamico IMSS (endpoint /ext/flow/imss) ──────
+# Cada handler recibe (phone, data_del_paso, flow_token) y devuelve el dict de
+# respuesta YA CONSTRUIDO (imss_flow.build_next_screen_response/
+# build_success_response), SIN cifrar -- el cifrado ocurre una sola vez, en el
+# route de Flask. Ninguno de estos handlers calcula la propuesta: siempre
+# delegan a calcular_propuesta_imss(), la misma funcion que usa el funnel de
+# texto.
+#
+# IDEMPOTENCIA: Meta puede reintentar cualquier data_exchange (timeout de su
+# lado, doble tap). Las mutaciones de user_data/user_state son idempotentes
+# por naturaleza (escriben el mismo valor), pero los mensajes salientes NO lo
+# son. Por eso TODA notificacion al asesor pasa por _imss_flow_notify_once(),
+# no solo la del paso final.
+#
+# SESION: todo lo que el Flow necesita recordar de un flow_token vive en UN
+# registro, imss_flow_session:<token> = {"phone", "pasos", "marcas"}. Antes
+# eran una clave imss_flow_token:<token> mas una clave por cada marca de
+# dedupe, cada una con su propio viaje a Redis y su propio TTL. El endpoint lo
+# lee una vez por solicitud (_tl.imss_flow_sesion) y cada marca se escribe con
+# aux_update, asi que las marcas se leen y persisten como grupo.
+def _imss_flow_sesion_key(flow_token: str) -> str:
+    return f"imss_flow_session:{flow_token}"
+
+
+def _imss_flow_sesion_crear(flow_token: str, phone: str) -> bool:
+    sesion = {"phone": phone, "pasos": [], "marcas": {}}
+    return _state_store.aux_set(_imss_flow_sesion_key(flow_token),
+                                json.dumps(sesion, ensure_ascii=False), _IMSS_FLOW_TOKEN_TTL)
+
+
+def _imss_flow_sesion_decodificar(raw):
+    try:
+        sesion = json.loads(raw) if raw else None
+    except Exception:
+        return None
+    if not isinstance(sesion, dict):
+        return None
+    sesion.setdefault("phone", "")
+    sesion.setdefault("pasos", [])
+    sesion.setdefault("marcas", {})
+    return sesion
+
+
+def _imss_flow_sesion_legado(flow_token: str):
+    # Flows enviados antes del registro unico (imss_flow_token:<token>). Solo
+    # se recupera el telefono; se puede retirar una vez vencido
+    # _IMSS_FLOW_TOKEN_TTL desde el despliegue.
+    phone = _state_store.aux_get(f"imss_flow_token:{flow_token}")
+    return {"phone": phone, "pasos": [], "marcas": {}} if phone else None
+
+
+def _imss_flow_sesion(flow_token: str):
+    """Registro de la sesion (o None si expiro / nunca existio). Dentro de una
+    solicitud del endpoint se sirve del que ya se leyo; fuera (trabajo de
+    segundo plano, tests de handlers) se lee del store."""
+    actual = getattr(_tl, "imss_flow_sesion", None)
+    if actual and actual[0] == flow_token:
+        return actual[1]
+    return (_imss_flow_sesion_decodificar(_state_store.aux_get(_imss_flow_sesion_key(flow_token)))
+            or _imss_flow_sesion_legado(flow_token))
+
+
+def _imss_flow_sesion_actualizar(flow_token: str, cambio) -> bool:
+    """Aplica `cambio(sesion)` de forma atomica sobre el registro persistido y
+    refleja el resultado en el de la solicitud en curso."""
+    resultado = {}
+
+    def aplicar(raw):
+        sesion = (_imss_flow_sesion_decodificar(raw) or _imss_flow_sesion_legado(flow_token)
+                  or {"phone": "", "pasos": [], "marcas": {}})
+        cambio(sesion)
+        resultado["sesion"] = sesion
+        return json.dumps(sesion, ensure_ascii=False)
+
+    ok = _state_store.aux_update(_imss_flow_sesion_key(flow_token), aplicar, _IMSS_FLOW_TOKEN_TTL)
+    actual = getattr(_tl, "imss_flow_sesion", None)
+    if actual and actual[0] == flow_token:
+        cambio(actual[1])
+    return ok
+
+
+def _imss_flow_tiene_marca(flow_token: str, marca: str) -> bool:
+    sesion = _imss_flow_sesion(flow_token)
+    return bool(sesion and sesion["marcas"].get(marca))
+
+
+def _imss_flow_registrar_solicitud(flow_token: str, screen: str, paso_valido: bool) -> None:
+    """Una sola escritura por solicitud atendida: cuenta la solicitud (ver
+    cache de respuestas) y, si la pantalla se completo, registra el paso."""
+    def cambio(s):
+        s["solicitudes"] = int(s.get("solicitudes") or 0) + 1
+        if paso_valido and screen not in s["pasos"]:
+            s["pasos"].append(screen)
+
+    _imss_flow_sesion_actualizar(flow_token, cambio)
+
+
+def _imss_flow_marcar(flow_token: str, marca: str) -> bool:
+    """Marca un efecto del Flow en la sesion y REPORTA si el store la acepto.
+
+    Existe para que ningun guardrail vuelva a ignorar el bool de aux_set():
+    ese descuido ya produjo dos defectos reales en este mismo modulo. Aqui el
+    efecto asociado (notificar, dar de alta, cerrar) YA ocurrio y no se puede
+    deshacer, asi que un write fallido no se puede "arreglar" -- pero si se
+    deja registrado con un motivo propio, para que un reintento duplicado en
+    produccion sea diagnosticable en vez de inexplicable. La deduplicacion es
+    best-effort mientras el store este caido; el log lo dice explicitamente."""
+    if _imss_flow_sesion_actualizar(flow_token, lambda s: s["marcas"].__setitem__(marca, 1)):
+        return True
+    log.error("imss_flow_marca_no_persistida marca=%s "
+              "(dedupe degradado: un reintento de Meta podria duplicar este efecto)", marca)
+    return False
+
+
+def _imss_flow_notify_once(flow_token: str, marca: str, message: str) -> bool:
+    """notify_advisor() deduplicado por marca de sesion. Solo marca si el
+    envio tuvo exito: si fallo, un reintento posterior de Meta si debe volver
+    a intentarlo. Devuelve True si el asesor ya tiene el dato (ahora o
+    porque ya se le habia notificado antes)."""
+    if _imss_flow_tiene_marca(flow_token, marca):
+        return True
+    with _imss_flow_span("asesor"):
+        ok = notify_advisor(message)
+    if ok:
+        _imss_flow_marcar(flow_token, marca)
+    else:
+        _imss_flow_requiere_reintento()
+    return ok
+
+
+# ── Cache de respuestas del Flow (reintentos de Meta) ────────────────────────
+# Meta reintenta /ext/flow/imss cuando la respuesta tarda. Sin cache, cada
+# reintento volvia a correr el handler completo: recalcular, reescribir
+# user_data, consultar las claves de dedupe. Se guarda la respuesta EN CLARO
+# por (flow_token, pantalla, solicitudes, hash del payload descifrado); el
+# reintento trae llave AES/IV nuevos, asi que solo se vuelve a cifrar con esos.
+#
+# Meta no manda nonce ni secuencia en data_exchange. `solicitudes` es el
+# contador de solicitudes atendidas de la sesion (_imss_flow_registrar_solicitud):
+# la respuesta se guarda con el valor que deja esta solicitud, asi que solo la
+# encuentra un reintento que llega SIN otra solicitud de por medio. Si el
+# usuario avanza y vuelve a la misma pantalla con los mismos datos, el
+# contador ya cambio y el handler corre de nuevo (user_state/user_data se
+# reinician como la primera vez). El TTL es corto: los reintentos de Meta
+# llegan en segundos.
+#
+# Solo se guarda si el handler termino TODOS sus efectos sincronos. Si alguno
+# fallo (asesor no notificado, cierre no entregado), el handler lo senala
+# con _imss_flow_requiere_reintento() y la respuesta no se cachea: el
+# reintento de Meta DEBE volver a intentarlo, exactamente como antes de este
+# cache.
+_IMSS_FLOW_REPLAY_TTL = 60
+_imss_flow_replay_stats = {"hits": 0, "misses": 0, "stored": 0, "not_stored_retryable": 0}
+_imss_flow_replay_lock = threading.Lock()
+
+
+def _imss_flow_requiere_reintento() -> None:
+    _tl.imss_flow_reintentable = True
+
+
+def _imss_flow_replay_count(campo: str) -> None:
+    with _imss_flow_replay_lock:
+        _imss_flow_replay_stats[campo] += 1
+
+
+def _imss_flow_replay_key(flow_token: str, screen: str, payload: dict, solicitudes: int) -> str:
+    huella = hashlib.sha256(
+        json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:32]
+    return f"imss_flow_resp:{flow_token}:{screen}:{solicitudes}:{huella}"
+
+
+def _imss_flow_replay_marcar_reintentable(key: str) -> None:
+    """Un efecto diferido fallo despues de responder: la respuesta de esta
+    solicitud ya no debe servirse desde cache (ni guardarse si aun no se
+    guardo), para que el reintento de Meta vuelva a correr el handler."""
+    _state_store.aux_set(f"{key}:reintentar", "1", _IMSS_FLOW_REPLAY_TTL)
+
+
+def _imss_flow_replay_get(key: str):
+    raw = None if _state_store.aux_get(f"{key}:reintentar") else _state_store.aux_get(key)
+    if raw is not None:
+        try:
+            response = json.loads(raw)
+            if isinstance(response, dict):
+                _imss_flow_replay_count("hits")
+                return response
+        except Exception:
+            pass
+    _imss_flow_replay_count("misses")
+    return None
+
+
+def _imss_flow_replay_put(key: str, response: dict) -> None:
+    if _state_store.aux_get(f"{key}:reintentar"):
+        _imss_flow_replay_count("not_stored_retryable")
+        return
+    if _state_store.aux_set(key, json.dumps(response, ensure_ascii=False), _IMSS_FLOW_REPLAY_TTL):
+        _imss_flow_replay_count("stored")
+
+
+def _imss_flow_replay_stats_snapshot() -> dict:
+    with _imss_flow_replay_lock:
+        return dict(_imss_flow_replay_stats)
+
+
+# ── Latencia del Flow: spans por fase + histogramas ──────────────────────────
+# Cada solicitud acumula milisegundos por fase en _tl.imss_flow_spans
+# (descifrado, store, calculo, sheets, asesor, whatsapp, boardroom, cifrado) y
+# al terminar se vuelcan a un histograma por "pantalla:fase". Asi se ve en
+# /ext/metrics de donde sale la lentitud de cada pantalla, no solo el total.
+_imss_flow_latencias: dict = {}
+_imss_flow_presupuesto = {"deadline_exceeded": 0, "deferred": 0}
+_imss_flow_latencia_lock = threading.Lock()
+
+
+@contextmanager
+def _imss_flow_span(fase: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        spans = getattr(_tl, "imss_flow_spans", None)
+        if spans is not None:
+            spans[fase] = spans.get(fase, 0.0) + (time.perf_counter() - t0) * 1000
+
+
+def _imss_flow_transcurrido_ms() -> float:
+    t0 = getattr(_tl, "imss_flow_t0", None)
+    return 0.0 if t0 is None else (time.perf_counter() - t0) * 1000
+
+
+def _imss_flow_cerca_del_limite() -> bool:
+    return _imss_flow_transcurrido_ms() >= IMSS_FLOW_DEADLINE_MS * _IMSS_FLOW_DIFERIR_FRACCION
+
+
+def _imss_flow_efecto(fase: str, fn, *args, **kwargs) -> None:
+    """Corre un efecto NO esencial de un handler del Flow (alerta al asesor,
+    reporte en Sheets). Si la solicitud ya consumio la mitad de su presupuesto
+    se manda a un hilo: el prospecto no ve ese efecto, pero si ve la pantalla
+    de error de Meta si la respuesta llega tarde. Cada efecto diferido conserva
+    su propio dedupe (_imss_flow_notify_once marca solo tras exito)."""
+    if _imss_flow_cerca_del_limite():
+        log.warning("flow_imss_efecto_diferido fase=%s transcurrido_ms=%.1f",
+                    fase, _imss_flow_transcurrido_ms())
+        with _imss_flow_latencia_lock:
+            _imss_flow_presupuesto["deferred"] += 1
+        clave = getattr(_tl, "imss_flow_replay_clave", None)
+        threading.Thread(target=_imss_flow_efecto_diferido, args=(clave, fn) + tuple(args),
+                         kwargs=kwargs, daemon=True).start()
+        return
+    with _imss_flow_span(fase):
+        fn(*args, **kwargs)
+
+
+def _imss_flow_efecto_diferido(clave, fn, *args, **kwargs) -> None:
+    """Cuerpo del hilo de un efecto diferido. _imss_flow_requiere_reintento()
+    marca el thread-local de ESTE hilo, que la solicitud ya no ve; si el
+    efecto lo pidio, la marca se pasa a la cache de respuestas por su clave."""
+    _tl.imss_flow_reintentable = False
+    try:
+        fn(*args, **kwargs)
+    finally:
+        if getattr(_tl, "imss_flow_reintentable", False) and clave:
+            log.warning("flow_imss_efecto_diferido_fallido: la respuesta no se servira desde cache")
+            _imss_flow_replay_marcar_reintentable(clave)
+        _tl.imss_flow_reintentable = False
+
+
+def _imss_flow_registrar_latencias(etiqueta: str, spans: dict, total_ms: float) -> None:
+    with _imss_flow_latencia_lock:
+        for fase, ms in list(spans.items()) + [("total", total_ms)]:
+            clave = f"{etiqueta}:{fase}"
+            if clave not in _imss_flow_latencias:
+                _imss_flow_latencias[clave] = _LatenciaHistograma()
+            _imss_flow_latencias[clave].observe(ms)
+        if total_ms > IMSS_FLOW_DEADLINE_MS:
+            _imss_flow_presupuesto["deadline_exceeded"] += 1
+    if total_ms > IMSS_FLOW_DEADLINE_MS:
+        log.warning("flow_imss_deadline_excedido pantalla=%s total_ms=%.1f deadline_ms=%s",
+                    etiqueta, total_ms, IMSS_FLOW_DEADLINE_MS)
+    log.info("flow_imss_latency pantalla=%s total_ms=%.1f %s", etiqueta, total_ms,
+             " ".join(f"{f}_ms={ms:.1f}" for f, ms in spans.items()))
+
+
+def _imss_flow_latency_stats() -> dict:
+    with _imss_flow_latencia_lock:
+        return {
+            "deadline_ms": IMSS_FLOW_DEADLINE_MS,
+            **_imss_flow_presupuesto,
+            "histogramas": {k: h.snapshot() for k, h in sorted(_imss_flow_latencias.items())},
+        }
+
+
+# ── Trabajo durable de efectos del HANDOFF ───────────────────────────────────
+# notify_advisor() (uno o dos viajes a Meta, timeout de 15s), el reporte en
+# Sheets y el alta en Boardroom ya no corren dentro de la respuesta del Flow.
+# El handoff solo escribe un registro imss_flow_job:<token> con los efectos
+# pendientes y lo lanza en un hilo; la respuesta cifrada sale enseguida.
+#
+# Durable: el registro vive en el aux store (Redis cuando hay) y su token en
+# el indice imss_flow_jobs, asi que un reinicio lo retoma en el arranque
+# (_imss_flow_jobs_reanudar). Cada efecto conserva EXACTAMENTE su dedupe de
+# siempre: asesor via _imss_flow_notify_once (marca solo tras exito) y
+# Boardroom via la marca "boardroom" de la sesion (solo tras alta confirmada).
+# Un efecto fallido se reintenta con backoff. Un reintento de Meta sobre el
+# mismo handoff NO llega al trabajo: la cache de respuestas lo contesta antes
+# de correr el handler, asi que el backoff es el unico camino de reintento.
+_IMSS_FLOW_JOB_TTL = 24 * 60 * 60
+_IMSS_FLOW_JOB_INDICE = "imss_flow_jobs"
+_IMSS_FLOW_JOB_BACKOFF_S = (10, 60, 300, 900)
+_IMSS_FLOW_JOB_EFECTOS = ("asesor", "sheets", "boardroom")
+_imss_flow_jobs_en_curso: set = set()
+_imss_flow_jobs_lock = threading.Lock()
+
+
+def _imss_flow_job_guardar(job: dict) -> bool:
+    return _state_store.aux_set(f"imss_flow_job:{job['flow_token']}",
+                                json.dumps(job, ensure_ascii=False), _IMSS_FLOW_JOB_TTL)
+
+
+def _imss_flow_job_cargar(flow_token: str):
+    raw = _state_store.aux_get(f"imss_flow_job:{flow_token}")
+    if not raw:
+        return None
+    try:
+        job = json.loads(raw)
+        return job if isinstance(job, dict) else None
+    except Exception:
+        return None
+
+
+def _imss_flow_job_encolar(phone: str, flow_token: str, data: dict) -> None:
+    """Registra (una sola vez por token) los efectos del handoff y los lanza.
+    Si el registro ya existe -- reintento de Meta -- no se reescribe: solo se
+    vuelve a intentar lo que siga pendiente."""
+    job = _imss_flow_job_cargar(flow_token)
+    if job is None:
+        job = {
+            "phone": phone,
+            "flow_token": flow_token,
+            "mensaje_asesor": _imss_build_advisor_notification(phone, data),
+            "data": data,
+            "pendientes": list(_IMSS_FLOW_JOB_EFECTOS),
+            "intentos": 0,
+            "respaldo": False,
+        }
+        if not _imss_flow_job_guardar(job) or \
+                not _state_store.aux_sadd(_IMSS_FLOW_JOB_INDICE, flow_token, _IMSS_FLOW_JOB_TTL):
+            log.error("imss_flow_job_no_persistido phone_last4=%s "
+                      "(los efectos corren igual, pero sin recuperacion tras reinicio)",
+                      _digits(phone)[-4:])
+    if not job["pendientes"]:
+        return
+    threading.Thread(target=_imss_flow_job_correr, args=(flow_token, job), daemon=True).start()
+
+
+def _imss_flow_job_efecto(job: dict, efecto: str) -> bool:
+    phone, flow_token = job["phone"], job["flow_token"]
+    if efecto == "asesor":
+        ok = _imss_flow_notify_once(flow_token, "notif:handoff", job["mensaje_asesor"])
+        actual = _ensure_user(phone)
+        actual["advisor_notify_ok"] = ok
+        user_data[phone] = actual
+        if ok:
+            _lead_indice_marcar(phone, "asesor", "prestamo_imss_ley73", "imss_flow")
+            _imss_advisor_tabla_seguimiento(phone, job["data"])
+        if not ok and not job["respaldo"]:
+            _imss_log_lead_backup(phone, {**job["data"], "advisor_notify_ok": False})
+            job["respaldo"] = True
+        return ok
+    if efecto == "sheets":
+        _imss_report_lead_qualified(phone, job["data"])
+        return True
+    if efecto == "boardroom":
+        if _imss_flow_tiene_marca(flow_token, "boardroom"):
+            return True
+        if _notify_boardroom_lead_qualified(phone, "prestamo_imss_ley73", _ensure_user(phone)):
+            _imss_flow_marcar(flow_token, "boardroom")
+            _lead_indice_marcar(phone, "boardroom", "prestamo_imss_ley73", "imss_flow")
+            return True
+        return False
+    return True
+
+
+def _imss_flow_job_correr(flow_token: str, job: dict = None) -> None:
+    with _imss_flow_jobs_lock:
+        if flow_token in _imss_flow_jobs_en_curso:
+            return
+        _imss_flow_jobs_en_curso.add(flow_token)
+    try:
+        job = _imss_flow_job_cargar(flow_token) or job
+        if not job or not job.get("pendientes"):
+            _state_store.aux_srem(_IMSS_FLOW_JOB_INDICE, flow_token)
+            return
+        pendientes = []
+        for efecto in job["pendientes"]:
+            try:
+                ok = _imss_flow_job_efecto(job, efecto)
+            except Exception:
+                log.exception("imss_flow_job_efecto_error efecto=%s", efecto)
+                ok = False
+            if not ok:
+                pendientes.append(efecto)
+        job["pendientes"] = pendientes
+        job["intentos"] = job.get("intentos", 0) + 1
+        _imss_flow_job_guardar(job)
+        if not pendientes:
+            _state_store.aux_srem(_IMSS_FLOW_JOB_INDICE, flow_token)
+            return
+        if job["intentos"] > len(_IMSS_FLOW_JOB_BACKOFF_S):
+            log.error("imss_flow_job_agotado phone_last4=%s pendientes=%s",
+                      _digits(job["phone"])[-4:], ",".join(pendientes))
+            _imss_log_lead_backup(job["phone"], job["data"], resultado="flow_job_agotado")
+            _state_store.aux_srem(_IMSS_FLOW_JOB_INDICE, flow_token)
+            return
+        espera = _IMSS_FLOW_JOB_BACKOFF_S[job["intentos"] - 1]
+        log.warning("imss_flow_job_reintento phone_last4=%s pendientes=%s en_s=%s",
+                    _digits(job["phone"])[-4:], ",".join(pendientes), espera)
+        _imss_flow_job_programar(flow_token, espera)
+    finally:
+        with _imss_flow_jobs_lock:
+            _imss_flow_jobs_en_curso.discard(flow_token)
 
 
-def _imss_send_si_no(phone: str, body_text: str) -> bool:
-    """Pregunta cerrada sí/no del funnel IMSS. Los ids "si"/"no" son los
-    mismos tokens que yes_no() ya reconoce nativamente. Con fallback a
-    texto plano si el envio interactivo falla."""
-    if send_interactive_buttons(phone, body_text, [("si", "Sí"), ("no", "No")]):
-        return True
-    return send_msg(phone, body_text)
+def _imss_flow_job_programar(flow_token: str, espera_s: float) -> None:
+    _programador_agendar("imss_flow_job", flow_token, espera_s)
 
 
-# ── Handlers de negocio del Flow dinamico IMSS (endpoint /ext/flow/imss) ──────
-# Cada handler recibe (phone, data_del_paso, flow_token) y devuelve el dict de
-# respuesta YA CONSTRUIDO (imss_flow.build_next_screen_response/
-# build_success_response), SIN cifrar -- el cifrado ocurre una sola vez, en el
-# route de Flask. Ninguno de estos handlers calcula la propuesta: siempre
-# delegan a calcular_propuesta_imss(), la misma funcion que usa el funnel de
-# texto.
-#
-# IDEMPOTENCIA: Meta puede reintentar cualquier data_exchange (timeout de su
-# lado, doble tap). Las mutaciones de user_data/user_state son idempotentes
-# por naturaleza (escriben el mismo valor), pero los mensajes salientes NO lo
-# son. Por eso TODA notificacion al asesor pasa por _imss_flow_notify_once(),
-# no solo la del paso final.
-def _imss_flow_marcar(clave: str) -> bool:
-    """Marca una clave de control del Flow y REPORTA si el store la acepto.
+_programador_registrar("imss_flow_job", lambda flow_token: _imss_flow_job_correr(flow_token))
 
-    Existe para que ningun guardrail vuelva a ignorar el bool de aux_set():
-    ese descuido ya produjo dos defectos reales en este mismo modulo. Aqui el
-    efecto asociado (notificar, dar de alta, cerrar) YA ocurrio y no se puede
-    deshacer, asi que un write fallido no se puede "arreglar" -- pero si se
-    deja registrado con un motivo propio, para que un reintento duplicado en
-    produccion sea diagnosticable en vez de inexplicable. La deduplicacion es
-    best-effort mientras el store este caido; el log lo dice explicitamente."""
-    if _state_store.aux_set(clave, "1", _IMSS_FLOW_TOKEN_TTL):
-        return True
-    log.error("imss_flow_marca_no_persistida clave=%s "
-              "(dedupe degradado: un reintento de Meta podria duplicar este efecto)",
-              clave.rsplit(":", 1)[-1])
-    return False
 
+def _imss_flow_jobs_reanudar() -> None:
+    """Arranque: retoma los handoffs cuyos efectos quedaron pendientes cuando
+    el proceso anterior se detuvo."""
+    pendientes = _state_store.aux_smembers(_IMSS_FLOW_JOB_INDICE)
+    for flow_token in pendientes:
+        _imss_flow_job_programar(flow_token, 0)
+    if pendientes:
+        log.info("imss_flow_jobs_reanudados total=%s", len(pendientes))
 
-def _imss_flow_notify_once(dedupe_key: str, message: str) -> bool:
-    """notify_advisor() deduplicado por clave. Solo marca la clave si el
-    envio tuvo exito: si fallo, un reintento posterior de Meta si debe volver
-    a intentarlo. Devuelve True si el asesor ya tiene el dato (ahora o
-    porque ya se le habia notificado antes)."""
-    if _state_store.aux_get(dedupe_key):
-        return True
-    ok = notify_advisor(message)
-    if ok:
-        _imss_flow_marcar(dedupe_key)
-    return ok
+
+def _imss_flow_jobs_stats() -> dict:
+    with _imss_flow_jobs_lock:
+        en_curso = len(_imss_flow_jobs_en_curso)
+    return {"pendientes": len(_state_store.aux_smembers(_IMSS_FLOW_JOB_INDICE)),
+            "en_curso": en_curso}
 
 
 def _imss_flow_handle_profile(phone: str, step_data: dict, flow_token: str) -> dict:
@@ -2673,7 +5228,7 @@ def _imss_flow_handle_profile(phone: str, step_data: dict, flow_token: str) -> d
 
     if profile == "3":
         _imss_flow_notify_once(
-            f"imss_flow_notif:{flow_token}:perfil3",
+            flow_token, "notif:perfil3",
             f"📣 INTERÉS FUTURO – IMSS (por pensionarse)\nWhatsApp: {phone}")
         user_data[phone] = data
         user_state[phone] = "imss_q_ley73"
@@ -2696,7 +5251,8 @@ def _imss_flow_handle_pension(phone: str, step_data: dict, flow_token: str) -> d
             error_message="Indica tu pensión mensual, por ejemplo: 12000.",
         )
 
-    propuesta = calcular_propuesta_imss(pension)
+    with _imss_flow_span("calculo"):
+        propuesta = calcular_propuesta_imss(pension)
     data = _ensure_user(phone)
     data["pension"] = pension
 
@@ -2729,8 +5285,9 @@ def _imss_flow_handle_pension(phone: str, step_data: dict, flow_token: str) -> d
     # la pantalla de pension y escribe otra cantidad (routing_model permite
     # IMSS_HANDOFF -> IMSS_PENSION), esa si es una propuesta distinta y el
     # asesor tiene que enterarse.
-    _imss_flow_notify_once(
-        f"imss_flow_notif:{flow_token}:pension:{pension:.0f}",
+    _imss_flow_efecto(
+        "asesor", _imss_flow_notify_once,
+        flow_token, f"notif:pension:{pension:.0f}",
         "📊 PROPUESTA CALCULADA – IMSS Ley 73 (pendiente de confirmar, Flow dinámico)\n"
         f"WhatsApp: {phone}\n"
         f"Pensión: ${pension:,.0f}\n"
@@ -2738,7 +5295,8 @@ def _imss_flow_handle_pension(phone: str, step_data: dict, flow_token: str) -> d
         f"{propuesta['plazo']} meses\n"
         "Aún no confirma contacto — puede requerir seguimiento si abandona el Flow."
     )
-    _report_upsert_lead(
+    _imss_flow_efecto(
+        "sheets", _report_upsert_lead,
         phone, producto="IMSS pensionados", pension=f"${pension:,.0f}",
         monto=f"${propuesta['monto']:,.0f}", cuota=f"${propuesta['cuota']:,.0f}",
         plazo=f"{propuesta['plazo']} meses", estado="Propuesta calculada")
@@ -2784,8 +5342,7 @@ def _imss_flow_handle_handoff(phone: str, step_data: dict, flow_token: str) -> d
     # empezar: marcarla antes significaria "empece a procesar", no "termine",
     # y un reintento tras un fallo a mitad de camino devolveria "duplicado"
     # dejando al prospecto sin el mensaje de cierre que nunca recibio.
-    completado_key = f"imss_flow_handoff_completado:{flow_token}"
-    if _state_store.aux_get(completado_key):
+    if _imss_flow_tiene_marca(flow_token, "handoff_completado"):
         return imss_flow.build_success_response(flow_token, {"resultado": "duplicado"})
 
     data = _ensure_user(phone)
@@ -2803,33 +5360,23 @@ def _imss_flow_handle_handoff(phone: str, step_data: dict, flow_token: str) -> d
     # El cierre es el efecto que decide si el prospecto queda o no colgado:
     # sin el, queda en imss_q_horario_calc esperando una pregunta que nunca
     # vio. Por eso su resultado gobierna si el paso se marca completado.
-    cierre_entregado = send_msg(phone, _imss_build_closing_statement(data))
-    if data.get("vrim_preeligible") and not data.get("vrim_offered"):
-        if send_msg(phone, _IMSS_VRIM_PROMO_MESSAGE):
-            data["vrim_offered"] = True
-            data["vrim_offer_timestamp"] = datetime.now(timezone.utc).isoformat()
-            user_data[phone] = data
+    with _imss_flow_span("whatsapp"):
+        cierre_entregado = send_msg(phone, _imss_build_closing_statement(data))
+        if data.get("vrim_preeligible") and not data.get("vrim_offered"):
+            if send_msg(phone, _IMSS_VRIM_PROMO_MESSAGE):
+                data["vrim_offered"] = True
+                data["vrim_offer_timestamp"] = datetime.now(timezone.utc).isoformat()
+                user_data[phone] = data
 
-    # Notificacion y alta en Boardroom con dedupe propio: si el cierre fallo
-    # y Meta reintenta, el prospecto vuelve a recibir el mensaje pero el
-    # asesor NO recibe la ficha dos veces.
-    advisor_notify_ok = _imss_flow_notify_once(
-        f"imss_flow_notif:{flow_token}:handoff",
-        _imss_build_advisor_notification(phone, data))
-    data["advisor_notify_ok"] = advisor_notify_ok
-    user_data[phone] = data
-    if not advisor_notify_ok:
-        _imss_log_lead_backup(phone, data)
-    _imss_report_lead_qualified(phone, data)
-
-    # Solo se marca tras un alta CONFIRMADA por Boardroom. _notify_boardroom_
-    # lead_qualified() absorbe sus propios errores, asi que marcar por el
-    # simple hecho de haberlo intentado perderia el lead para siempre: el
-    # reintento de Meta veria la clave puesta y no volveria a intentarlo.
-    boardroom_key = f"imss_flow_boardroom:{flow_token}"
-    if not _state_store.aux_get(boardroom_key):
-        if _notify_boardroom_lead_qualified(phone, "prestamo_imss_ley73", _ensure_user(phone)):
-            _imss_flow_marcar(boardroom_key)
+    # Notificacion al asesor, reporte y alta en Boardroom: trabajo durable en
+    # segundo plano, cada efecto con su dedupe propio. Si el cierre fallo y
+    # Meta reintenta, el prospecto vuelve a recibir el mensaje pero el asesor
+    # NO recibe la ficha dos veces. Boardroom solo se marca tras un alta
+    # CONFIRMADA: _notify_boardroom_lead_qualified() absorbe sus propios
+    # errores, y marcar por el simple hecho de haberlo intentado perderia el
+    # lead para siempre.
+    with _imss_flow_span("encolado"):
+        _imss_flow_job_encolar(phone, flow_token, data)
 
     user_state[phone] = "imss_q_horario_calc"
 
@@ -2839,8 +5386,9 @@ def _imss_flow_handle_handoff(phone: str, step_data: dict, flow_token: str) -> d
         # estan protegidos por sus propias claves de dedupe).
         log.error("imss_flow_cierre_no_entregado phone_last4=%s", _digits(phone)[-4:])
         _imss_log_lead_backup(phone, data, resultado="cierre_send_failed")
+        _imss_flow_requiere_reintento()
     else:
-        _imss_flow_marcar(completado_key)
+        _imss_flow_marcar(flow_token, "handoff_completado")
 
     return imss_flow.build_success_response(flow_token, {"resultado": "calificado"})
 
@@ -2902,7 +5450,8 @@ def funnel_imss(phone: str, msg: str) -> None:
             notify_advisor(
                 f"📣 SOLICITA ASESOR – IMSS Ley 73 (menú no resuelto)\n"
                 f"WhatsApp: {phone}\n"
-                f"Último mensaje: {msg[:200]}"
+                f"Último mensaje: {msg[:200]}",
+                urgente=True
             )
             send_msg(phone, "Claro 🙌 Le aviso a *Christian López* para que te contacte directamente.")
             _imss_close(phone)
@@ -2942,7 +5491,8 @@ def funnel_imss(phone: str, msg: str) -> None:
                 notify_advisor(
                     f"⚠️ PROSPECTO ATASCADO – IMSS Ley 73\n"
                     f"WhatsApp: {phone}\n"
-                    f"No entiende el menú numérico. Último mensaje: {msg[:200]}"
+                    f"No entiende el menú numérico. Último mensaje: {msg[:200]}",
+                    urgente=True
                 )
             if intentos >= 2:
                 send_msg(phone,
@@ -3336,10 +5886,13 @@ def funnel_imss(phone: str, msg: str) -> None:
         advisor_notify_ok = notify_advisor(_imss_build_advisor_notification(phone, data))
         data["advisor_notify_ok"] = advisor_notify_ok
         user_data[phone] = data
-        if not advisor_notify_ok:
+        if advisor_notify_ok:
+            _lead_indice_marcar(phone, "asesor", "prestamo_imss_ley73", data.get("origen") or "whatsapp")
+            _imss_advisor_tabla_seguimiento(phone, data)
+        else:
             _imss_log_lead_backup(phone, data)
         _imss_report_lead_qualified(phone, data)
-        _notify_boardroom_lead_qualified(phone, "prestamo_imss_ley73", _ensure_user(phone))
+        _boardroom_outbox_lead(phone, "prestamo_imss_ley73", _ensure_user(phone), funnel="imss")
 
         user_state[phone] = "imss_q_horario_calc"
         return
@@ -3421,7 +5974,7 @@ def funnel_auto(phone: str, msg: str) -> None:
         data["tel"] = phone if msg.strip().lower() in ("mismo", "este", "el mismo") else msg.strip()
         user_data[phone] = data
         send_msg(phone, "✅ Listo. El asesor *Christian López* te contactará para tu cotización de auto.")
-        notify_advisor(
+        if notify_advisor(
             f"🚗 PROSPECTO – SEGURO AUTO\n"
             f"Nombre: {data.get('nombre', 'ND')}\n"
             f"WhatsApp: {phone}\n"
@@ -3429,8 +5982,9 @@ def funnel_auto(phone: str, msg: str) -> None:
             f"Seguro actual: {data.get('tiene_seguro_actual', 'ND')}\n"
             f"Vehículo: {data.get('marca_modelo', 'ND')}\n"
             f"Año: {data.get('ano', 'ND')}"
-        )
-        _notify_boardroom_lead_qualified(phone, "seguro_vida", _ensure_user(phone))
+        ):
+            _lead_indice_marcar(phone, "asesor", "seguro_vida", data.get("origen") or "whatsapp")
+        _boardroom_outbox_lead(phone, "seguro_vida", _ensure_user(phone), funnel="auto")
         reset(phone)
         return
 
@@ -3472,15 +6026,16 @@ def funnel_vida(phone: str, msg: str) -> None:
         data["tel"] = phone if msg.strip().lower() in ("mismo", "este", "el mismo") else msg.strip()
         user_data[phone] = data
         send_msg(phone, "✅ Listo. El asesor *Christian López* te contactará para revisar tu cobertura.")
-        notify_advisor(
+        if notify_advisor(
             f"🏥 PROSPECTO – VIDA Y SALUD\n"
             f"Nombre: {data.get('nombre', 'ND')}\n"
             f"WhatsApp: {phone}\n"
             f"Teléfono: {data.get('tel', 'ND')}\n"
             f"Cobertura: {data.get('tipo_cobertura', 'ND')}\n"
             f"Edad: {data.get('edad', 'ND')}"
-        )
-        _notify_boardroom_lead_qualified(phone, "seguro_vida", _ensure_user(phone))
+        ):
+            _lead_indice_marcar(phone, "asesor", "seguro_vida", data.get("origen") or "whatsapp")
+        _boardroom_outbox_lead(phone, "seguro_vida", _ensure_user(phone), funnel="vida")
         reset(phone)
         return
 
@@ -3515,14 +6070,15 @@ def funnel_vrim(phone: str, msg: str) -> None:
         data["tel"] = phone if msg.strip().lower() in ("mismo", "este", "el mismo") else msg.strip()
         user_data[phone] = data
         send_msg(phone, "✅ Listo. El asesor *Christian López* te contactará para tu membresía VRIM.")
-        notify_advisor(
+        if notify_advisor(
             f"💳 PROSPECTO – VRIM\n"
             f"Nombre: {data.get('nombre', 'ND')}\n"
             f"WhatsApp: {phone}\n"
             f"Teléfono: {data.get('tel', 'ND')}\n"
             f"Personas: {data.get('personas', 'ND')}"
-        )
-        _notify_boardroom_lead_qualified(phone, "seguro_vida", _ensure_user(phone))
+        ):
+            _lead_indice_marcar(phone, "asesor", "seguro_vida", data.get("origen") or "whatsapp")
+        _boardroom_outbox_lead(phone, "seguro_vida", _ensure_user(phone), funnel="vrim")
         reset(phone)
         return
 
@@ -3587,14 +6143,15 @@ def funnel_emp(phone: str, msg: str) -> None:
         data["ciudad"] = msg.title()
         user_data[phone] = data
         send_msg(phone, "✅ Listo. El asesor *Christian López* te contactará a la brevedad.")
-        notify_advisor(
+        if notify_advisor(
             f"🔔 PROSPECTO – CRÉDITO EMPRESARIAL\n"
             f"Nombre: {data.get('nombre', 'ND')}\n"
             f"WA: {phone} · Tel: {data.get('tel', 'ND')}\n"
             f"Ciudad: {data.get('ciudad', 'ND')}\n"
             f"Giro:   {data.get('giro', 'ND')}\n"
-            f"Monto:  ${data.get('monto', 0):,.0f}")
-        _notify_boardroom_lead_qualified(phone, "nomina_empresarial", _ensure_user(phone))
+            f"Monto:  ${data.get('monto', 0):,.0f}"):
+            _lead_indice_marcar(phone, "asesor", "nomina_empresarial", data.get("origen") or "whatsapp")
+        _boardroom_outbox_lead(phone, "nomina_empresarial", _ensure_user(phone), funnel="emp")
         reset(phone)
         return
 
@@ -4107,11 +6664,7 @@ def _handle_dispatch(msg_obj: dict) -> None:
             or ""
         )
         if media_id:
-            threading.Thread(
-                target=_notify_boardroom_document,
-                args=(phone, media_id, mtype),
-                daemon=True
-            ).start()
+            _media_encolar(phone, media_id, mtype)
             send_msg(phone,
                 "✅ Documento recibido. Christian López lo revisará "
                 "y te confirmará en breve."
@@ -4206,7 +6759,7 @@ def _handle_dispatch(msg_obj: dict) -> None:
     if any(t in n for t in _adv):
         send_msg(phone, "📞 Avisaré a nuestro asesor *Christian López* para que te contacte.\n"
                         "¿Hay algo en que pueda orientarte mientras tanto?")
-        notify_advisor(f"📣 CONTACTO DIRECTO\nWhatsApp: {phone}\nMensaje: {text}")
+        notify_advisor(f"📣 CONTACTO DIRECTO\nWhatsApp: {phone}\nMensaje: {text}", urgente=True)
         return
 
     svc = detect_svc(text)
@@ -4274,25 +6827,41 @@ def _advisor_handle_failed(wamid: str, tracked: dict, err_txt: str) -> None:
     producción, 2026-08-09/10, Meta error 131049 "healthy ecosystem
     engagement").
     """
-    log.error("asesor_alerta_no_entregada: wamid=%s nivel=%s%s",
-              wamid[:24], tracked.get("level") or "?", err_txt)
+    log.error("asesor_alerta_no_entregada: wamid=%s nivel=%s alertas=%s%s",
+              wamid[:24], tracked.get("level") or "?",
+              ",".join(tracked.get("alertas") or []) or "-", err_txt)
     # El veredicto de Meta manda sobre la contabilidad local: si creíamos la
     # ventana abierta, estábamos equivocados.
     _advisor_window_expire()
+    # Con el programador de reintentos, el cuerpo tambien vive en
+    # adv_reintento:<id> (7 dias) y lo que aqui no se pueda reenviar queda
+    # programado en vez de perderse.
+    rid = tracked.get("reintento") or ""
     if tracked.get("level") == "template":
         log.error("asesor_reenvio_omitido: el template también falló, no hay nivel superior")
-        body = _state_store.aux_get(f"adv_retry:{wamid}") or "(cuerpo no disponible, TTL vencido)"
+        body = (_state_store.aux_get(f"adv_retry:{wamid}") or _advisor_reintento_cuerpo(rid)
+                or "(cuerpo no disponible, TTL vencido)")
         _log(ADVISOR_NUM, "Asesor", body, "saliente", "asesor", "error",
              f"status_failed{err_txt}"[:300], wamid)
+        if rid:
+            _advisor_reintento_fallida(rid, inmediato=False)
         return
     if not ADV_TPL:
         log.error("asesor_reenvio_omitido: ADVISOR_TEMPLATE_NAME no configurado")
+        if rid:
+            _advisor_reintento_fallida(rid, inmediato=True)
         return
-    body = _state_store.aux_get(f"adv_retry:{wamid}")
+    body = _state_store.aux_get(f"adv_retry:{wamid}") or _advisor_reintento_cuerpo(rid)
     if not body:
         log.error("asesor_reenvio_omitido: sin cuerpo correlacionado para wamid=%s", wamid[:24])
         return
-    _notify_advisor_via_template(body, motivo="status_failed")
+    _tl.adv_envio = {"reintento": rid} if rid else None
+    try:
+        ok = _notify_advisor_via_template(body, motivo="status_failed", alertas=tracked.get("alertas"))
+    finally:
+        _tl.adv_envio = None
+    if rid and not ok:
+        _advisor_reintento_fallida(rid, inmediato=False)
 
 
 def _handle_statuses(statuses) -> None:
@@ -4328,6 +6897,10 @@ def _handle_statuses(statuses) -> None:
             log.info("wa_status: estado=%s wamid=%s destino=%s alerta_asesor=%s%s",
                      status, wamid[:24], _mask_phone(st.get("recipient_id")),
                      bool(tracked), err_txt)
+            if tracked and ADVISOR_RETRY_ENABLED:
+                _state_store.aux_set(_ADV_STATUS_VISTO_KEY, str(time.time()), _ADV_REINTENTO_TTL)
+                if status in ("delivered", "read") and tracked.get("reintento"):
+                    _advisor_reintento_confirmar(tracked["reintento"])
             if status == "failed" and tracked:
                 _advisor_handle_failed(wamid, tracked, err_txt)
         except Exception:
@@ -4388,6 +6961,48 @@ def health():
     return jsonify({"status": "ok", "sheets": _srdy}), 200
 
 
+@app.route("/ext/metrics", methods=["GET"])
+def ext_metrics():
+    """Contadores internos del proceso (memos, caches, colas). Solo lectura,
+    protegido con X-Internal-Token igual que /ext/lead."""
+    if not _is_internal_request(request):
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+    return jsonify({
+        "ok": True,
+        "imss_memo": _imss_memo_stats(),
+        "imss_flow_keys": _imss_flow_key_ring_stats(),
+        "imss_flow_replay": _imss_flow_replay_stats_snapshot(),
+        "imss_flow_latency": _imss_flow_latency_stats(),
+        "imss_flow_jobs": _imss_flow_jobs_stats(),
+        "boardroom_emitter": _boardroom_emisor.stats(),
+        "boardroom_observation_batch": _lote_observaciones.stats(),
+        "boardroom_breaker": _circuito_boardroom.stats(),
+        "boardroom_speculative": _boardroom_especulacion_stats(),
+        "boardroom_instruct": _boardroom_ejecutor.stats(),
+        "boardroom_outbox": _boardroom_outbox_stats(),
+        "media_pipeline": _media_stats(),
+        "ext_leads_pendientes": len(_state_store.aux_smembers(_EXT_LEAD_INDICE)),
+        "lead_dedupe": _lead_indice_stats(),
+        "advisor_digest": _advisor_digest_stats(),
+        "advisor_retry": _advisor_reintentos_stats(),
+        "programador": _programador_stats(),
+    }), 200
+
+
+def _imss_flow_dispatch_screen(phone: str, screen: str, action: str,
+                               step_data: dict, flow_token: str) -> dict:
+    if screen == imss_flow.SCREEN_PROFILE:
+        return _imss_flow_handle_profile(phone, step_data, flow_token)
+    if screen == imss_flow.SCREEN_PENSION:
+        return _imss_flow_handle_pension(phone, step_data, flow_token)
+    if screen == imss_flow.SCREEN_HANDOFF:
+        return _imss_flow_handle_handoff(phone, step_data, flow_token)
+    if screen == imss_flow.SCREEN_REJECTED:
+        return _imss_flow_handle_rejected_ack(phone, flow_token)
+    log.warning("⚠️ Flow IMSS: pantalla desconocida %r (action=%s)", screen, action)
+    return imss_flow.build_error_ack_response()
+
+
 @app.route("/ext/flow/imss", methods=["POST"])
 def imss_dynamic_flow():
     """Endpoint cifrado del Flow dinámico de IMSS (data_exchange). Contrato
@@ -4402,17 +7017,28 @@ def imss_dynamic_flow():
         log.error("❌ IMSS_FLOW_PRIVATE_KEY no configurado. Flow dinámico IMSS bloqueado.")
         return jsonify({"error": "not_configured"}), 503
 
+    _tl.imss_flow_t0 = time.perf_counter()
+    _tl.imss_flow_spans = spans = {}
     body = request.get_json(silent=True) or {}
+    crypto_ms: dict = {}
     try:
         payload, aes_key, iv = imss_flow.decrypt_request(
             body.get("encrypted_flow_data", ""),
             body.get("encrypted_aes_key", ""),
             body.get("initial_vector", ""),
-            IMSS_FLOW_PRIVATE_KEY,
+            _imss_flow_key_ring(),
+            timings=crypto_ms,
         )
     except imss_flow.FlowDecryptionError:
         log.exception("❌ Flow IMSS: fallo al descifrar solicitud")
+        _tl.imss_flow_spans = None
+        _tl.imss_flow_t0 = None
         return "", 421
+    log.info("flow_imss_crypto key_index=%s key_load_ms=%.2f rsa_unwrap_ms=%.2f aes_gcm_ms=%.2f",
+             crypto_ms.get("key_index"), crypto_ms.get("key_load_ms", 0.0),
+             crypto_ms.get("rsa_unwrap_ms", 0.0), crypto_ms.get("aes_gcm_ms", 0.0))
+    spans["descifrado"] = sum(crypto_ms.get(k, 0.0)
+                              for k in ("key_load_ms", "rsa_unwrap_ms", "aes_gcm_ms"))
 
     req = imss_flow.parse_decrypted_request(payload)
     action = req["action"]
@@ -4426,47 +7052,95 @@ def imss_dynamic_flow():
         log.warning("⚠️ Flow IMSS: error notificado por el cliente: %s", step_data)
         response = imss_flow.build_error_ack_response()
     else:
-        phone = _state_store.aux_get(f"imss_flow_token:{flow_token}") or ""
+        with _imss_flow_span("store"):
+            sesion = _imss_flow_sesion(flow_token)
+        phone = sesion["phone"] if sesion else ""
         if not phone:
             log.warning("⚠️ Flow IMSS: flow_token sin teléfono correlacionado (expiró o es inválido)")
             response = imss_flow.build_next_screen_response(
                 imss_flow.SCREEN_PROFILE, {},
                 error_message="Tu sesión expiró. Vuelve a intentar desde WhatsApp.")
-        elif screen == imss_flow.SCREEN_PROFILE:
-            response = _imss_flow_handle_profile(phone, step_data, flow_token)
-        elif screen == imss_flow.SCREEN_PENSION:
-            response = _imss_flow_handle_pension(phone, step_data, flow_token)
-        elif screen == imss_flow.SCREEN_HANDOFF:
-            response = _imss_flow_handle_handoff(phone, step_data, flow_token)
-        elif screen == imss_flow.SCREEN_REJECTED:
-            response = _imss_flow_handle_rejected_ack(phone, flow_token)
         else:
-            log.warning("⚠️ Flow IMSS: pantalla desconocida %r (action=%s)", screen, action)
-            response = imss_flow.build_error_ack_response()
-
-    encrypted = imss_flow.encrypt_response(response, aes_key, iv)
+            solicitudes = int(sesion.get("solicitudes") or 0)
+            with _imss_flow_span("store"):
+                response = _imss_flow_replay_get(
+                    _imss_flow_replay_key(flow_token, screen, payload, solicitudes))
+            if response is not None:
+                log.info("flow_imss_replay_hit screen=%s", screen)
+            else:
+                # Llave con el contador que deja ESTA solicitud: la que buscara
+                # un reintento de Meta.
+                replay_key = _imss_flow_replay_key(flow_token, screen, payload, solicitudes + 1)
+                _tl.imss_flow_reintentable = False
+                _tl.imss_flow_sesion = (flow_token, sesion)
+                _tl.imss_flow_replay_clave = replay_key
+                # Los hilos del servidor se reutilizan: si el handler lanza, la
+                # sesion de esta solicitud no debe quedar visible para la siguiente.
+                try:
+                    t_handler = time.perf_counter()
+                    antes = sum(spans.values())
+                    response = _imss_flow_dispatch_screen(phone, screen, action, step_data, flow_token)
+                    # "handler" es solo la logica propia: lo que ya midieron los
+                    # spans internos (calculo, asesor, sheets...) no se cuenta dos veces.
+                    spans["handler"] = max(0.0, (time.perf_counter() - t_handler) * 1000
+                                           - (sum(spans.values()) - antes))
+                    with _imss_flow_span("store"):
+                        _imss_flow_registrar_solicitud(
+                            flow_token, screen, "error_message" not in (response.get("data") or {}))
+                        if getattr(_tl, "imss_flow_reintentable", False):
+                            _imss_flow_replay_count("not_stored_retryable")
+                        else:
+                            _imss_flow_replay_put(replay_key, response)
+                finally:
+                    _tl.imss_flow_sesion = None
+                    _tl.imss_flow_replay_clave = None
+
+    with _imss_flow_span("cifrado"):
+        encrypted = imss_flow.encrypt_response(response, aes_key, iv)
+    _imss_flow_registrar_latencias(action if action in ("ping", "error") else (screen or action),
+                                   spans, _imss_flow_transcurrido_ms())
+    _tl.imss_flow_spans = None
+    _tl.imss_flow_t0 = None
     return encrypted, 200, {"Content-Type": "text/plain"}
 
 
-@app.route("/ext/boardroom/instruct", methods=["POST"])
-def boardroom_instruct():
-    """Recibe instrucciones de Boardroom para ejecutar en Vicky Redes."""
-    token = request.headers.get("X-Internal-Token", "").strip()
-    internal_token = os.getenv("INTERNAL_TOKEN", "").strip()
-    if not internal_token or token != internal_token:
-        return jsonify({"ok": False, "error": "unauthorized"}), 401
+# Nombres de instruccion que acepta /ext/boardroom/instruct. No confundir con
+# _BOARDROOM_ALLOWED_INSTRUCTIONS, que son los tipos que Boardroom devuelve
+# por el bus en la llamada de autoridad (send_message, handoff, ...).
+_BOARDROOM_ENDPOINT_INSTRUCTIONS = (
+    "hot_transfer", "existing_client_greeting", "escalate_chiwy",
+    "resume_funnel", "handle_message",
+)
 
-    body = request.get_json(silent=True) or {}
-    phone = str(body.get("phone", "") or "").strip()
-    instruction = str(body.get("instruction", "") or "").strip()
-    payload = body.get("payload", {})
 
-    if not phone or not instruction:
-        return jsonify({
-            "ok": False,
-            "error": "phone e instruction requeridos"
-        }), 400
+class _EjecutorPorTelefono:
+    """Carriles FIFO de un solo hilo (_EmisorBoardroom con workers=1); el
+    telefono elige carril por crc32, asi que las instrucciones de un mismo
+    cliente se ejecutan en el orden en que llegaron y nunca en paralelo."""
+
+    def __init__(self, carriles: int, capacidad: int):
+        self._carriles = [_EmisorBoardroom(1, capacidad) for _ in range(carriles)]
+
+    def enviar(self, phone: str, tipo: str, fn, *args) -> bool:
+        carril = self._carriles[zlib.crc32(phone.encode("utf-8")) % len(self._carriles)]
+        return carril.enviar(tipo, fn, *args)
+
+    def stats(self) -> dict:
+        total = {"carriles": len(self._carriles), "activos": 0, "en_cola": 0,
+                 "encolados": 0, "descartados": 0, "ejecutados": 0, "fallidos": 0}
+        for carril in self._carriles:
+            st = carril.stats()
+            for k in ("activos", "en_cola", "encolados", "descartados", "ejecutados", "fallidos"):
+                total[k] += st[k]
+        return total
 
+
+_boardroom_ejecutor = _EjecutorPorTelefono(BOARDROOM_INSTRUCT_LANES, BOARDROOM_INSTRUCT_QUEUE)
+
+
+def _boardroom_ejecutar_instruccion(phone: str, instruction: str, payload: dict) -> None:
+    """Ejecuta una instruccion de Boardroom ya validada (nombre en
+    _BOARDROOM_ENDPOINT_INSTRUCTIONS, payload dict)."""
     if instruction == "hot_transfer":
         asesor_origen = payload.get("asesor_origen", "don_chiwy")
         sub_campana = payload.get("sub_campana", "")
@@ -4483,7 +7157,8 @@ def boardroom_instruct():
             f"Nombre: {nombre}\n"
             f"Sub-campaña: {sub_campana}\n"
             f"Asesor origen: {asesor_origen}\n"
-            f"⚡ Requiere atención inmediata"
+            f"⚡ Requiere atención inmediata",
+            urgente=True
         )
 
     elif instruction == "existing_client_greeting":
@@ -4501,7 +7176,8 @@ def boardroom_instruct():
         notify_advisor(
             f"⚡ ESCALACIÓN DIRECTA — {nombre}\n"
             f"WhatsApp: {phone}\n"
-            f"Motivo: {motivo}"
+            f"Motivo: {motivo}",
+            urgente=True
         )
         send_msg(phone,
             "✅ Tu solicitud es importante. Christian López te "
@@ -4535,14 +7211,47 @@ def boardroom_instruct():
             "image": {"id": media_id} if mtype == "image" else {},
             "document": {"id": media_id} if mtype == "document" else {},
         }
-        threading.Thread(target=handle, args=(msg_obj,), daemon=True).start()
+        handle(msg_obj)
 
-    else:
+
+def _boardroom_autorizado() -> bool:
+    token = request.headers.get("X-Internal-Token", "").strip()
+    internal_token = os.getenv("INTERNAL_TOKEN", "").strip()
+    return bool(internal_token) and token == internal_token
+
+
+@app.route("/ext/boardroom/instruct", methods=["POST"])
+def boardroom_instruct():
+    """Recibe instrucciones de Boardroom para ejecutar en Vicky Redes."""
+    if not _boardroom_autorizado():
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+
+    body = request.get_json(silent=True) or {}
+    phone = str(body.get("phone", "") or "").strip()
+    instruction = str(body.get("instruction", "") or "").strip()
+    payload = body.get("payload", {})
+
+    if not phone or not instruction:
+        return jsonify({
+            "ok": False,
+            "error": "phone e instruction requeridos"
+        }), 400
+
+    if instruction not in _BOARDROOM_ENDPOINT_INSTRUCTIONS:
         return jsonify({
             "ok": False,
             "error": f"Instrucción desconocida: {instruction}"
         }), 400
 
+    # handle_message corre el dispatcher completo: va al carril del telefono
+    # (ordenado, acotado) en vez de a un hilo nuevo por instruccion.
+    if instruction == "handle_message":
+        if not _boardroom_ejecutor.enviar(phone, instruction, _boardroom_ejecutar_instruccion,
+                                          phone, instruction, payload):
+            return jsonify({"ok": False, "error": "cola llena"}), 503
+    else:
+        _boardroom_ejecutar_instruccion(phone, instruction, payload)
+
     return jsonify({
         "ok": True,
         "instruction": instruction,
@@ -4550,6 +7259,80 @@ def boardroom_instruct():
     }), 200
 
 
+def _boardroom_instrucciones_del_cuerpo() -> list | None:
+    """Arreglo JSON, {"instructions": [...]} o JSONL (una instruccion por
+    linea). None si el cuerpo no es ninguno de los tres."""
+    raw = request.get_data(cache=True, as_text=True) or ""
+    try:
+        body = json.loads(raw) if raw.strip() else None
+    except ValueError:
+        body = None
+        items = []
+        for linea in raw.splitlines():
+            if not linea.strip():
+                continue
+            try:
+                items.append(json.loads(linea))
+            except ValueError:
+                return None
+        return items
+    if isinstance(body, dict) and isinstance(body.get("instructions"), list):
+        return body["instructions"]
+    if isinstance(body, list):
+        return body
+    if isinstance(body, dict):
+        return [body]  # JSONL de una sola linea
+    return None
+
+
+@app.route("/ext/boardroom/instruct/batch", methods=["POST"])
+def boardroom_instruct_batch():
+    """Lote de instrucciones de Boardroom (campanas). Cada una se valida y se
+    encola en el carril de su telefono; el resultado por elemento dice si
+    quedo encolada o por que se rechazo. 202: la ejecucion es asincrona."""
+    if not _boardroom_autorizado():
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+
+    items = _boardroom_instrucciones_del_cuerpo()
+    if items is None:
+        return jsonify({"ok": False, "error": "cuerpo invalido: JSON array o JSONL"}), 400
+    if len(items) > BOARDROOM_INSTRUCT_BATCH_MAX:
+        return jsonify({"ok": False, "error": "lote demasiado grande",
+                        "max": BOARDROOM_INSTRUCT_BATCH_MAX}), 413
+
+    resultados = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict):
+            resultados.append({"index": i, "ok": False, "error": "instruccion invalida"})
+            continue
+        phone = str(item.get("phone", "") or "").strip()
+        instruction = str(item.get("instruction", "") or "").strip()
+        payload = item.get("payload") or {}
+        if not phone or not instruction:
+            error = "phone e instruction requeridos"
+        elif instruction not in _BOARDROOM_ENDPOINT_INSTRUCTIONS:
+            error = f"Instrucción desconocida: {instruction}"
+        elif not isinstance(payload, dict):
+            error = "payload debe ser objeto"
+        elif not _boardroom_ejecutor.enviar(phone, instruction, _boardroom_ejecutar_instruccion,
+                                            phone, instruction, payload):
+            error = "cola llena"
+        else:
+            error = None
+        resultado = {"index": i, "ok": error is None, "phone": phone, "instruction": instruction}
+        if error:
+            resultado["error"] = error
+        resultados.append(resultado)
+
+    encoladas = sum(1 for r in resultados if r["ok"])
+    return jsonify({
+        "ok": True,
+        "encoladas": encoladas,
+        "rechazadas": len(resultados) - encoladas,
+        "resultados": resultados,
+    }), 202
+
+
 def _lead_payload_to_service(data: dict) -> str:
     """Deriva el servicio ('imss', 'auto', …) de un payload de /ext/lead sin mutarlo."""
     raw_interest = str(data.get("interes") or data.get("producto_interes") or "").strip()
@@ -4566,6 +7349,130 @@ def _lead_payload_to_service(data: dict) -> str:
     return detect_svc(raw_interest or raw_service) or ""
 
 
+# ── /ext/lead asincrono (EXT_LEAD_ASYNC_ENABLED) ─────────────────────────────
+# El lead validado se escribe en ext_lead:<lead_id> y se indexa en
+# ext_leads_pendientes ANTES de responder 202; desde ahi lo toma un trabajo
+# con el mismo esquema que los handoffs del Flow (_imss_flow_job_*): backoff
+# fijo, reanudacion al arrancar, registro idempotente por lead_id. El
+# formulario consulta GET /ext/lead/<lead_id> para saber si el asesor ya fue
+# avisado. El alta en Boardroom va al outbox (que ya reintenta por su cuenta)
+# y no depende de que Meta entregue el aviso.
+_EXT_LEAD_TTL = 7 * 24 * 3600
+_EXT_LEAD_INDICE = "ext_leads_pendientes"
+_EXT_LEAD_BACKOFF_S = (10, 60, 300, 900)
+_ext_leads_en_curso: set = set()
+_ext_leads_lock = threading.Lock()
+
+
+def _ext_lead_key(lead_id: str) -> str:
+    return f"ext_lead:{lead_id}"
+
+
+def _ext_lead_cargar(lead_id: str) -> dict | None:
+    raw = _state_store.aux_get(_ext_lead_key(lead_id))
+    if not raw:
+        return None
+    try:
+        return json.loads(raw)
+    except (TypeError, ValueError):
+        return None
+
+
+def _ext_lead_guardar(registro: dict) -> bool:
+    registro["actualizado"] = time.time()
+    return _state_store.aux_set(_ext_lead_key(registro["lead_id"]),
+                                json.dumps(registro, ensure_ascii=False, default=str),
+                                _EXT_LEAD_TTL)
+
+
+def _ext_lead_encolar(registro: dict) -> tuple[dict, bool]:
+    """Persiste el lead (una sola vez por lead_id) y lanza su trabajo.
+    Devuelve (registro vigente, persistido)."""
+    existente = _ext_lead_cargar(registro["lead_id"])
+    if existente is not None:
+        return existente, True
+    persistido = _ext_lead_guardar(registro) and \
+        _state_store.aux_sadd(_EXT_LEAD_INDICE, registro["lead_id"], _EXT_LEAD_TTL)
+    if persistido:
+        threading.Thread(target=_ext_lead_procesar, args=(registro["lead_id"],),
+                         daemon=True).start()
+    return registro, persistido
+
+
+def _ext_lead_procesar(lead_id: str) -> None:
+    with _ext_leads_lock:
+        if lead_id in _ext_leads_en_curso:
+            return
+        _ext_leads_en_curso.add(lead_id)
+    try:
+        registro = _ext_lead_cargar(lead_id)
+        if not registro or registro.get("estado") != "pendiente":
+            _state_store.aux_srem(_EXT_LEAD_INDICE, lead_id)
+            return
+        fuente = registro["datos"].get("source") or "ext_lead"
+        if registro["boardroom"] == "pendiente":
+            encolado = _lead_indice_alta_boardroom(registro["telefono"], registro["product_code"],
+                                                   registro["datos"], lead_id, fuente)
+            registro["boardroom"] = "encolado" if encolado else "suprimido"
+        if registro["asesor"] == "pendiente":
+            if not _lead_indice_reclamar(registro["telefono"], "asesor",
+                                         registro["product_code"], fuente):
+                registro["asesor"] = "suprimido"
+            elif notify_advisor(registro["mensaje_asesor"]):
+                registro["asesor"] = "notificado"
+            else:
+                _lead_indice_liberar(registro["telefono"], "asesor", registro["product_code"])
+                registro["intentos"] = int(registro.get("intentos") or 0) + 1
+                log.warning("⚠️ /ext/lead notify_advisor falló [lead_id=%s intento=%s]",
+                            lead_id, registro["intentos"])
+        if registro["asesor"] in ("notificado", "suprimido"):
+            registro["estado"] = "completado"
+        elif registro["intentos"] > len(_EXT_LEAD_BACKOFF_S):
+            registro["estado"] = registro["asesor"] = "fallido"
+            log.error("❌ /ext/lead asesor sin notificar tras %s intentos [lead_id=%s]",
+                      registro["intentos"], lead_id)
+        _ext_lead_guardar(registro)
+        if registro["estado"] != "pendiente":
+            _state_store.aux_srem(_EXT_LEAD_INDICE, lead_id)
+            return
+        _ext_lead_programar(lead_id, _EXT_LEAD_BACKOFF_S[registro["intentos"] - 1])
+    finally:
+        with _ext_leads_lock:
+            _ext_leads_en_curso.discard(lead_id)
+
+
+def _ext_lead_programar(lead_id: str, espera_s: float) -> None:
+    _programador_agendar("ext_lead", lead_id, espera_s)
+
+
+_programador_registrar("ext_lead", lambda lead_id: _ext_lead_procesar(lead_id))
+
+
+def _ext_leads_reanudar() -> None:
+    """Arranque: retoma los leads aceptados con 202 que no terminaron."""
+    pendientes = _state_store.aux_smembers(_EXT_LEAD_INDICE)
+    for lead_id in pendientes:
+        _ext_lead_programar(lead_id, 0)
+    if pendientes:
+        log.info("ext_leads_reanudados total=%s", len(pendientes))
+
+
+def _ext_lead_estado_publico(registro: dict) -> dict:
+    return {k: registro.get(k) for k in (
+        "lead_id", "estado", "asesor", "boardroom", "intentos", "product_code",
+        "creado", "actualizado")}
+
+
+@app.route("/ext/lead/<lead_id>", methods=["GET"])
+def ext_lead_status(lead_id):
+    if not _is_internal_request(request):
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+    registro = _ext_lead_cargar(lead_id)
+    if registro is None:
+        return jsonify({"ok": False, "error": "lead_not_found"}), 404
+    return jsonify({"ok": True, **_ext_lead_estado_publico(registro)}), 200
+
+
 @app.route("/ext/lead", methods=["POST"])
 def ext_lead():
     try:
@@ -4578,7 +7485,7 @@ def ext_lead():
         data = request.get_json(force=True, silent=True) or {}
         lead_id = str(data.get("lead_id") or "").strip()
         nombre = str(data.get("nombre", "")).strip() or "Sin nombre"
-        telefono = re.sub(r"\D", "", str(data.get("telefono", "")))[-10:]
+        telefono = _lead_telefono(data.get("telefono", ""))
         interest = str(data.get("interest") or data.get("interes") or "").strip() or "sin_especificar"
         source = str(data.get("source", "")).strip() or "desconocido"
 
@@ -4595,25 +7502,57 @@ def ext_lead():
             f"Fuente: {source}\n"
             f"Lead ID: {lead_id}"
         )
+        svc = _lead_payload_to_service(data)
+        product_code = _service_to_product_code(svc)
+        datos = {
+            "lead_id": lead_id,
+            "nombre": nombre,
+            "telefono": telefono,
+            "interest": interest,
+            "source": source,
+            "service_hint": svc or "general",
+        }
+
+        if EXT_LEAD_ASYNC_ENABLED:
+            ahora = time.time()
+            registro, persistido = _ext_lead_encolar({
+                "lead_id": lead_id, "telefono": telefono, "product_code": product_code,
+                "mensaje_asesor": advisor_msg, "datos": datos, "estado": "pendiente",
+                "asesor": "pendiente", "boardroom": "pendiente", "intentos": 0,
+                "creado": ahora, "actualizado": ahora,
+            })
+            if not persistido:
+                # Sin almacen no hay 202 honesto: se rechaza para que el
+                # formulario reintente, igual que con Meta caido en modo sincrono.
+                log.error("❌ /ext/lead no persistido [lead_id=%s]", lead_id)
+                return jsonify({"ok": False, "error": "lead_not_persisted"}), 503
+            log.info("✅ /ext/lead aceptado [lead_id=%s product=%s]", lead_id, product_code)
+            return jsonify({
+                "ok": True,
+                "lead_id": lead_id,
+                "product_code": product_code,
+                "estado": registro.get("estado"),
+                "status_url": f"/ext/lead/{lead_id}",
+            }), 202
+
+        if not _lead_indice_reclamar(telefono, "asesor", product_code, source):
+            # El asesor ya recibio a esta persona (otro canal, mismo producto)
+            # dentro de la ventana: se acepta el lead sin repetir la alerta.
+            _lead_indice_alta_boardroom(telefono, product_code, datos, lead_id, source)
+            return jsonify({
+                "ok": True,
+                "lead_id": lead_id,
+                "product_code": product_code,
+                "duplicado": True,
+            }), 200
+
         ok = notify_advisor(advisor_msg)
         if not ok:
+            _lead_indice_liberar(telefono, "asesor", product_code)
             log.warning("⚠️ /ext/lead notify_advisor falló [lead_id=%s]", lead_id)
             return jsonify({"ok": False, "error": "advisor_notify_failed"}), 502
 
-        svc = _lead_payload_to_service(data)
-        product_code = _service_to_product_code(svc)
-        threading.Thread(
-            target=_notify_boardroom_lead_qualified,
-            args=(telefono, product_code, {
-                "lead_id": lead_id,
-                "nombre": nombre,
-                "telefono": telefono,
-                "interest": interest,
-                "source": source,
-                "service_hint": svc or "general",
-            }),
-            daemon=True
-        ).start()
+        _lead_indice_alta_boardroom(telefono, product_code, datos, lead_id, source)
 
         log.info("✅ /ext/lead OK [lead_id=%s product=%s]", lead_id, product_code)
         return jsonify({
@@ -4625,8 +7564,315 @@ def ext_lead():
         log.exception("❌ Error en /ext/lead: %s", exc)
         return jsonify({"ok": False, "error": "internal_server_error"}), 500
 
+# ── Importacion masiva de leads (campanas offline) ───────────────────────────
+_LEAD_IMPORT_MAX_FILAS = 20000
+_LEAD_IMPORT_DIGEST_MUESTRA = 10
+
+
+def _lead_import_filas(formato: str):
+    """(numero_de_linea, dict | None) leyendo request.stream linea por linea,
+    sin cargar el cuerpo completo. None = linea que no se pudo interpretar."""
+    lineas = (l.decode("utf-8-sig", errors="replace") for l in request.stream)
+    if formato == "csv":
+        lector = csv.DictReader(lineas)
+        for fila in lector:
+            if not any((v or "").strip() for v in fila.values() if isinstance(v, str)):
+                continue
+            yield lector.line_num, {(k or "").strip().lower(): (v or "").strip()
+                                    for k, v in fila.items() if isinstance(v, str)}
+        return
+    for num, linea in enumerate(lineas, start=1):
+        linea = linea.strip()
+        if not linea:
+            continue
+        try:
+            item = json.loads(linea)
+        except ValueError:
+            yield num, None
+            continue
+        yield num, item if isinstance(item, dict) else None
+
+
+def _lead_import_existente(telefono: str, lead_id: str, product_code: str) -> bool:
+    """El lead ya esta en el pipeline: aceptado por /ext/lead asincrono o con
+    alta registrada en el outbox de Boardroom (llaves de
+    _boardroom_outbox_lead_clave). Un funnel de chat registra con el numero
+    de WhatsApp completo (52/521 + 10 digitos) y su funnel, asi que se
+    prueban esas variantes ademas de la del propio /ext/lead."""
+    if lead_id and _state_store.aux_get(_ext_lead_key(lead_id)):
+        return True
+    claves = [_boardroom_outbox_lead_clave(telefono, product_code, lead_id)]
+    for numero in (telefono, f"52{telefono}", f"521{telefono}"):
+        claves.append(_boardroom_outbox_lead_clave(numero, product_code))
+        claves.extend(_boardroom_outbox_lead_clave(numero, product_code, funnel=f)
+                      for f in _BOARDROOM_FUNNELS_POR_PRODUCTO.get(product_code, ()))
+    return any(_state_store.aux_get(_boardroom_outbox_key(_boardroom_outbox_event_id("lead", c)))
+               for c in dict.fromkeys(claves))
+
+
+@app.route("/ext/leads/import", methods=["POST"])
+def ext_leads_import():
+    """Importacion masiva de leads de un socio: CSV (encabezados lead_id,
+    nombre, telefono, interes, source) o JSONL con los mismos campos que
+    /ext/lead. ?formato=csv|jsonl; sin el parametro, text/csv se lee como CSV
+    y lo demas como JSONL.
+
+    Cada fila se valida con la regla de telefono de /ext/lead y se deduplica
+    contra el propio lote, el reporte de Sheets y los leads ya aceptados. Las
+    nuevas van al outbox de Boardroom (diferidas: el programador las drena
+    por lotes, sin llenar el emisor que usan las conversaciones en vivo) y al
+    reporte en appends por lote; el asesor recibe UN resumen en vez de una
+    alerta por lead."""
+    try:
+        if not INTERNAL_TOKEN:
+            log.error("❌ INTERNAL_TOKEN no configurado")
+            return jsonify({"ok": False, "error": "internal_token_not_configured"}), 500
+        if not _is_internal_request(request):
+            return jsonify({"ok": False, "error": "unauthorized"}), 401
+
+        formato = (request.args.get("formato") or "").strip().lower()
+        if not formato:
+            formato = "csv" if (request.mimetype or "") == "text/csv" else "jsonl"
+        if formato not in ("csv", "jsonl"):
+            return jsonify({"ok": False, "error": "invalid_format"}), 400
+
+        t0 = time.perf_counter()
+        en_reporte = _report_telefonos_existentes()
+        vistos: set = set()
+        resultados, candidatos = [], []
+        # Primera pasada sin efectos: valida, deduplica y cuenta. El limite de
+        # filas se aplica aqui, antes de reclamar el indice por telefono o
+        # registrar altas en el outbox; un 413 no deja nada a medias.
+        for num, item in _lead_import_filas(formato):
+            if len(resultados) >= _LEAD_IMPORT_MAX_FILAS:
+                return jsonify({"ok": False, "error": "too_many_rows",
+                                "max_rows": _LEAD_IMPORT_MAX_FILAS}), 413
+            fila = {"linea": num}
+            resultados.append(fila)
+            if item is None:
+                fila.update(estado="invalido", error="invalid_row")
+                continue
+            telefono = _lead_telefono(item.get("telefono"))
+            lead_id = str(item.get("lead_id") or "").strip()[:100]
+            if lead_id:
+                fila["lead_id"] = lead_id
+            if len(telefono) != 10:
+                fila.update(estado="invalido", error="invalid_telefono")
+                continue
+            fila["telefono"] = telefono
+            svc = _lead_payload_to_service(item)
+            product_code = _service_to_product_code(svc)
+            if telefono in vistos or telefono in en_reporte or \
+                    _lead_import_existente(telefono, lead_id, product_code):
+                fila["estado"] = "duplicado"
+                continue
+            vistos.add(telefono)
+            candidatos.append((fila, item, telefono, lead_id, svc, product_code))
+
+        nuevos, reclamados = [], []
+        for fila, item, telefono, lead_id, svc, product_code in candidatos:
+            fuente = str(item.get("source") or "").strip() or "importacion"
+            if not _lead_indice_reclamar(telefono, "asesor", product_code, fuente):
+                fila["estado"] = "duplicado"
+                continue
+            reclamados.append((telefono, product_code))
+            fila["estado"] = "aceptado"
+            nombre = str(item.get("nombre") or "").strip()[:100] or "Sin nombre"
+            datos = {
+                "lead_id": lead_id,
+                "nombre": nombre,
+                "telefono": telefono,
+                "interest": str(item.get("interest") or item.get("interes") or "").strip()
+                            or "sin_especificar",
+                "source": fuente,
+                "service_hint": svc or "general",
+            }
+            nuevos.append({"telefono": telefono, "nombre": nombre, "producto": product_code,
+                           "estado": "importado"})
+            _lead_indice_alta_boardroom(telefono, product_code, datos, lead_id, fuente,
+                                        diferido=True)
+
+        escritas = _report_append_leads(nuevos)
+        conteo = {e: sum(1 for f in resultados if f["estado"] == e)
+                  for e in ("aceptado", "duplicado", "invalido")}
+        asesor_notificado = None
+        if nuevos:
+            muestra = "\n".join(f"• {n['nombre']} — {n['telefono']} ({n['producto']})"
+                                 for n in nuevos[:_LEAD_IMPORT_DIGEST_MUESTRA])
+            resto = len(nuevos) - _LEAD_IMPORT_DIGEST_MUESTRA
+            asesor_notificado = notify_advisor(
+                f"📥 Importación de leads\n"
+                f"Nuevos: {conteo['aceptado']} | Duplicados: {conteo['duplicado']} | "
+                f"Inválidos: {conteo['invalido']}\n{muestra}"
+                + (f"\n… y {resto} más (ver Reporte Leads)" if resto > 0 else "")
+            )
+            if not asesor_notificado:
+                # El asesor no se entero: las marcas del indice se liberan para
+                # que otro canal (o un /ext/lead posterior) si le avise.
+                log.warning("⚠️ /ext/leads/import resumen al asesor no enviado (%s leads)", len(nuevos))
+                for telefono, product_code in reclamados:
+                    _lead_indice_liberar(telefono, "asesor", product_code)
+
+        segundos = time.perf_counter() - t0
+        log.info("✅ /ext/leads/import filas=%s aceptados=%s duplicados=%s invalidos=%s %.2fs",
+                 len(resultados), conteo["aceptado"], conteo["duplicado"],
+                 conteo["invalido"], segundos)
+        return jsonify({
+            "ok": True,
+            "count": len(resultados),
+            "aceptados": conteo["aceptado"],
+            "duplicados": conteo["duplicado"],
+            "invalidos": conteo["invalido"],
+            "filas_reporte": escritas,
+            "asesor_notificado": asesor_notificado,
+            "segundos": round(segundos, 3),
+            "filas_por_segundo": round(len(resultados) / segundos, 1) if segundos > 0 else None,
+            "results": resultados,
+        }), 200
+    except Exception as exc:
+        log.exception("❌ Error en /ext/leads/import: %s", exc)
+        return jsonify({"ok": False, "error": "internal_server_error"}), 500
+
+@app.route("/ext/imss/propuestas", methods=["POST"])
+def ext_imss_propuestas():
+    """Precalificacion IMSS en lote para listas de campaña. Cuerpo JSONL, una
+    linea por lead: {"id": "...", "pension": 12000, "plazo": 24} (`id` y
+    `plazo` opcionales; el plazo debe estar en IMSS_PLAZOS_DISPONIBLES).
+
+    El cuerpo se lee linea por linea del stream, sin cargarlo completo. La
+    respuesta trae una fila por linea no vacia, en el mismo orden, con la
+    propuesta (mismas cifras que calcular_propuesta_imss) o el error de esa
+    linea -- una linea mala no tumba el lote."""
+    try:
+        if not INTERNAL_TOKEN:
+            log.error("❌ INTERNAL_TOKEN no configurado")
+            return jsonify({"ok": False, "error": "internal_token_not_configured"}), 500
+        if not _is_internal_request(request):
+            return jsonify({"ok": False, "error": "unauthorized"}), 401
+
+        filas = []
+        validas = []
+        for num, linea in enumerate(request.stream, start=1):
+            linea = linea.strip()
+            if not linea:
+                continue
+            if len(filas) >= _IMSS_LOTE_MAX_FILAS:
+                return jsonify({"ok": False, "error": "too_many_rows",
+                                "max_rows": _IMSS_LOTE_MAX_FILAS}), 413
+            fila = {"linea": num}
+            filas.append(fila)
+            try:
+                item = json.loads(linea)
+            except ValueError:
+                fila["error"] = "invalid_json"
+                continue
+            if not isinstance(item, dict):
+                fila["error"] = "invalid_json"
+                continue
+            if item.get("id") is not None:
+                fila["id"] = str(item["id"])[:100]
+            pension = item.get("pension")
+            if isinstance(pension, bool) or not isinstance(pension, (int, float)) \
+                    or not 0 < pension < float("inf"):
+                fila["error"] = "invalid_pension"
+                continue
+            plazo = item.get("plazo", IMSS_PLAZO_MESES)
+            if isinstance(plazo, bool) or plazo not in IMSS_PLAZOS_DISPONIBLES:
+                fila["error"] = "invalid_plazo"
+                continue
+            validas.append((fila, float(pension), int(plazo)))
+
+        if validas:
+            lote = calcular_propuestas_imss_lote([v[1] for v in validas],
+                                                 [v[2] for v in validas])
+            for i, (fila, pension, plazo) in enumerate(validas):
+                monto = float(lote["monto"][i])
+                fila.update({
+                    "pension": pension,
+                    "plazo": plazo,
+                    "monto": monto,
+                    "cuota": float(lote["cuota"][i]),
+                    "total": float(lote["total"][i]),
+                    "cuota_max": float(lote["cuota_max"][i]),
+                    "viable": monto >= IMSS_MONTO_MINIMO,
+                })
+
+        log.info("✅ /ext/imss/propuestas filas=%s validas=%s", len(filas), len(validas))
+        return jsonify({
+            "ok": True,
+            "count": len(filas),
+            "errors": len(filas) - len(validas),
+            "results": filas,
+        }), 200
+    except Exception as exc:
+        log.exception("❌ Error en /ext/imss/propuestas: %s", exc)
+        return jsonify({"ok": False, "error": "internal_server_error"}), 500
+
+@app.route("/ext/imss/amortizacion", methods=["GET"])
+def ext_imss_amortizacion():
+    """Tabla de amortizacion en streaming para el asesor:
+    ?monto=80000&plazo=36[&cuota=...][&formato=csv|jsonl]. Sin `cuota` se usa
+    la del cotizador. La respuesta se genera mes a mes, sin armar la tabla en
+    memoria."""
+    if not _is_internal_request(request):
+        return jsonify({"ok": False, "error": "unauthorized"}), 401
+    try:
+        monto = float(request.args.get("monto", ""))
+        plazo = int(request.args.get("plazo", IMSS_PLAZO_MESES))
+        cuota = request.args.get("cuota")
+        cuota = float(cuota) if cuota else None
+    except ValueError:
+        return jsonify({"ok": False, "error": "invalid_params"}), 400
+    if not 0 < monto < float("inf") or plazo not in IMSS_PLAZOS_DISPONIBLES:
+        return jsonify({"ok": False, "error": "invalid_params"}), 400
+    if cuota is not None and not 0 < cuota < float("inf"):
+        return jsonify({"ok": False, "error": "invalid_params"}), 400
+    formato = (request.args.get("formato") or "csv").strip().lower()
+    if formato == "jsonl":
+        return Response(_imss_tabla_amortizacion_jsonl(monto, plazo, cuota),
+                        mimetype="application/x-ndjson")
+    if formato == "csv":
+        return Response(_imss_tabla_amortizacion_csv(monto, plazo, cuota),
+                        mimetype="text/csv")
+    return jsonify({"ok": False, "error": "invalid_format"}), 400
+
+def _imss_flow_key_ring() -> list:
+    """Anillo de llaves del Flow, la vigente primero."""
+    return [k for k in (IMSS_FLOW_PRIVATE_KEY, IMSS_FLOW_PRIVATE_KEY_PREVIOUS) if k]
+
+
+def _imss_flow_key_ring_stats() -> dict:
+    """Contadores por llave con su rol (vigente/anterior) en vez de la huella
+    sola, para decidir cuando retirar la anterior."""
+    stats = imss_flow.key_ring_stats()
+    roles = {}
+    for rol, pem in (("vigente", IMSS_FLOW_PRIVATE_KEY), ("anterior", IMSS_FLOW_PRIVATE_KEY_PREVIOUS)):
+        if pem:
+            huella = imss_flow.key_fingerprint(pem)
+            roles[rol] = dict(stats.get(huella) or {}, fingerprint=huella)
+    return roles
+
+
+def _imss_flow_precargar_llave() -> None:
+    """Parsea las llaves del Flow al arrancar para que el primer data_exchange
+    no pague el parseo. Nunca tumba el arranque: si falla, el endpoint
+    respondera 421 igual que antes y el error queda en el log (solo huella)."""
+    for pem in _imss_flow_key_ring():
+        huella = imss_flow.key_fingerprint(pem)
+        try:
+            imss_flow.load_private_key(pem)
+            log.info("✅ Llave del Flow IMSS cargada (huella=%s).", huella)
+        except imss_flow.FlowDecryptionError:
+            log.error("❌ Llave del Flow IMSS no se pudo parsear (huella=%s).", huella)
+
 # ── Arranque ──────────────────────────────────────────────────────────────────
 _sheets_init()
+_imss_flow_precargar_llave()
+_imss_flow_jobs_reanudar()
+_boardroom_outbox_reanudar()
+_ext_leads_reanudar()
+_advisor_digest_reanudar()
+_advisor_reintentos_arrancar()
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 5000))
@@ -0,0 +1,281 @@
+"""
+Benchmark + arnes de equivalencia de la calculadora IMSS.
+
+Dos partes, un solo reporte JSON:
+
+  equivalencia  Compara cada motor registrado en MOTORES contra la referencia
+                (bench/imss_referencia.py, biseccion original) centavo por
+                centavo: monto, cuota, total y cuota_max, mas las busquedas
+                de primer plazo (viable y para $100,000). Casos aleatorios + casos frontera (pension que deja el
+                monto justo en IMSS_MONTO_MINIMO para cada plazo, cuota_max
+                cayendo en medio centavo por el tope del 30%, extremos).
+  tiempos       Propuesta unitaria (memo frio y caliente), busquedas de plazo
+                contra el recorrido completo del catalogo (aceleracion) y
+                throughput del lote, sobre pensiones representativas.
+
+Las pensiones se comparan ya normalizadas al centavo, que es el contrato de
+calcular_propuesta_imss. Sale con codigo 1 si algun motor difiere, para
+poder usarlo en CI; el JSON queda para comparar corridas en el tiempo.
+
+Uso:
+  python bench/bench_imss_calculadora.py [--out RUTA] [--casos N] [--seed S]
+                                         [--solo-equivalencia]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+_AQUI = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(_AQUI))
+sys.path.insert(0, _AQUI)
+
+import app as vicky_app  # noqa: E402
+import imss_referencia as ref  # noqa: E402
+
+CAMPOS = ("monto", "cuota", "total", "cuota_max")
+PENSIONES_REPRESENTATIVAS = (3000, 5500, 8000, 10000, 12000, 15000, 20000, 35000)
+
+
+def _motor_escalar_frio(pensiones, plazos):
+    vicky_app._imss_memo_propuestas.clear()
+    return [vicky_app.calcular_propuesta_imss(p, n) for p, n in zip(pensiones, plazos)]
+
+
+def _motor_lote(pensiones, plazos):
+    lote = vicky_app.calcular_propuestas_imss_lote(pensiones, plazos)
+    return [{c: float(lote[c][i]) for c in CAMPOS} for i in range(len(pensiones))]
+
+
+# Motor = callable(pensiones, plazos) -> lista de dicts con CAMPOS. Para
+# evaluar un motor nuevo basta registrarlo aqui.
+MOTORES = {
+    "calcular_propuesta_imss": _motor_escalar_frio,
+    "calcular_propuestas_imss_lote": _motor_lote,
+}
+
+
+def _centavos(x: float) -> int:
+    return round(x * 100)
+
+
+def casos_frontera() -> list:
+    casos = []
+    plazos = sorted(vicky_app.IMSS_PLAZOS_DISPONIBLES)
+    for plazo in plazos:
+        # Pension que deja el monto maximo justo en el minimo del producto.
+        g, s = vicky_app._imss_factores_amortizacion(plazo)
+        pension_min = vicky_app.IMSS_MONTO_MINIMO * g / s / vicky_app.IMSS_LIMITE_DESCUENTO
+        for delta in (-0.05, -0.02, -0.01, 0, 0.01, 0.02, 0.05):
+            casos.append((round(pension_min + delta, 2), plazo, "minimo_producto"))
+    # Tope del 30%: pensiones cuya cuota_max cae en medio centavo (x.xx5) o
+    # en un centavo exacto.
+    for base in (1000, 4999, 8000, 12345, 20000, 49999):
+        for cuota_max in (base * 0.3 + 0.005, base * 0.3 + 0.015, base * 0.3):
+            pension = round(cuota_max / vicky_app.IMSS_LIMITE_DESCUENTO, 2)
+            for plazo in (plazos[0], plazos[len(plazos) // 2], plazos[-1]):
+                casos.append((pension, plazo, "tope_30"))
+    for pension in (0.01, 1, 100, 999999.99):
+        for plazo in (plazos[0], plazos[-1]):
+            casos.append((pension, plazo, "extremo"))
+    return casos
+
+
+def casos_aleatorios(n: int, seed: int) -> list:
+    rnd = random.Random(seed)
+    plazos = tuple(vicky_app.IMSS_PLAZOS_DISPONIBLES)
+    return [(round(rnd.uniform(500, 150000), 2), rnd.choice(plazos), "aleatorio")
+            for _ in range(n)]
+
+
+def verificar_equivalencia(casos: list, motores: dict = None) -> dict:
+    motores = MOTORES if motores is None else motores
+    pensiones = [c[0] for c in casos]
+    plazos = [c[1] for c in casos]
+    referencia = [ref.propuesta(p, n) for p, n in zip(pensiones, plazos)]
+    resultado = {}
+    for nombre, motor in motores.items():
+        obtenidos = motor(pensiones, plazos)
+        diferencias = []
+        for (pension, plazo, tipo), esperado, got in zip(casos, referencia, obtenidos):
+            for campo in CAMPOS:
+                if _centavos(got[campo]) != _centavos(esperado[campo]):
+                    diferencias.append({"pension": pension, "plazo": plazo, "tipo": tipo,
+                                        "campo": campo, "esperado": esperado[campo],
+                                        "obtenido": got[campo]})
+        resultado[nombre] = {"casos": len(casos), "diferencias": len(diferencias),
+                             "muestra": diferencias[:20]}
+
+    # Busquedas de plazo contra el recorrido completo original del catalogo.
+    pensiones_unicas = sorted({c[0] for c in casos})
+    for nombre, monto_objetivo, buscar in (
+        ("_imss_primer_plazo_viable", vicky_app.IMSS_MONTO_MINIMO,
+         vicky_app._imss_primer_plazo_viable),
+        ("_imss_primer_plazo_para_monto_100k", 100000,
+         lambda p: vicky_app._imss_primer_plazo_para_monto(p, 100000)),
+    ):
+        vicky_app._imss_memo_plazos.clear()
+        diferencias = []
+        for pension in pensiones_unicas:
+            esperado = ref.primer_plazo_para_monto(pension, monto_objetivo)
+            got = buscar(pension)
+            if (esperado is None) != (got is None) or \
+                    (esperado and (esperado[0] != got[0]
+                                   or _centavos(esperado[1]["monto"]) != _centavos(got[1]["monto"]))):
+                diferencias.append({"pension": pension,
+                                    "esperado": esperado and esperado[0],
+                                    "obtenido": got and got[0]})
+        resultado[nombre] = {"casos": len(pensiones_unicas), "diferencias": len(diferencias),
+                             "muestra": diferencias[:20]}
+    return resultado
+
+
+def _medir(fn, repeticiones: int) -> dict:
+    muestras = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        fn()
+        muestras.append((time.perf_counter() - t0) * 1e6)
+    muestras.sort()
+    return {
+        "n": repeticiones,
+        "media_us": round(statistics.fmean(muestras), 2),
+        "p50_us": round(muestras[len(muestras) // 2], 2),
+        "p95_us": round(muestras[min(len(muestras) - 1, int(len(muestras) * 0.95))], 2),
+        "min_us": round(muestras[0], 2),
+    }
+
+
+def medir_tiempos(repeticiones: int = 50, lote_n: int = 5000, seed: int = 31) -> dict:
+    tiempos = {}
+
+    def propuesta_fria():
+        vicky_app._imss_memo_propuestas.clear()
+        for p in PENSIONES_REPRESENTATIVAS:
+            vicky_app.calcular_propuesta_imss(p)
+
+    def propuesta_caliente():
+        for p in PENSIONES_REPRESENTATIVAS:
+            vicky_app.calcular_propuesta_imss(p)
+
+    def plazo_viable_frio():
+        vicky_app._imss_memo_propuestas.clear()
+        vicky_app._imss_memo_plazos.clear()
+        for p in PENSIONES_REPRESENTATIVAS:
+            vicky_app._imss_primer_plazo_viable(p)
+
+    def plazo_para_monto_frio():
+        vicky_app._imss_memo_propuestas.clear()
+        vicky_app._imss_memo_plazos.clear()
+        for p in PENSIONES_REPRESENTATIVAS:
+            vicky_app._imss_primer_plazo_para_monto(p, 100000)
+
+    def _recorrido_completo(pension, monto_objetivo):
+        # Busqueda previa a la tabla de factores: propuesta completa por plazo.
+        for plazo in sorted(vicky_app.IMSS_PLAZOS_DISPONIBLES):
+            propuesta = vicky_app.calcular_propuesta_imss(pension, plazo)
+            if propuesta["monto"] >= monto_objetivo:
+                return plazo, propuesta
+        return None
+
+    def recorrido_viable_frio():
+        vicky_app._imss_memo_propuestas.clear()
+        for p in PENSIONES_REPRESENTATIVAS:
+            _recorrido_completo(p, vicky_app.IMSS_MONTO_MINIMO)
+
+    def recorrido_para_monto_frio():
+        vicky_app._imss_memo_propuestas.clear()
+        for p in PENSIONES_REPRESENTATIVAS:
+            _recorrido_completo(p, 100000)
+
+    def referencia():
+        for p in PENSIONES_REPRESENTATIVAS:
+            ref.propuesta(p)
+
+    def tabla_amortizacion_60():
+        for _ in PENSIONES_REPRESENTATIVAS:
+            list(vicky_app._imss_tabla_amortizacion(100000, 60, 2992.6))
+
+    n = len(PENSIONES_REPRESENTATIVAS)
+    for nombre, fn, reps in (
+        ("propuesta_memo_frio", propuesta_fria, repeticiones),
+        ("propuesta_memo_caliente", propuesta_caliente, repeticiones),
+        ("primer_plazo_viable", plazo_viable_frio, repeticiones),
+        ("primer_plazo_para_monto_100k", plazo_para_monto_frio, repeticiones),
+        ("recorrido_plazo_viable", recorrido_viable_frio, repeticiones),
+        ("recorrido_plazo_para_monto_100k", recorrido_para_monto_frio, repeticiones),
+        ("referencia_biseccion", referencia, max(3, repeticiones // 10)),
+        ("tabla_amortizacion_60_meses", tabla_amortizacion_60, repeticiones),
+    ):
+        propuesta_caliente()
+        stats = _medir(fn, reps)
+        stats["por_operacion_us"] = round(stats["p50_us"] / n, 2)
+        tiempos[nombre] = stats
+    for busqueda, recorrido in (("primer_plazo_viable", "recorrido_plazo_viable"),
+                                ("primer_plazo_para_monto_100k",
+                                 "recorrido_plazo_para_monto_100k")):
+        tiempos[busqueda]["aceleracion_vs_recorrido"] = round(
+            tiempos[recorrido]["p50_us"] / max(tiempos[busqueda]["p50_us"], 1e-9), 1)
+
+    rnd = random.Random(seed)
+    pensiones = [round(rnd.uniform(2000, 60000), 2) for _ in range(lote_n)]
+    plazos = [rnd.choice(tuple(vicky_app.IMSS_PLAZOS_DISPONIBLES)) for _ in range(lote_n)]
+    t0 = time.perf_counter()
+    vicky_app.calcular_propuestas_imss_lote(pensiones, plazos)
+    dt = time.perf_counter() - t0
+    tiempos["lote"] = {"n": lote_n, "segundos": round(dt, 4),
+                       "propuestas_por_segundo": round(lote_n / dt, 1),
+                       "numpy": vicky_app._numpy_libs}
+    return tiempos
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--out", default=os.path.join(
+        _AQUI, "results", f"imss_calculadora-{datetime.now():%Y%m%d-%H%M%S}.json"))
+    ap.add_argument("--casos", type=int, default=500)
+    ap.add_argument("--seed", type=int, default=31)
+    ap.add_argument("--solo-equivalencia", action="store_true")
+    args = ap.parse_args(argv)
+
+    casos = casos_frontera() + casos_aleatorios(args.casos, args.seed)
+    reporte = {
+        "fecha": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "seed": args.seed,
+        "constantes": {
+            "IMSS_TASA_MENSUAL": vicky_app.IMSS_TASA_MENSUAL,
+            "IMSS_IVA_RATE": vicky_app.IMSS_IVA_RATE,
+            "IMSS_LIMITE_DESCUENTO": vicky_app.IMSS_LIMITE_DESCUENTO,
+            "IMSS_MONTO_MINIMO": vicky_app.IMSS_MONTO_MINIMO,
+            "IMSS_PLAZOS_DISPONIBLES": list(vicky_app.IMSS_PLAZOS_DISPONIBLES),
+        },
+        "equivalencia": verificar_equivalencia(casos),
+    }
+    if not args.solo_equivalencia:
+        reporte["tiempos"] = medir_tiempos(seed=args.seed)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as fh:
+        json.dump(reporte, fh, ensure_ascii=False, indent=2)
+
+    fallas = {k: v["diferencias"] for k, v in reporte["equivalencia"].items() if v["diferencias"]}
+    for nombre, v in reporte["equivalencia"].items():
+        print(f"equivalencia {nombre:32s} casos={v['casos']:5d} diferencias={v['diferencias']}")
+    for nombre, v in reporte.get("tiempos", {}).items():
+        if "p50_us" in v:
+            print(f"tiempo {nombre:30s} p50={v['p50_us']:10.1f} us  p95={v['p95_us']:10.1f} us")
+        else:
+            print(f"tiempo {nombre:30s} {v['propuestas_por_segundo']:,.0f} propuestas/s")
+    print(f"reporte: {args.out}")
+    return 1 if fallas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,297 @@
+"""
+Prueba de carga del endpoint del Flow dinamico IMSS (/ext/flow/imss).
+
+Simula al cliente de WhatsApp Flows igual que el "simulador de Meta" de
+tests/test_imss_dynamic_flow_route.py -- RSA-OAEP para la llave AES,
+AES-GCM para el payload, firma X-Hub-Signature-256 real -- y maneja sesiones
+completas PROFILE -> PENSION -> HANDOFF a la concurrencia indicada.
+
+Meta (send_msg / notify_advisor), Sheets (_report_upsert_lead / _log) y
+Boardroom (_notify_boardroom_lead_qualified) se sustituyen por dobles con
+latencia configurable, asi que nada sale del proceso. Dos modos:
+
+  inproc  cliente de prueba de Flask, sin red (default).
+  http    levanta la app en 127.0.0.1 con werkzeug (threaded) y le pega por
+          HTTP con requests: incluye el costo real de sockets y del servidor.
+
+Reporta throughput (sesiones/s y solicitudes/s), p50/p95/p99 por pantalla
+(medido en el cliente, sin contar el cifrado del lado del cliente), tasa de
+error y los histogramas del propio endpoint (/ext/metrics -> imss_flow_latency).
+
+Uso:
+  python bench/bench_imss_flow_carga.py [--modo inproc|http] [--sesiones N]
+      [--concurrencia C] [--latencia-whatsapp-ms MS] [--latencia-sheets-ms MS]
+      [--latencia-boardroom-ms MS] [--seed S] [--out RUTA]
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from base64 import b64decode, b64encode
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric.padding import MGF1, OAEP
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+_AQUI = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(_AQUI))
+
+import app as vicky_app  # noqa: E402
+import imss_flow  # noqa: E402
+
+_APP_SECRET = "secreto-de-carga"
+PANTALLAS = (imss_flow.SCREEN_PROFILE, imss_flow.SCREEN_PENSION, imss_flow.SCREEN_HANDOFF)
+
+
+# ── Cliente simulado de Meta ─────────────────────────────────────────────────
+def _cifrar(public_key, payload: dict):
+    aes_key, iv = os.urandom(16), os.urandom(16)
+    encryptor = Cipher(algorithms.AES(aes_key), modes.GCM(iv)).encryptor()
+    ciphertext = encryptor.update(json.dumps(payload).encode("utf-8")) + encryptor.finalize()
+    encrypted_aes_key = public_key.encrypt(
+        aes_key, OAEP(mgf=MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None))
+    body = json.dumps({
+        "encrypted_flow_data": b64encode(ciphertext + encryptor.tag).decode("utf-8"),
+        "encrypted_aes_key": b64encode(encrypted_aes_key).decode("utf-8"),
+        "initial_vector": b64encode(iv).decode("utf-8"),
+    }).encode("utf-8")
+    return body, aes_key, iv
+
+
+def _descifrar(texto: str, aes_key: bytes, iv: bytes) -> dict:
+    raw = b64decode(texto)
+    decryptor = Cipher(algorithms.AES(aes_key),
+                       modes.GCM(bytes(b ^ 0xFF for b in iv), raw[-16:])).decryptor()
+    return json.loads((decryptor.update(raw[:-16]) + decryptor.finalize()).decode("utf-8"))
+
+
+def _firmar(body: bytes) -> str:
+    return "sha256=" + hmac.new(_APP_SECRET.encode(), body, hashlib.sha256).hexdigest()
+
+
+class _TransporteInproc:
+    def post(self, body: bytes, firma: str):
+        resp = vicky_app.app.test_client().post(
+            "/ext/flow/imss", data=body, content_type="application/json",
+            headers={"X-Hub-Signature-256": firma})
+        return resp.status_code, resp.get_data(as_text=True)
+
+    def cerrar(self):
+        pass
+
+
+class _TransporteHttp:
+    def __init__(self):
+        import requests
+        from werkzeug.serving import make_server
+        self._server = make_server("127.0.0.1", 0, vicky_app.app, threaded=True)
+        self.url = f"http://127.0.0.1:{self._server.server_port}/ext/flow/imss"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self._local = threading.local()
+        self._requests = requests
+
+    def post(self, body: bytes, firma: str):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = self._requests.Session()
+        resp = session.post(self.url, data=body, timeout=30, headers={
+            "Content-Type": "application/json", "X-Hub-Signature-256": firma})
+        return resp.status_code, resp.text
+
+    def cerrar(self):
+        self._server.shutdown()
+
+
+# ── Dobles de Meta / Sheets / Boardroom ──────────────────────────────────────
+def instalar_dobles(latencia_whatsapp_ms: float = 0, latencia_sheets_ms: float = 0,
+                    latencia_boardroom_ms: float = 0) -> dict:
+    """Sustituye los efectos externos por dobles con latencia fija y devuelve
+    los contadores de llamadas. Pensado para un proceso dedicado a la carga:
+    no restaura los originales."""
+    llamadas = {"whatsapp": 0, "asesor": 0, "sheets": 0, "boardroom": 0}
+    lock = threading.Lock()
+
+    def doble(nombre, latencia_ms, resultado=True):
+        def fn(*_a, **_k):
+            if latencia_ms:
+                time.sleep(latencia_ms / 1000)
+            with lock:
+                llamadas[nombre] += 1
+            return resultado
+        return fn
+
+    vicky_app.APP_SECRET = _APP_SECRET
+    vicky_app.send_msg = doble("whatsapp", latencia_whatsapp_ms)
+    vicky_app.notify_advisor = doble("asesor", latencia_whatsapp_ms)
+    vicky_app._report_upsert_lead = doble("sheets", latencia_sheets_ms, None)
+    vicky_app._log = doble("sheets", latencia_sheets_ms, None)
+    vicky_app._imss_log_lead_backup = doble("sheets", latencia_sheets_ms, None)
+    vicky_app._notify_boardroom_lead_qualified = doble("boardroom", latencia_boardroom_ms)
+    return llamadas
+
+
+def instalar_llave() -> object:
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    vicky_app.IMSS_FLOW_PRIVATE_KEY = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    ).decode("utf-8")
+    vicky_app.IMSS_FLOW_PRIVATE_KEY_PREVIOUS = ""
+    return private_key.public_key()
+
+
+# ── Sesiones ─────────────────────────────────────────────────────────────────
+def _paso(transporte, public_key, payload: dict, muestras: list, pantalla: str):
+    body, aes_key, iv = _cifrar(public_key, payload)
+    firma = _firmar(body)
+    t0 = time.perf_counter()
+    try:
+        status, texto = transporte.post(body, firma)
+    except Exception:
+        muestras.append((pantalla, (time.perf_counter() - t0) * 1000, False))
+        return None
+    dt = (time.perf_counter() - t0) * 1000
+    respuesta = None
+    if status == 200:
+        try:
+            respuesta = _descifrar(texto, aes_key, iv)
+        except Exception:
+            respuesta = None
+    ok = respuesta is not None and "error_message" not in (respuesta.get("data") or {})
+    muestras.append((pantalla, dt, ok))
+    return respuesta if ok else None
+
+
+def correr_sesion(transporte, public_key, indice: int, rnd: random.Random) -> list:
+    """Una sesion completa del Flow para un telefono nuevo. Devuelve las
+    muestras (pantalla, ms, ok); se detiene en el primer paso fallido."""
+    phone = f"52166{indice:08d}"
+    token = imss_flow.generate_flow_token()
+    vicky_app._imss_flow_sesion_crear(token, phone)
+    muestras = []
+    pension = str(rnd.randint(8000, 40000))
+    r = _paso(transporte, public_key, {
+        "action": "data_exchange", "screen": imss_flow.SCREEN_PROFILE,
+        "data": {"profile": "1"}, "flow_token": token}, muestras, imss_flow.SCREEN_PROFILE)
+    if r is None:
+        return muestras
+    r = _paso(transporte, public_key, {
+        "action": "data_exchange", "screen": imss_flow.SCREEN_PENSION,
+        "data": {"profile": "1", "pension": pension}, "flow_token": token},
+        muestras, imss_flow.SCREEN_PENSION)
+    if r is None:
+        return muestras
+    _paso(transporte, public_key, {
+        "action": "data_exchange", "screen": imss_flow.SCREEN_HANDOFF,
+        "data": {"profile": "1", "pension": pension, "monto": r["data"]["monto"],
+                 "pago": r["data"]["pago"], "plazo": r["data"]["plazo"],
+                 "nombre": f"Prospecto {indice}"},
+        "flow_token": token}, muestras, imss_flow.SCREEN_HANDOFF)
+    return muestras
+
+
+def _percentil(ordenadas: list, q: float) -> float:
+    if not ordenadas:
+        return 0.0
+    return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * q))]
+
+
+def resumir(muestras: list, sesiones: int, segundos: float) -> dict:
+    por_pantalla = {}
+    for pantalla in PANTALLAS:
+        ms = sorted(dt for p, dt, _ in muestras if p == pantalla)
+        errores = sum(1 for p, _, ok in muestras if p == pantalla and not ok)
+        por_pantalla[pantalla] = {
+            "solicitudes": len(ms),
+            "errores": errores,
+            "p50_ms": round(_percentil(ms, 0.50), 2),
+            "p95_ms": round(_percentil(ms, 0.95), 2),
+            "p99_ms": round(_percentil(ms, 0.99), 2),
+            "max_ms": round(ms[-1], 2) if ms else 0.0,
+        }
+    total = len(muestras)
+    errores = sum(1 for *_, ok in muestras if not ok)
+    return {
+        "sesiones": sesiones,
+        "segundos": round(segundos, 3),
+        "sesiones_por_segundo": round(sesiones / segundos, 2) if segundos else 0.0,
+        "solicitudes": total,
+        "solicitudes_por_segundo": round(total / segundos, 2) if segundos else 0.0,
+        "tasa_error": round(errores / total, 4) if total else 0.0,
+        "pantallas": por_pantalla,
+    }
+
+
+def ejecutar(sesiones: int = 100, concurrencia: int = 8, modo: str = "inproc",
+             seed: int = 37, **latencias) -> dict:
+    llamadas = instalar_dobles(**latencias)
+    public_key = instalar_llave()
+    transporte = _TransporteHttp() if modo == "http" else _TransporteInproc()
+    rnd_base = random.Random(seed)
+    semillas = [rnd_base.random() for _ in range(sesiones)]
+    try:
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+            resultados = list(pool.map(
+                lambda i: correr_sesion(transporte, public_key, i, random.Random(semillas[i])),
+                range(sesiones)))
+        segundos = time.perf_counter() - t0
+    finally:
+        transporte.cerrar()
+    resumen = resumir([m for r in resultados for m in r], sesiones, segundos)
+    resumen.update({"modo": modo, "concurrencia": concurrencia,
+                    "llamadas_dobles": dict(llamadas),
+                    "servidor": vicky_app._imss_flow_latency_stats()})
+    return resumen
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--modo", choices=("inproc", "http"), default="inproc")
+    ap.add_argument("--sesiones", type=int, default=200)
+    ap.add_argument("--concurrencia", type=int, default=8)
+    ap.add_argument("--latencia-whatsapp-ms", type=float, default=0)
+    ap.add_argument("--latencia-sheets-ms", type=float, default=0)
+    ap.add_argument("--latencia-boardroom-ms", type=float, default=0)
+    ap.add_argument("--seed", type=int, default=37)
+    ap.add_argument("--out", default=os.path.join(
+        _AQUI, "results", f"imss_flow_carga-{datetime.now():%Y%m%d-%H%M%S}.json"))
+    args = ap.parse_args(argv)
+
+    resumen = ejecutar(
+        sesiones=args.sesiones, concurrencia=args.concurrencia, modo=args.modo, seed=args.seed,
+        latencia_whatsapp_ms=args.latencia_whatsapp_ms,
+        latencia_sheets_ms=args.latencia_sheets_ms,
+        latencia_boardroom_ms=args.latencia_boardroom_ms)
+    reporte = {"fecha": datetime.now(timezone.utc).isoformat(),
+               "python": platform.python_version(), "seed": args.seed, **resumen}
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as fh:
+        json.dump(reporte, fh, ensure_ascii=False, indent=2)
+
+    print(f"modo={resumen['modo']} concurrencia={resumen['concurrencia']} "
+          f"sesiones={resumen['sesiones']} en {resumen['segundos']}s  "
+          f"{resumen['sesiones_por_segundo']} sesiones/s  "
+          f"{resumen['solicitudes_por_segundo']} solicitudes/s  "
+          f"error={resumen['tasa_error']:.2%}")
+    for pantalla, v in resumen["pantallas"].items():
+        print(f"  {pantalla:16s} n={v['solicitudes']:5d} p50={v['p50_ms']:8.2f} ms  "
+              f"p95={v['p95_ms']:8.2f} ms  p99={v['p99_ms']:8.2f} ms  errores={v['errores']}")
+    print(f"reporte: {args.out}")
+    return 1 if resumen["tasa_error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+"""
+Referencia de la calculadora IMSS: puerto literal del modo "Calcular por
+pension" de cotizador_prestamos_imss.jsx, tal como vivia en app.py antes del
+motor de forma cerrada (biseccion anidada + amortizacion simulada mes a mes).
+
+No se usa en produccion. Es la vara contra la que bench_imss_calculadora.py
+compara, centavo por centavo, cualquier motor optimizado. Lee las constantes
+de `app` en cada llamada, asi que sigue a la configuracion vigente.
+"""
+
+import app as vicky_app
+
+
+def cuota(monto: float, plazo: int) -> float:
+    lo, hi = monto / plazo, monto
+    for _ in range(120):
+        mid = (lo + hi) / 2
+        saldo = monto
+        for _m in range(plazo):
+            interes = saldo * vicky_app.IMSS_TASA_MENSUAL
+            saldo -= mid - interes - interes * vicky_app.IMSS_IVA_RATE
+        if abs(saldo) < 0.01:
+            return mid
+        if saldo > 0:
+            lo = mid
+        else:
+            hi = mid
+    return (lo + hi) / 2
+
+
+def monto_maximo(cuota_max: float, plazo: int) -> float:
+    lo, hi = 0.0, cuota_max * plazo * 2
+    for _ in range(120):
+        mid = (lo + hi) / 2
+        c = cuota(mid, plazo)
+        if abs(c - cuota_max) < 0.01:
+            return mid
+        if c > cuota_max:
+            hi = mid
+        else:
+            lo = mid
+    return (lo + hi) / 2
+
+
+def propuesta(pension: float, plazo: int = None) -> dict:
+    plazo = vicky_app.IMSS_PLAZO_MESES if plazo is None else plazo
+    cuota_max = pension * vicky_app.IMSS_LIMITE_DESCUENTO
+    monto = monto_maximo(cuota_max, plazo)
+    c = cuota(monto, plazo)
+    return {"monto": monto, "cuota": c, "total": c * plazo,
+            "plazo": plazo, "cuota_max": cuota_max}
+
+
+def primer_plazo_para_monto(pension: float, monto_objetivo: float):
+    for p in sorted(vicky_app.IMSS_PLAZOS_DISPONIBLES):
+        pr = propuesta(pension, p)
+        if pr["monto"] >= monto_objetivo:
+            return p, pr
+    return None
@@ -16,10 +16,13 @@
 
 from __future__ import annotations
 
+import hashlib
 import json
+import threading
+import time
 import uuid
 from base64 import b64decode, b64encode
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Dict, Optional, Sequence, Tuple, Union
 
 from cryptography.hazmat.primitives.asymmetric.padding import OAEP, MGF1
 from cryptography.hazmat.primitives import hashes
@@ -327,34 +330,157 @@ class FlowDecryptionError(Exception):
     publica del lado del cliente)."""
 
 
+# ── Cache de la llave privada ya parseada ─────────────────────────────────────
+# Parsear un PEM RSA de 2048 bits cuesta milisegundos reales y antes ocurria
+# en CADA data_exchange, en la ruta critica de latencia. La llave parseada se
+# guarda por proceso, indexada por la huella SHA-256 del texto PEM: si la
+# variable de entorno cambia, la huella cambia y se parsea la nueva. La huella
+# es lo unico que puede aparecer en logs -- nunca el PEM ni la llave.
+_KEY_CACHE_MAX = 8
+_key_cache: Dict[str, Any] = {}
+_key_cache_lock = threading.Lock()
+
+
+def key_fingerprint(private_key_pem: str) -> str:
+    """Huella corta (SHA-256 del PEM, 16 hex). Segura para logs."""
+    return hashlib.sha256((private_key_pem or "").encode("utf-8")).hexdigest()[:16]
+
+
+def load_private_key(private_key_pem: str):
+    """Llave privada parseada, desde el cache si ya se vio este PEM. Segura
+    entre hilos: dos requests simultaneos con un PEM nuevo lo parsean una
+    sola vez. Lanza FlowDecryptionError (sin detalle del PEM) si no parsea."""
+    huella = key_fingerprint(private_key_pem)
+    key = _key_cache.get(huella)
+    if key is not None:
+        return key
+    with _key_cache_lock:
+        key = _key_cache.get(huella)
+        if key is not None:
+            return key
+        try:
+            key = load_pem_private_key(private_key_pem.encode("utf-8"), password=None)
+        except Exception as e:
+            raise FlowDecryptionError(f"invalid private key (fingerprint={huella})") from e
+        if len(_key_cache) >= _KEY_CACHE_MAX:
+            _key_cache.pop(next(iter(_key_cache)))
+        _key_cache[huella] = key
+        return key
+
+
+def clear_key_cache() -> None:
+    with _key_cache_lock:
+        _key_cache.clear()
+        _key_stats.clear()
+
+
+# ── Anillo de llaves (rotacion sin ventana de caida) ─────────────────────────
+# decrypt_request acepta una lista ordenada de PEMs, la mas nueva primero.
+# Meta cifra la llave AES con la llave publica que tenga registrada en ese
+# momento; durante una rotacion pueden llegar solicitudes de ambas. Probar una
+# llave equivocada cuesta una operacion RSA privada (falla el padding OAEP) y
+# nada mas: el AES-GCM solo corre con la llave que si desenvolvio.
+#
+# Contadores por huella: cuando `decrypted` de la llave anterior deja de
+# crecer (ver last_used_at), ya se puede retirar.
+_key_stats: Dict[str, Dict[str, Any]] = {}
+
+
+def _key_stat(huella: str, campo: str) -> None:
+    with _key_cache_lock:
+        st = _key_stats.setdefault(huella, {"decrypted": 0, "rejected": 0,
+                                            "invalid": 0, "last_used_at": None})
+        st[campo] += 1
+        if campo == "decrypted":
+            st["last_used_at"] = time.time()
+
+
+def key_ring_stats() -> Dict[str, Dict[str, Any]]:
+    """Contadores por huella: decrypted (desenvolvio la llave AES), rejected
+    (no era la llave de esa solicitud), invalid (el PEM no parsea)."""
+    with _key_cache_lock:
+        return {h: dict(st) for h, st in _key_stats.items()}
+
+
+def _as_key_ring(private_key_pem: Union[str, Sequence[str]]) -> list:
+    if isinstance(private_key_pem, str):
+        return [private_key_pem]
+    return [k for k in (private_key_pem or ()) if k]
+
+
+def _unwrap_aes_key(encrypted_aes_key: bytes, key_ring: list,
+                    timings: Dict[str, float]) -> bytes:
+    key_load = rsa_unwrap = 0.0
+    try:
+        for idx, pem in enumerate(key_ring):
+            huella = key_fingerprint(pem)
+            t0 = time.perf_counter()
+            try:
+                private_key = load_private_key(pem)
+            except FlowDecryptionError:
+                _key_stat(huella, "invalid")
+                continue
+            finally:
+                key_load += time.perf_counter() - t0
+            t1 = time.perf_counter()
+            try:
+                aes_key = private_key.decrypt(
+                    encrypted_aes_key,
+                    OAEP(mgf=MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None),
+                )
+            except Exception:
+                _key_stat(huella, "rejected")
+                continue
+            finally:
+                rsa_unwrap += time.perf_counter() - t1
+            _key_stat(huella, "decrypted")
+            timings["key_index"] = idx
+            return aes_key
+    finally:
+        timings["key_load_ms"] = key_load * 1000
+        timings["rsa_unwrap_ms"] = rsa_unwrap * 1000
+    raise FlowDecryptionError(f"no key in ring could unwrap the AES key (keys={len(key_ring)})")
+
+
 def decrypt_request(
     encrypted_flow_data_b64: str,
     encrypted_aes_key_b64: str,
     initial_vector_b64: str,
-    private_key_pem: str,
+    private_key_pem: Union[str, Sequence[str]],
+    timings: Optional[Dict[str, float]] = None,
 ) -> Tuple[Dict[str, Any], bytes, bytes]:
     """(payload_descifrado, aes_key, iv). Lanza FlowDecryptionError si algo
     falla -- nunca deja escapar el traceback original (podria filtrar
-    detalles de la clave privada en logs)."""
+    detalles de la clave privada en logs).
+
+    `private_key_pem` es un PEM o un anillo ordenado de PEMs (la mas nueva
+    primero); gana la primera llave que desenvuelva la llave AES.
+
+    Si se pasa `timings`, se llena con la duracion en ms de cada fase:
+    key_load_ms (cache de la llave), rsa_unwrap_ms (RSA-OAEP de la llave AES,
+    sumando las llaves probadas) y aes_gcm_ms (descifrado + parseo del
+    payload), mas key_index (posicion en el anillo de la llave que sirvio).
+    Solo se registran las fases que alcanzaron a correr."""
+    timings = {} if timings is None else timings
     try:
         flow_data = b64decode(encrypted_flow_data_b64)
         iv = b64decode(initial_vector_b64)
         encrypted_aes_key = b64decode(encrypted_aes_key_b64)
 
-        private_key = load_pem_private_key(private_key_pem.encode("utf-8"), password=None)
-        aes_key = private_key.decrypt(
-            encrypted_aes_key,
-            OAEP(mgf=MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None),
-        )
+        aes_key = _unwrap_aes_key(encrypted_aes_key, _as_key_ring(private_key_pem), timings)
+        t2 = time.perf_counter()
 
         encrypted_body = flow_data[:-_AES_TAG_LEN]
         tag = flow_data[-_AES_TAG_LEN:]
         decryptor = Cipher(algorithms.AES(aes_key), modes.GCM(iv, tag)).decryptor()
         decrypted_bytes = decryptor.update(encrypted_body) + decryptor.finalize()
         payload = json.loads(decrypted_bytes.decode("utf-8"))
+        timings["aes_gcm_ms"] = (time.perf_counter() - t2) * 1000
         if not isinstance(payload, dict):
             raise ValueError("decrypted payload is not a JSON object")
         return payload, aes_key, iv
+    except FlowDecryptionError:
+        raise
     except Exception as e:
         raise FlowDecryptionError(str(e)) from e
 
@@ -0,0 +1,192 @@
+"""
+Modo resumen de alertas al asesor (ADVISOR_DIGEST_ENABLED): las alertas no
+urgentes se juntan en adv_digest y salen en un solo mensaje numerado; las
+urgentes siguen saliendo solas. El wamid de cada resumen guarda los ids de
+todas las alertas incluidas.
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as vicky_app
+
+ADVISOR = "5216682478005"
+
+
+class FakeResp:
+    def __init__(self, status_code, wamid=""):
+        self.status_code = status_code
+        self.text = "" if status_code < 400 else "error"
+        self._wamid = wamid
+
+    def json(self):
+        return {"messages": [{"id": self._wamid}]} if self._wamid else {}
+
+
+@pytest.fixture
+def entorno(monkeypatch):
+    monkeypatch.setattr(vicky_app, "_state_store", vicky_app.StateStore())
+    monkeypatch.setattr(vicky_app, "ADVISOR_NUM", ADVISOR)
+    monkeypatch.setattr(vicky_app, "ADV_TPL", "alerta_lead_asesor")
+    monkeypatch.setattr(vicky_app, "ADVISOR_DIGEST_ENABLED", True)
+    monkeypatch.setattr(vicky_app, "ADVISOR_DIGEST_WINDOW_S", 300)
+    monkeypatch.setattr(vicky_app, "ADVISOR_DIGEST_MAX", 10)
+    monkeypatch.setattr(vicky_app, "_adv_digest_contadores",
+                        dict.fromkeys(vicky_app._adv_digest_contadores, 0))
+    vicky_app._ADV_STATUS_SEEN.clear()
+    vicky_app._ADV_STATUS_SET.clear()
+    registros, programados, envios, meta = [], [], [], {"status": 200}
+    monkeypatch.setattr(vicky_app, "_log", lambda *a, **k: registros.append(a))
+    monkeypatch.setattr(vicky_app, "_advisor_digest_programar",
+                        lambda espera: programados.append(espera))
+
+    def wa_post(payload):
+        envios.append(payload)
+        return FakeResp(meta["status"], f"wamid.{len(envios)}")
+
+    monkeypatch.setattr(vicky_app, "_wa_post", wa_post)
+    return envios, programados, registros, meta
+
+
+def _texto(payload):
+    if payload["type"] == "text":
+        return payload["text"]["body"]
+    return payload["template"]["components"][0]["parameters"][0]["text"]
+
+
+def _pendientes():
+    return vicky_app._advisor_digest_lista(vicky_app._state_store.aux_get(vicky_app._ADV_DIGEST_KEY))
+
+
+def test_alertas_no_urgentes_salen_en_un_solo_resumen(entorno):
+    envios, programados, _, _ = entorno
+
+    for i in range(3):
+        assert vicky_app.notify_advisor(f"NUEVO LEAD {i}") is True
+
+    assert envios == [] and programados == [300]
+    ids = [a["id"] for a in _pendientes()]
+
+    vicky_app._advisor_digest_vaciar()
+
+    assert len(envios) == 1
+    texto = _texto(envios[0])
+    assert texto.startswith("📋 RESUMEN DE ALERTAS (3)")
+    assert "1) NUEVO LEAD 0" in texto and "3) NUEVO LEAD 2" in texto
+    assert vicky_app._advisor_wamid_lookup("wamid.1")["alertas"] == ids
+    assert _pendientes() == []
+    st = vicky_app._advisor_digest_stats()
+    assert st["encoladas"] == 3 and st["resumenes"] == 1 and st["alertas_resumidas"] == 3
+
+
+def test_urgente_no_espera_al_resumen(entorno):
+    envios, programados, _, _ = entorno
+
+    vicky_app.notify_advisor("📣 CONTACTO DIRECTO", urgente=True)
+
+    assert len(envios) == 1 and _texto(envios[0]) == "📣 CONTACTO DIRECTO"
+    assert programados == [] and _pendientes() == []
+    assert vicky_app._advisor_digest_stats()["inmediatas"] == 1
+
+
+def test_resumen_lleno_se_envia_sin_esperar_la_ventana(monkeypatch, entorno):
+    _, programados, _, _ = entorno
+    monkeypatch.setattr(vicky_app, "ADVISOR_DIGEST_MAX", 2)
+
+    vicky_app.notify_advisor("lead a")
+    vicky_app.notify_advisor("lead b")
+
+    assert programados == [300, 0]
+
+
+def test_ventana_cerrada_parte_el_resumen_en_templates(entorno):
+    envios, _, _, _ = entorno
+    vicky_app._advisor_window_expire()
+    for i in range(4):
+        vicky_app.notify_advisor(f"LEAD {i} " + "x" * 300)
+
+    vicky_app._advisor_digest_vaciar()
+
+    assert len(envios) == 2 and all(p["type"] == "template" for p in envios)
+    assert all(len(_texto(p)) <= vicky_app._TPL_PARAM_LIMIT for p in envios)
+    incluidas = (vicky_app._advisor_wamid_lookup("wamid.1")["alertas"]
+                 + vicky_app._advisor_wamid_lookup("wamid.2")["alertas"])
+    assert len(set(incluidas)) == 4
+
+
+def test_failed_de_un_resumen_reenvia_conservando_los_ids(entorno):
+    envios, _, _, _ = entorno
+    vicky_app.notify_advisor("lead a")
+    vicky_app.notify_advisor("lead b")
+    vicky_app._advisor_digest_vaciar()
+    ids = vicky_app._advisor_wamid_lookup("wamid.1")["alertas"]
+
+    vicky_app._handle_statuses([{"id": "wamid.1", "status": "failed",
+                                 "recipient_id": ADVISOR}])
+
+    assert len(envios) == 2 and envios[1]["type"] == "template"
+    assert vicky_app._advisor_wamid_lookup("wamid.2")["alertas"] == ids
+
+
+def test_failed_de_un_resumen_largo_se_reparte_en_templates_sin_truncar(entorno):
+    envios, _, _, _ = entorno
+    for i in range(4):
+        vicky_app.notify_advisor(f"LEAD {i} " + "x" * 300)
+    vicky_app._advisor_digest_vaciar()
+    assert len(envios) == 1 and envios[0]["type"] == "text"
+    ids = vicky_app._advisor_wamid_lookup("wamid.1")["alertas"]
+
+    vicky_app._handle_statuses([{"id": "wamid.1", "status": "failed",
+                                 "recipient_id": ADVISOR}])
+
+    reenvios = envios[1:]
+    assert len(reenvios) >= 2 and all(p["type"] == "template" for p in reenvios)
+    assert all(len(_texto(p)) < vicky_app._TPL_PARAM_LIMIT for p in reenvios)
+    assert all(f"LEAD {i} " in "".join(_texto(p) for p in reenvios) for i in range(4))
+    incluidas = [a for n in range(2, len(envios) + 1)
+                 for a in vicky_app._advisor_wamid_lookup(f"wamid.{n}")["alertas"]]
+    assert sorted(incluidas) == sorted(ids)
+
+
+def test_una_sola_alerta_larga_con_ventana_cerrada_se_trunca_en_el_template(entorno):
+    envios, _, _, _ = entorno
+    vicky_app._advisor_window_expire()
+    vicky_app.notify_advisor("LEAD IMSS " + "x" * 1000)
+    ids = [a["id"] for a in _pendientes()]
+
+    vicky_app._advisor_digest_vaciar()
+
+    assert len(envios) == 1 and envios[0]["type"] == "template"
+    assert len(_texto(envios[0])) <= vicky_app._TPL_PARAM_LIMIT
+    assert vicky_app._advisor_wamid_lookup("wamid.1")["alertas"] == ids
+    assert _pendientes() == []
+
+
+def test_resumen_fallido_se_reintenta_y_al_agotarse_queda_registrado(entorno):
+    envios, programados, registros, meta = entorno
+    meta["status"] = 500
+    vicky_app.notify_advisor("lead a")
+
+    for _ in range(len(vicky_app._ADV_DIGEST_BACKOFF_S) + 1):
+        vicky_app._advisor_digest_vaciar()
+
+    assert programados == [300, *vicky_app._ADV_DIGEST_BACKOFF_S]
+    assert _pendientes() == []
+    assert any(r[5] == "error" and r[6] == "resumen_agotado" for r in registros)
+    assert vicky_app._advisor_digest_stats()["perdidas"] == 1
+
+
+def test_reinicio_retoma_el_resumen_pendiente(entorno):
+    _, programados, _, _ = entorno
+    vicky_app._state_store.aux_set(
+        vicky_app._ADV_DIGEST_KEY,
+        json.dumps([{"id": "abc", "ts": 0, "msg": "lead previo", "intentos": 0}]), 60)
+
+    vicky_app._advisor_digest_reanudar()
+
+    assert programados == [300]
@@ -0,0 +1,220 @@
+"""
+Reintentos programados de alertas al asesor (ADVISOR_RETRY_ENABLED): cada
+alerta aceptada por Meta queda en el conjunto ordenado adv_reintentos hasta
+que llega `delivered`/`read`; las vencidas se reenvian por prioridad, en
+lotes y con backoff, sin depender de trafico entrante ni de adv_retry:<wamid>.
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as vicky_app
+
+ADVISOR = "5216682478005"
+
+
+class FakeResp:
+    def __init__(self, status_code, wamid=""):
+        self.status_code = status_code
+        self.text = "" if status_code < 400 else "error"
+        self._wamid = wamid
+
+    def json(self):
+        return {"messages": [{"id": self._wamid}]} if self._wamid else {}
+
+
+@pytest.fixture
+def entorno(monkeypatch):
+    monkeypatch.setattr(vicky_app, "_state_store", vicky_app.StateStore())
+    monkeypatch.setattr(vicky_app, "ADVISOR_NUM", ADVISOR)
+    monkeypatch.setattr(vicky_app, "ADV_TPL", "alerta_lead_asesor")
+    monkeypatch.setattr(vicky_app, "ADVISOR_DIGEST_ENABLED", False)
+    monkeypatch.setattr(vicky_app, "ADVISOR_RETRY_ENABLED", True)
+    monkeypatch.setattr(vicky_app, "ADVISOR_RETRY_CONFIRM_S", 1800)
+    monkeypatch.setattr(vicky_app, "ADVISOR_RETRY_BATCH", 20)
+    monkeypatch.setattr(vicky_app, "_adv_reintento_contadores",
+                        dict.fromkeys(vicky_app._adv_reintento_contadores, 0))
+    vicky_app._ADV_STATUS_SEEN.clear()
+    vicky_app._ADV_STATUS_SET.clear()
+    registros, envios, meta = [], [], {"status": 200}
+    monkeypatch.setattr(vicky_app, "_log", lambda *a, **k: registros.append(a))
+
+    def wa_post(payload):
+        envios.append(payload)
+        return FakeResp(meta["status"], f"wamid.r{len(envios)}")
+
+    monkeypatch.setattr(vicky_app, "_wa_post", wa_post)
+    return envios, registros, meta
+
+
+def _texto(payload):
+    if payload["type"] == "text":
+        return payload["text"]["body"]
+    return payload["template"]["components"][0]["parameters"][0]["text"]
+
+
+def _rid(wamid):
+    return vicky_app._advisor_wamid_lookup(wamid)["reintento"]
+
+
+def _vencer(rid):
+    vicky_app._state_store.aux_zadd(vicky_app._ADV_REINTENTO_ZSET, rid, time.time() - 1, 60)
+
+
+def _status(wamid, status):
+    vicky_app._handle_statuses([{"id": wamid, "status": status, "recipient_id": ADVISOR}])
+
+
+def test_alerta_aceptada_espera_confirmacion_y_delivered_la_retira(entorno):
+    vicky_app.notify_advisor("NUEVO LEAD")
+    rid = _rid("wamid.r1")
+
+    pendientes = vicky_app._state_store.aux_zvencidos(
+        vicky_app._ADV_REINTENTO_ZSET, time.time() + 3600, 10)
+    assert [m for m, _ in pendientes] == [rid]
+    assert pendientes[0][1] > time.time() + 1700
+
+    _status("wamid.r1", "delivered")
+
+    assert vicky_app._state_store.aux_zcard(vicky_app._ADV_REINTENTO_ZSET) == 0
+    st = vicky_app._advisor_reintentos_stats()
+    assert st["seguidas"] == 1 and st["confirmadas"] == 1 and st["programadas"] == 0
+
+
+def test_failed_sin_template_se_reenvia_en_el_siguiente_tick(monkeypatch, entorno):
+    envios, _, _ = entorno
+    monkeypatch.setattr(vicky_app, "ADV_TPL", "")
+    vicky_app.notify_advisor("NUEVO LEAD")
+    rid = _rid("wamid.r1")
+
+    _status("wamid.r1", "failed")
+    assert len(envios) == 1
+    assert vicky_app._advisor_reintentos_procesar() == 1
+
+    assert len(envios) == 2 and _texto(envios[1]) == "NUEVO LEAD"
+    assert _rid("wamid.r2") == rid
+    assert vicky_app._advisor_reintento_cargar(rid)["intentos"] == 1
+
+
+def test_cuerpo_sobrevive_al_ttl_de_adv_retry(entorno):
+    envios, _, _ = entorno
+    vicky_app.notify_advisor("NUEVO LEAD IMSS")
+    vicky_app._state_store._aux_mem.pop("adv_retry:wamid.r1")
+
+    _status("wamid.r1", "failed")
+
+    assert len(envios) == 2 and envios[1]["type"] == "template"
+    assert _texto(envios[1]) == "NUEVO LEAD IMSS"
+    assert _rid("wamid.r2") == _rid("wamid.r1")
+
+
+def test_vencidas_se_atienden_por_prioridad_en_lotes(monkeypatch, entorno):
+    envios, _, _ = entorno
+    vicky_app.notify_advisor("lead normal 1")
+    vicky_app.notify_advisor("lead normal 2")
+    vicky_app.notify_advisor("📣 CONTACTO DIRECTO", urgente=True)
+    _status("wamid.r1", "sent")  # el numero si recibe statuses del asesor
+    for w in ("wamid.r1", "wamid.r2", "wamid.r3"):
+        _vencer(_rid(w))
+    monkeypatch.setattr(vicky_app, "ADVISOR_RETRY_BATCH", 2)
+
+    assert vicky_app._advisor_reintentos_procesar() == 2
+    assert [_texto(p) for p in envios[3:]] == ["📣 CONTACTO DIRECTO", "lead normal 1"]
+    assert vicky_app._advisor_reintentos_procesar() == 1
+    assert _texto(envios[-1]) == "lead normal 2"
+
+
+def test_sin_statuses_del_asesor_no_se_reenvia_por_falta_de_confirmacion(entorno):
+    envios, _, _ = entorno
+    vicky_app.notify_advisor("NUEVO LEAD")
+    _vencer(_rid("wamid.r1"))
+
+    vicky_app._advisor_reintentos_procesar()
+
+    assert len(envios) == 1
+    assert vicky_app._advisor_reintentos_stats()["sin_statuses"] == 1
+    assert vicky_app._state_store.aux_zcard(vicky_app._ADV_REINTENTO_ZSET) == 0
+
+
+def test_reenvios_fallidos_usan_backoff_y_al_agotarse_quedan_en_sheets(monkeypatch, entorno):
+    envios, registros, meta = entorno
+    monkeypatch.setattr(vicky_app, "ADV_TPL", "")
+    vicky_app.notify_advisor("NUEVO LEAD")
+    rid = _rid("wamid.r1")
+    _status("wamid.r1", "failed")
+    meta["status"] = 500
+
+    esperas = []
+    for _ in range(len(vicky_app._ADV_REINTENTO_BACKOFF_S) + 1):
+        vicky_app._advisor_reintentos_procesar()
+        pendiente = vicky_app._state_store.aux_zvencidos(
+            vicky_app._ADV_REINTENTO_ZSET, time.time() + 10 ** 6, 1)
+        if pendiente:
+            esperas.append(round(pendiente[0][1] - time.time(), -1))
+            _vencer(rid)
+
+    assert esperas == [float(s) for s in vicky_app._ADV_REINTENTO_BACKOFF_S]
+    assert len(envios) == 1 + len(vicky_app._ADV_REINTENTO_BACKOFF_S)
+    assert any(r[5] == "error" and r[6] == "reintento_agotado" for r in registros)
+    assert vicky_app._advisor_reintentos_stats()["agotadas"] == 1
+
+
+def test_reenvio_aceptado_sin_wamid_vuelve_a_esperar_confirmacion(monkeypatch, entorno):
+    envios, _, _ = entorno
+    monkeypatch.setattr(vicky_app, "ADV_TPL", "")
+    vicky_app.notify_advisor("NUEVO LEAD")
+    rid = _rid("wamid.r1")
+    _status("wamid.r1", "failed")
+    monkeypatch.setattr(vicky_app, "_wa_post", lambda payload: envios.append(payload) or FakeResp(200))
+
+    assert vicky_app._advisor_reintentos_procesar() == 1
+
+    pendiente = vicky_app._state_store.aux_zvencidos(
+        vicky_app._ADV_REINTENTO_ZSET, time.time() + 10 ** 6, 10)
+    assert [m for m, _ in pendiente] == [rid]
+    assert pendiente[0][1] > time.time() + 1700
+
+
+def test_resumen_repartido_sigue_cada_parte_por_separado(monkeypatch, entorno):
+    envios, _, _ = entorno
+    monkeypatch.setattr(vicky_app, "ADVISOR_DIGEST_ENABLED", True)
+    monkeypatch.setattr(vicky_app, "_advisor_digest_programar", lambda espera: None)
+    for i in range(4):
+        vicky_app.notify_advisor(f"LEAD {i} " + "x" * 300)
+    vicky_app._advisor_digest_vaciar()
+    padre = _rid("wamid.r1")
+
+    _status("wamid.r1", "failed")
+
+    assert [p["type"] for p in envios] == ["text", "template", "template"]
+    parte1, parte2 = _rid("wamid.r2"), _rid("wamid.r3")
+    assert len({padre, parte1, parte2}) == 3
+    assert vicky_app._advisor_reintento_cargar(parte2)["alertas"] == \
+        vicky_app._advisor_wamid_lookup("wamid.r3")["alertas"]
+
+    _status("wamid.r2", "delivered")
+    pendientes = vicky_app._state_store.aux_zvencidos(
+        vicky_app._ADV_REINTENTO_ZSET, time.time() + 10 ** 6, 10)
+    assert [m for m, _ in pendientes] == [parte2]
+
+    _status("wamid.r3", "failed")
+    _vencer(parte2)
+    assert vicky_app._advisor_reintentos_procesar() == 1
+    reenvio = _texto(envios[-1])
+    assert "LEAD 0 " not in reenvio and "LEAD 3 " in reenvio
+
+
+def test_zrem_solo_reclama_una_vez():
+    store = vicky_app.StateStore()
+    store.aux_zadd("cola", "a", 1.0, 60)
+    store.aux_zadd("cola", "b", 2.0, 60)
+
+    assert store.aux_zvencidos("cola", 1.5, 10) == [("a", 1.0)]
+    assert store.aux_zrem("cola", "a") is True
+    assert store.aux_zrem("cola", "a") is False
+    assert store.aux_zcard("cola") == 1
@@ -0,0 +1,102 @@
+"""
+Circuito de la llamada sincrona de autoridad a Boardroom: abre tras fallas
+seguidas, manda directo al fallback neutral mientras esta abierto, sondea en
+semiabierto y nunca rompe el latch (un turno cortocircuitado no produce una
+Observacion extra desde el finally de handle()).
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as vicky_app
+
+PHONE = "5216681234567"
+
+
+@pytest.fixture
+def circuito(monkeypatch):
+    reloj = {"t": 1000.0}
+    monkeypatch.setattr(vicky_app.time, "monotonic", lambda: reloj["t"])
+    monkeypatch.setattr(vicky_app, "BOARDROOM_BREAKER_THRESHOLD", 3)
+    monkeypatch.setattr(vicky_app, "BOARDROOM_BREAKER_COOLDOWN_S", 30)
+    c = vicky_app._CircuitoBoardroom()
+    monkeypatch.setattr(vicky_app, "_circuito_boardroom", c)
+
+    fallbacks, llamadas, respuesta = [], [], {"error": "timeout"}
+    monkeypatch.setattr(vicky_app, "_send_neutral_fallback", lambda phone: fallbacks.append(phone))
+
+    def pedir(payload):
+        llamadas.append(payload)
+        if respuesta["error"]:
+            return None, respuesta["error"]
+        return {"instruction": {"type": "no_action"}}, None
+
+    monkeypatch.setattr(vicky_app, "_request_boardroom_instruction", pedir)
+    monkeypatch.setattr(vicky_app, "_confirm_boardroom_execution", lambda *a: None)
+    monkeypatch.setattr(vicky_app._tl, "boardroom_event", {"event_id": "e"}, raising=False)
+    monkeypatch.setattr(vicky_app._tl, "boardroom_emitted", False, raising=False)
+    return c, reloj, fallbacks, llamadas, respuesta
+
+
+def _turno():
+    vicky_app._tl.boardroom_emitted = False
+    return vicky_app._handle_boardroom_authority(PHONE, {}, "text", "hola")
+
+
+def test_abre_tras_fallas_seguidas_y_cortocircuita(circuito):
+    c, _, fallbacks, llamadas, _ = circuito
+
+    for _ in range(3):
+        assert _turno() is True
+    assert c.estado == "abierto" and len(llamadas) == 3
+
+    assert _turno() is True
+    assert len(llamadas) == 3, "con el circuito abierto no se llama a Boardroom"
+    assert len(fallbacks) == 4
+    assert vicky_app._tl.boardroom_emitted is True, "el latch sigue arriba"
+    assert c.stats()["cortocircuitos"] == 1
+
+
+def test_cuatro_xx_no_abre_el_circuito(circuito):
+    c, _, _, llamadas, respuesta = circuito
+    respuesta["error"] = "http_401"
+    for _ in range(5):
+        _turno()
+    assert c.estado == "cerrado" and len(llamadas) == 5
+
+
+def test_semiabierto_deja_pasar_una_sonda(circuito):
+    c, reloj, _, llamadas, respuesta = circuito
+    for _ in range(3):
+        _turno()
+    reloj["t"] += 31
+
+    # Sonda fallida: vuelve a abrir de inmediato, sin esperar otras 3 fallas.
+    _turno()
+    assert len(llamadas) == 4 and c.estado == "abierto"
+    _turno()
+    assert len(llamadas) == 4
+
+    reloj["t"] += 31
+    respuesta["error"] = None
+    _turno()
+    assert c.estado == "cerrado" and len(llamadas) == 5
+    st = c.stats()
+    assert st["aperturas"] == 2 and st["sondas"] == 2
+    assert st["latencia_ms"]["count"] == 5
+
+
+def test_circuito_abierto_no_duplica_observacion_en_handle(monkeypatch, circuito):
+    c, *_ = circuito
+    c.estado, c._abierto_en = "abierto", 1000.0
+    emitidas = []
+    monkeypatch.setattr(vicky_app, "_emit_boardroom_observation", lambda p: emitidas.append(p))
+
+    _turno()
+    vicky_app._flush_boardroom_observation()
+
+    assert emitidas == []
@@ -0,0 +1,102 @@
+"""
+Emisor de fondo hacia el bus / Boardroom: hilos acotados, cola con tope y
+politica de desborde explicita (descartar y contar). Cada trabajo se ejecuta
+una sola vez: las Observaciones siguen con maximo un intento por mensaje.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as vicky_app
+
+
+class CapturedThread:
+    """Registra el hilo sin arrancarlo: el trabajo se queda en la cola."""
+    lanzados = []
+
+    def __init__(self, target, args=(), kwargs=None, daemon=None):
+        self.target = target
+        CapturedThread.lanzados.append(self)
+
+    def start(self):
+        pass
+
+
+def test_cola_llena_descarta_y_cuenta_sin_crear_hilos_de_mas(monkeypatch):
+    CapturedThread.lanzados = []
+    monkeypatch.setattr(vicky_app.threading, "Thread", CapturedThread)
+    emisor = vicky_app._EmisorBoardroom(workers=2, capacidad=3)
+    ejecutados = []
+
+    aceptados = [emisor.enviar("observation", ejecutados.append, i) for i in range(5)]
+
+    assert aceptados == [True, True, True, False, False]
+    assert len(CapturedThread.lanzados) == 2
+    st = emisor.stats()
+    assert st["descartados"] == 2 and st["encolados"] == 3 and st["en_cola"] == 3
+    assert st["por_tipo"]["observation"] == {"encolados": 3, "descartados": 2}
+
+    # Un solo hilo vacia toda la cola y termina; el otro sale sin trabajo.
+    for hilo in CapturedThread.lanzados:
+        hilo.target()
+    assert ejecutados == [0, 1, 2]
+    st = emisor.stats()
+    assert st["activos"] == 0 and st["en_cola"] == 0 and st["ejecutados"] == 3
+
+
+def test_reserva_deja_lugar_al_trafico_en_vivo(monkeypatch):
+    CapturedThread.lanzados = []
+    monkeypatch.setattr(vicky_app.threading, "Thread", CapturedThread)
+    emisor = vicky_app._EmisorBoardroom(workers=1, capacidad=4)
+
+    diferidos = [emisor.enviar("outbox", print, i, reserva=2) for i in range(3)]
+    en_vivo = [emisor.enviar("observation", print, i) for i in range(2)]
+
+    assert diferidos == [True, True, False] and en_vivo == [True, True]
+    assert emisor.stats()["descartados"] == 0
+
+
+def test_trabajo_fallido_no_se_reintenta(monkeypatch):
+    CapturedThread.lanzados = []
+    monkeypatch.setattr(vicky_app.threading, "Thread", CapturedThread)
+    emisor = vicky_app._EmisorBoardroom(workers=1, capacidad=10)
+    intentos = []
+
+    def revienta():
+        intentos.append(1)
+        raise RuntimeError("boom")
+
+    emisor.enviar("bus_event", revienta)
+    CapturedThread.lanzados[0].target()
+
+    assert intentos == [1]
+    assert emisor.stats()["fallidos"] == 1
+
+
+def test_observacion_descartada_no_llega_a_boardroom(monkeypatch):
+    CapturedThread.lanzados = []
+    monkeypatch.setattr(vicky_app.threading, "Thread", CapturedThread)
+    monkeypatch.setattr(vicky_app, "_BUS_ACTIVE", True)
+    monkeypatch.setattr(vicky_app, "BUS_URL", "https://boardroom-engine.test")
+    monkeypatch.setattr(vicky_app, "BUS_INTERNAL_TOKEN", "token-de-prueba")
+    emisor = vicky_app._EmisorBoardroom(workers=1, capacidad=1)
+    monkeypatch.setattr(vicky_app, "_boardroom_emisor", emisor)
+    posts = []
+    monkeypatch.setattr(vicky_app, "_boardroom_http_post",
+                        lambda url, **k: posts.append(url) or type("R", (), {"status_code": 202})())
+
+    for i in range(2):
+        vicky_app._emit_boardroom_observation({"phone": f"52166800000{i}", "message": "hola"})
+    CapturedThread.lanzados[0].target()
+
+    assert len(posts) == 1
+    assert emisor.stats()["descartados"] == 1
+
+
+def test_metrics_expone_el_emisor(monkeypatch):
+    monkeypatch.setattr(vicky_app, "INTERNAL_TOKEN", "t")
+    client = vicky_app.app.test_client()
+    data = client.get("/ext/metrics", headers={"X-Internal-Token": "t"}).get_json()
+    assert {"workers", "capacidad", "descartados", "en_cola"} <= set(data["boardroom_emitter"])
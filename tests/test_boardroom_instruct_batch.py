@@ -0,0 +1,135 @@
+"""
+/ext/boardroom/instruct/batch: un lote (arreglo JSON o JSONL) de
+instrucciones de Boardroom, validadas una por una y encoladas en el carril de
+su telefono, con resultado por elemento.
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as vicky_app
+
+
+class ImmediateThread:
+    def __init__(self, target, args=(), kwargs=None, daemon=None):
+        self.target = target
+        self.args = args
+        self.kwargs = kwargs or {}
+
+    def start(self):
+        self.target(*self.args, **self.kwargs)
+
+
+HEADERS = {"X-Internal-Token": "test-token"}
+
+
+@pytest.fixture
+def cliente(monkeypatch):
+    monkeypatch.setenv("INTERNAL_TOKEN", "test-token")
+    monkeypatch.setattr(vicky_app.threading, "Thread", ImmediateThread)
+    monkeypatch.setattr(vicky_app, "_boardroom_ejecutor", vicky_app._EjecutorPorTelefono(4, 100))
+    monkeypatch.setattr(vicky_app, "user_data", {})
+    manejados = []
+    monkeypatch.setattr(vicky_app, "handle", lambda msg_obj: manejados.append(
+        (msg_obj["from"], msg_obj["text"]["body"])))
+    enviados = []
+    monkeypatch.setattr(vicky_app, "send_msg", lambda to, text: enviados.append(to) or True)
+    monkeypatch.setattr(vicky_app, "notify_advisor", lambda msg: True)
+    return vicky_app.app.test_client(), manejados, enviados
+
+
+def _msg(phone, text):
+    return {"phone": phone, "instruction": "handle_message", "payload": {"text": text}}
+
+
+def test_arreglo_json_reporta_resultado_por_elemento(cliente):
+    client, manejados, enviados = cliente
+    lote = [
+        _msg("6681111111", "uno"),
+        {"phone": "6682222222", "instruction": "send_message"},
+        {"phone": "", "instruction": "handle_message"},
+        {"phone": "6683333333", "instruction": "existing_client_greeting",
+         "payload": {"nombre": "Ana", "producto": "IMSS"}},
+        {"phone": "6684444444", "instruction": "hot_transfer", "payload": "texto"},
+    ]
+
+    resp = client.post("/ext/boardroom/instruct/batch", json=lote, headers=HEADERS)
+
+    assert resp.status_code == 202
+    body = resp.get_json()
+    assert body["encoladas"] == 2 and body["rechazadas"] == 3
+    assert [r["ok"] for r in body["resultados"]] == [True, False, False, True, False]
+    assert "desconocida" in body["resultados"][1]["error"]
+    assert manejados == [("6681111111", "uno")]
+    assert enviados == ["6683333333"]
+
+
+def test_jsonl_conserva_el_orden_por_telefono(cliente):
+    client, manejados, _ = cliente
+    lineas = [_msg("6681111111", "a"), _msg("6682222222", "x"), _msg("6681111111", "b")]
+    cuerpo = "\n".join(json.dumps(l) for l in lineas) + "\n"
+
+    resp = client.post("/ext/boardroom/instruct/batch", data=cuerpo,
+                       content_type="application/x-ndjson", headers=HEADERS)
+
+    assert resp.status_code == 202
+    assert [t for p, t in manejados if p == "6681111111"] == ["a", "b"]
+
+
+def test_lote_sin_token_o_demasiado_grande(monkeypatch, cliente):
+    client, *_ = cliente
+    assert client.post("/ext/boardroom/instruct/batch", json=[]).status_code == 401
+
+    monkeypatch.setattr(vicky_app, "BOARDROOM_INSTRUCT_BATCH_MAX", 2)
+    resp = client.post("/ext/boardroom/instruct/batch", headers=HEADERS,
+                       json=[_msg("668", "a")] * 3)
+    assert resp.status_code == 413
+    assert client.post("/ext/boardroom/instruct/batch", headers=HEADERS,
+                       data="{no es json", content_type="application/json").status_code == 400
+
+
+def test_carril_lleno_rechaza_sin_bloquear(monkeypatch, cliente):
+    client, *_ = cliente
+
+    class CapturedThread:
+        def __init__(self, *a, **k):
+            pass
+
+        def start(self):
+            pass
+
+    monkeypatch.setattr(vicky_app.threading, "Thread", CapturedThread)
+    monkeypatch.setattr(vicky_app, "_boardroom_ejecutor", vicky_app._EjecutorPorTelefono(1, 2))
+
+    resp = client.post("/ext/boardroom/instruct/batch", headers=HEADERS,
+                       json=[_msg("6681111111", str(i)) for i in range(3)])
+
+    resultados = resp.get_json()["resultados"]
+    assert [r["ok"] for r in resultados] == [True, True, False]
+    assert resultados[2]["error"] == "cola llena"
+    assert vicky_app._boardroom_ejecutor.stats()["descartados"] == 1
+
+
+def test_instruccion_individual_con_carril_lleno_responde_503(monkeypatch, cliente):
+    client, *_ = cliente
+
+    class CapturedThread:
+        def __init__(self, *a, **k):
+            pass
+
+        def start(self):
+            pass
+
+    monkeypatch.setattr(vicky_app.threading, "Thread", CapturedThread)
+    monkeypatch.setattr(vicky_app, "_boardroom_ejecutor", vicky_app._EjecutorPorTelefono(1, 1))
+
+    primera = client.post("/ext/boardroom/instruct", headers=HEADERS, json=_msg("6681111111", "a"))
+    segunda = client.post("/ext/boardroom/instruct", headers=HEADERS, json=_msg("6681111111", "b"))
+
+    assert primera.status_code == 200
+    assert segunda.status_code == 503 and segunda.get_json()["error"] == "cola llena"
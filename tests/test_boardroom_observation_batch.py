@@ -0,0 +1,124 @@
+"""
+Observaciones en lote hacia /bus/event (BOARDROOM_OBSERVATION_BATCH_ENABLED):
+un POST por ventana, message_id intacto en cada evento, tope en bytes y
+vuelta a envios sueltos cuando el bus no acepta lotes.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as vicky_app
+
+
+class ImmediateThread:
+    def __init__(self, target, args=(), kwargs=None, daemon=None):
+        self.target = target
+        self.args = args
+        self.kwargs = kwargs or {}
+
+    def start(self):
+        self.target(*self.args, **self.kwargs)
+
+
+class FakeTimer:
+    """No dispara solo: el test decide cuando vence la ventana."""
+    creados = []
+
+    def __init__(self, interval, fn):
+        self.interval = interval
+        self.daemon = False
+        FakeTimer.creados.append(self)
+
+    def start(self):
+        pass
+
+
+class _Resp:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+def _preparar(monkeypatch, status_lote=202):
+    FakeTimer.creados = []
+    monkeypatch.setattr(vicky_app.threading, "Thread", ImmediateThread)
+    monkeypatch.setattr(vicky_app.threading, "Timer", FakeTimer)
+    monkeypatch.setattr(vicky_app, "_BUS_ACTIVE", True)
+    monkeypatch.setattr(vicky_app, "BUS_URL", "https://boardroom-engine.test")
+    monkeypatch.setattr(vicky_app, "BUS_INTERNAL_TOKEN", "token-de-prueba")
+    monkeypatch.setattr(vicky_app, "BOARDROOM_OBSERVATION_BATCH_ENABLED", True)
+    monkeypatch.setattr(vicky_app, "_boardroom_emisor", vicky_app._EmisorBoardroom(2, 50))
+    lote = vicky_app._LoteObservaciones()
+    monkeypatch.setattr(vicky_app, "_lote_observaciones", lote)
+    posts = []
+
+    def fake_post(url, **kwargs):
+        body = kwargs["json"]
+        posts.append(body)
+        return _Resp(status_lote if "events" in body else 202)
+
+    monkeypatch.setattr(vicky_app, "_boardroom_http_post", fake_post)
+    return lote, posts
+
+
+def _obs(i):
+    return {"event_type": "OBSERVATION_EVENT", "phone": f"52166800000{i}",
+            "message_id": f"wamid.{i}", "message": "hola"}
+
+
+def test_ventana_junta_observaciones_en_un_solo_post(monkeypatch):
+    lote, posts = _preparar(monkeypatch)
+
+    for i in range(3):
+        vicky_app._emit_boardroom_observation(_obs(i))
+    assert posts == [] and len(FakeTimer.creados) == 1
+
+    lote.vencer()
+
+    assert len(posts) == 1
+    assert [e["message_id"] for e in posts[0]["events"]] == ["wamid.0", "wamid.1", "wamid.2"]
+    st = lote.stats()
+    assert st["solicitudes"] == {"lote": 1, "individual": 0}
+    assert st["tamano_lote"]["le_5"] == 1 and st["tamano_lote"]["le_2"] == 0
+
+
+def test_tope_en_bytes_cierra_el_lote_antes_de_la_ventana(monkeypatch):
+    lote, posts = _preparar(monkeypatch)
+    peso = len(vicky_app.json.dumps(_obs(0)).encode("utf-8"))
+    monkeypatch.setattr(vicky_app, "BOARDROOM_OBSERVATION_BATCH_BYTES", peso * 2)
+
+    for i in range(3):
+        vicky_app._emit_boardroom_observation(_obs(i))
+
+    assert len(posts) == 1 and len(posts[0]["events"]) == 2
+    lote.vencer()
+    assert [len(p["events"]) for p in posts] == [2, 1]
+
+
+def test_bus_que_rechaza_lotes_vuelve_a_envios_sueltos(monkeypatch):
+    lote, posts = _preparar(monkeypatch, status_lote=400)
+
+    vicky_app._emit_boardroom_observation(_obs(0))
+    vicky_app._emit_boardroom_observation(_obs(1))
+    lote.vencer()
+
+    # El lote rechazado + cada evento una sola vez por separado.
+    assert len(posts) == 3
+    assert [p.get("message_id") for p in posts[1:]] == ["wamid.0", "wamid.1"]
+    assert lote.soportado is False
+
+    vicky_app._emit_boardroom_observation(_obs(2))
+    lote.vencer()
+    assert posts[-1]["message_id"] == "wamid.2" and len(posts) == 4
+    assert lote.stats()["solicitudes"] == {"lote": 1, "individual": 3}
+
+
+def test_lote_con_5xx_no_se_reintenta(monkeypatch):
+    lote, posts = _preparar(monkeypatch, status_lote=503)
+
+    vicky_app._emit_boardroom_observation(_obs(0))
+    lote.vencer()
+
+    assert len(posts) == 1
+    assert lote.soportado is True
@@ -0,0 +1,148 @@
+"""
+Outbox durable hacia Boardroom: el evento de lead/documento se registra una
+sola vez por llave de idempotencia, se entrega con backoff, sobrevive a un
+reinicio (indice boardroom_outbox) y termina en la DLQ si nunca entra.
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as vicky_app
+
+PHONE = "5216681234567"
+
+
+class ImmediateThread:
+    def __init__(self, target, args=(), kwargs=None, daemon=None):
+        self.target = target
+        self.args = args
+        self.kwargs = kwargs or {}
+
+    def start(self):
+        self.target(*self.args, **self.kwargs)
+
+
+class CapturedThread:
+    def __init__(self, *a, **k):
+        pass
+
+    def start(self):
+        pass
+
+
+@pytest.fixture
+def outbox(monkeypatch):
+    monkeypatch.setattr(vicky_app.threading, "Thread", ImmediateThread)
+    monkeypatch.setattr(vicky_app, "_state_store", vicky_app.StateStore())
+    monkeypatch.setattr(vicky_app, "_boardroom_emisor", vicky_app._EmisorBoardroom(2, 50))
+    monkeypatch.setattr(vicky_app, "BOARDROOM_API_TOKEN", "token-boardroom")
+    # El indice de leads por telefono suprimiria el segundo alta antes de
+    # llegar al outbox; aqui se prueba la idempotencia del outbox mismo.
+    monkeypatch.setattr(vicky_app, "LEAD_DEDUPE_WINDOW_S", 0)
+    monkeypatch.setattr(vicky_app, "_boardroom_outbox_contadores",
+                        dict.fromkeys(vicky_app._boardroom_outbox_contadores, 0))
+    programados, llamadas, respuesta = [], [], {"ok": True}
+    monkeypatch.setattr(vicky_app, "_boardroom_outbox_programar",
+                        lambda event_id, espera: programados.append((event_id, espera)))
+
+    def notificar(phone, product_code, data, event_id=None):
+        llamadas.append(event_id)
+        return respuesta["ok"]
+
+    monkeypatch.setattr(vicky_app, "_notify_boardroom_lead_qualified", notificar)
+    return programados, llamadas, respuesta
+
+
+def _registro(event_id):
+    return json.loads(vicky_app._state_store.aux_get(f"boardroom_outbox:{event_id}"))
+
+
+def test_lead_se_entrega_una_vez_con_event_id_estable(outbox):
+    _, llamadas, _ = outbox
+
+    e1 = vicky_app._boardroom_outbox_lead(PHONE, "seguro_vida", {"nombre": "Ana"})
+    e2 = vicky_app._boardroom_outbox_lead(PHONE, "seguro_vida", {"nombre": "Ana"})
+
+    assert e1 == e2 and llamadas == [e1]
+    assert _registro(e1)["estado"] == "entregado"
+    assert vicky_app._state_store.aux_smembers(vicky_app._BOARDROOM_OUTBOX_INDICE) == set()
+    st = vicky_app._boardroom_outbox_stats()
+    assert st["total_entregados"] == 1 and st["total_duplicados"] == 1
+    assert st["entrega_lag_ms"]["count"] == 1
+
+
+def test_funnels_que_comparten_producto_no_se_tapan(outbox):
+    _, llamadas, _ = outbox
+
+    auto = vicky_app._boardroom_outbox_lead(PHONE, "seguro_vida", {}, funnel="auto")
+    vida = vicky_app._boardroom_outbox_lead(PHONE, "seguro_vida", {}, funnel="vida")
+
+    assert auto != vida and llamadas == [auto, vida]
+
+
+def test_evento_no_persistido_no_cuenta_como_registrado(monkeypatch, outbox):
+    _, llamadas, _ = outbox
+    monkeypatch.setattr(vicky_app._state_store, "aux_update", lambda key, fn, ttl: False)
+
+    event_id = vicky_app._boardroom_outbox_lead(PHONE, "seguro_vida", {}, funnel="vrim")
+
+    assert llamadas == [event_id]
+    st = vicky_app._boardroom_outbox_contadores
+    assert st["registrados"] == 0 and st["no_persistidos"] == 1
+    assert vicky_app._state_store.aux_smembers(vicky_app._BOARDROOM_OUTBOX_INDICE) == set()
+
+
+def test_falla_reintenta_con_backoff_y_termina_en_dlq(outbox):
+    programados, llamadas, respuesta = outbox
+    respuesta["ok"] = False
+
+    event_id = vicky_app._boardroom_outbox_lead(PHONE, "prestamo_imss_ley73", {}, lead_id="lead-1")
+    for _ in vicky_app._BOARDROOM_OUTBOX_BACKOFF_S:
+        vicky_app._boardroom_outbox_entregar(event_id)
+
+    assert [e for e, _ in programados] == [event_id] * len(vicky_app._BOARDROOM_OUTBOX_BACKOFF_S)
+    assert [s for _, s in programados] == list(vicky_app._BOARDROOM_OUTBOX_BACKOFF_S)
+    assert set(llamadas) == {event_id}
+    assert _registro(event_id)["estado"] == "dlq"
+    assert vicky_app._state_store.aux_smembers(vicky_app._BOARDROOM_OUTBOX_DLQ) == {event_id}
+    assert vicky_app._boardroom_outbox_stats()["pendientes"] == 0
+
+
+def test_evento_pendiente_se_retoma_tras_reinicio(monkeypatch, outbox):
+    programados, llamadas, _ = outbox
+    monkeypatch.setattr(vicky_app.threading, "Thread", CapturedThread)
+
+    event_id = vicky_app._boardroom_outbox_documento(PHONE, "media-123", "image")
+    assert vicky_app._boardroom_outbox_stats()["pendientes"] == 1
+
+    documentos = []
+    monkeypatch.setattr(vicky_app, "_notify_boardroom_document",
+                        lambda phone, media_id, doc_type, event_id=None, media=None:
+                        documentos.append((media_id, event_id)) or True)
+    vicky_app._boardroom_outbox_reanudar()
+    assert programados == [(event_id, 0)]
+
+    vicky_app._boardroom_outbox_entregar(event_id)
+    assert documentos == [("media-123", event_id)]
+    assert vicky_app._boardroom_outbox_stats()["pendientes"] == 0
+
+
+def test_ext_lead_registra_en_el_outbox_con_lead_id(monkeypatch, outbox):
+    _, llamadas, _ = outbox
+    monkeypatch.setattr(vicky_app, "INTERNAL_TOKEN", "test-token")
+    monkeypatch.setattr(vicky_app, "notify_advisor", lambda msg: True)
+    client = vicky_app.app.test_client()
+    lead = {"lead_id": "lead-77", "nombre": "Ana", "telefono": "6680000000",
+            "interes": "prestamo_imss"}
+
+    for _ in range(2):
+        assert client.post("/ext/lead", json=lead,
+                           headers={"X-Internal-Token": "test-token"}).status_code == 200
+
+    assert len(llamadas) == 1
+    assert _registro(llamadas[0])["clave"] == "lead-77"
@@ -0,0 +1,128 @@
+"""
+Ruteo especulativo (BOARDROOM_SPECULATIVE_ENABLED): la respuesta local solo
+se prepara si Boardroom falla o va lento, y solo se envia si Boardroom no
+resuelve el turno dentro del plazo. Con el circuito abierto, fallback neutral.
+"""
+
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as vicky_app
+
+PHONE = "5216681234567"
+TEXTO = "tengo una duda sobre el credito y los intereses"
+
+
+@pytest.fixture
+def entorno(monkeypatch):
+    monkeypatch.setattr(vicky_app, "BOARDROOM_SPECULATIVE_ENABLED", True)
+    monkeypatch.setattr(vicky_app, "BOARDROOM_SPECULATIVE_DEADLINE_MS", 2000)
+    monkeypatch.setattr(vicky_app, "_circuito_boardroom", vicky_app._CircuitoBoardroom())
+    monkeypatch.setattr(vicky_app, "_especulacion_stats", dict.fromkeys(vicky_app._especulacion_stats, 0))
+    monkeypatch.setattr(vicky_app, "_oai", object())
+    gpt = []
+    monkeypatch.setattr(vicky_app, "ask_gpt",
+                        lambda prompt, svc=None: gpt.append(prompt) or "respuesta local")
+    sent, confirmados = [], []
+    monkeypatch.setattr(vicky_app, "send_msg", lambda to, text: sent.append(text) or True)
+    monkeypatch.setattr(vicky_app, "_confirm_boardroom_execution",
+                        lambda body, executed, status, error: confirmados.append((executed, error)))
+    monkeypatch.setattr(vicky_app._tl, "boardroom_event", {"event_id": "e"}, raising=False)
+    return sent, confirmados, gpt
+
+
+def _turno(texto=TEXTO):
+    vicky_app._tl.boardroom_emitted = False
+    return vicky_app._handle_boardroom_authority(PHONE, {}, "text", texto)
+
+
+def test_instruccion_a_tiempo_no_calcula_el_candidato(monkeypatch, entorno):
+    sent, _, gpt = entorno
+    monkeypatch.setattr(vicky_app, "_request_boardroom_instruction", lambda p: (
+        {"instruction": {"type": "send_message", "message": "de boardroom"}}, None))
+
+    _turno()
+
+    assert sent == ["de boardroom"]
+    assert vicky_app._especulacion_stats["descartados"] == 1
+    assert gpt == [], "Boardroom contesto a tiempo: no se paga el candidato"
+
+
+def test_error_de_boardroom_compromete_el_candidato(monkeypatch, entorno):
+    sent, _, _ = entorno
+    monkeypatch.setattr(vicky_app, "_request_boardroom_instruction", lambda p: (None, "http_503"))
+
+    _turno()
+
+    assert sent == ["respuesta local"]
+    assert vicky_app._especulacion_stats["comprometidos"] == 1
+
+
+def test_sin_contexto_financiero_cae_al_fallback_neutral(monkeypatch, entorno):
+    sent, _, _ = entorno
+    monkeypatch.setattr(vicky_app, "_request_boardroom_instruction", lambda p: (None, "timeout"))
+
+    _turno("zzz texto que no rutea a nada")
+
+    assert sent == [vicky_app.NEUTRAL_FALLBACK_MESSAGE]
+
+
+def test_plazo_vencido_contesta_y_avisa_a_boardroom_cuando_llega_tarde(monkeypatch, entorno):
+    sent, confirmados, _ = entorno
+    monkeypatch.setattr(vicky_app, "BOARDROOM_SPECULATIVE_DEADLINE_MS", 50)
+    soltar, termino = threading.Event(), threading.Event()
+
+    def lento(payload):
+        soltar.wait(5)
+        return {"instruction_id": "i-1", "instruction": {"type": "send_message", "message": "tarde"}}, None
+
+    monkeypatch.setattr(vicky_app, "_request_boardroom_instruction", lento)
+    original = vicky_app._especulacion_contar
+    monkeypatch.setattr(vicky_app, "_especulacion_contar",
+                        lambda campo: original(campo) or (campo == "tardios" and termino.set()))
+
+    _turno()
+    assert sent == ["respuesta local"]
+    assert vicky_app._tl.boardroom_emitted is True
+
+    soltar.set()
+    assert termino.wait(5)
+    assert sent == ["respuesta local"], "la instruccion tardia no se ejecuta"
+    assert confirmados == [(False, "speculative_deadline")]
+    assert vicky_app._especulacion_stats["vencidos"] == 1
+
+
+def test_circuito_abierto_contesta_neutral_sin_llamar_a_boardroom_ni_a_gpt(monkeypatch, entorno):
+    sent, _, gpt = entorno
+    vicky_app._circuito_boardroom.estado = "abierto"
+    vicky_app._circuito_boardroom._abierto_en = vicky_app.time.monotonic()
+    llamadas = []
+    monkeypatch.setattr(vicky_app, "_request_boardroom_instruction",
+                        lambda p: llamadas.append(p) or (None, "timeout"))
+
+    _turno()
+
+    assert llamadas == [] and gpt == []
+    assert sent == [vicky_app.NEUTRAL_FALLBACK_MESSAGE]
+
+
+def test_candidato_lento_no_alarga_el_plazo(monkeypatch, entorno):
+    sent, _, _ = entorno
+    monkeypatch.setattr(vicky_app, "BOARDROOM_SPECULATIVE_DEADLINE_MS", 50)
+    soltar = threading.Event()
+    monkeypatch.setattr(vicky_app, "_request_boardroom_instruction",
+                        lambda p: soltar.wait(5) and (None, "timeout"))
+    monkeypatch.setattr(vicky_app, "ask_gpt", lambda prompt, svc=None: soltar.wait(5) and "tarde")
+
+    t0 = vicky_app.time.perf_counter()
+    _turno()
+    transcurrido = vicky_app.time.perf_counter() - t0
+    soltar.set()
+
+    assert sent == [vicky_app.NEUTRAL_FALLBACK_MESSAGE]
+    assert transcurrido < 2, "el turno no espera a GPT mas alla del plazo"
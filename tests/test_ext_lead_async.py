@@ -0,0 +1,106 @@
+"""
+/ext/lead en modo asincrono (EXT_LEAD_ASYNC_ENABLED): 202 con lead_id en
+cuanto el lead queda persistido, aviso al asesor y alta en Boardroom en un
+trabajo con reintentos, y GET /ext/lead/<lead_id> para consultar el estado.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as vicky_app
+
+HEADERS = {"X-Internal-Token": "test-token"}
+LEAD = {"lead_id": "lead-async-1", "nombre": "Ana", "telefono": "6680000000",
+        "interes": "prestamo_imss", "source": "cohifis.com.mx"}
+
+
+class ImmediateThread:
+    def __init__(self, target, args=(), kwargs=None, daemon=None):
+        self.target = target
+        self.args = args
+        self.kwargs = kwargs or {}
+
+    def start(self):
+        self.target(*self.args, **self.kwargs)
+
+
+@pytest.fixture
+def entorno(monkeypatch):
+    monkeypatch.setattr(vicky_app, "INTERNAL_TOKEN", "test-token")
+    monkeypatch.setattr(vicky_app, "EXT_LEAD_ASYNC_ENABLED", True)
+    monkeypatch.setattr(vicky_app.threading, "Thread", ImmediateThread)
+    monkeypatch.setattr(vicky_app, "_state_store", vicky_app.StateStore())
+    avisos, altas, programados, meta = [], [], [], {"ok": True}
+    monkeypatch.setattr(vicky_app, "notify_advisor", lambda msg: avisos.append(msg) or meta["ok"])
+    monkeypatch.setattr(vicky_app, "_boardroom_outbox_lead",
+                        lambda phone, code, data, lead_id="", fuente="", diferido=False: altas.append(lead_id) or lead_id)
+    monkeypatch.setattr(vicky_app, "_ext_lead_programar",
+                        lambda lead_id, espera: programados.append((lead_id, espera)))
+    return vicky_app.app.test_client(), avisos, altas, programados, meta
+
+
+def _estado(client, lead_id="lead-async-1"):
+    return client.get(f"/ext/lead/{lead_id}", headers=HEADERS)
+
+
+def test_acepta_con_202_y_notifica_en_el_trabajo(entorno):
+    client, avisos, altas, _, _ = entorno
+
+    resp = client.post("/ext/lead", json=LEAD, headers=HEADERS)
+
+    assert resp.status_code == 202
+    body = resp.get_json()
+    assert body["lead_id"] == "lead-async-1" and body["status_url"] == "/ext/lead/lead-async-1"
+    assert len(avisos) == 1 and altas == ["lead-async-1"]
+    estado = _estado(client).get_json()
+    assert estado["estado"] == "completado" and estado["asesor"] == "notificado"
+    assert estado["boardroom"] == "encolado"
+
+
+def test_meta_caido_no_rechaza_el_lead_y_se_reintenta(entorno):
+    client, avisos, altas, programados, meta = entorno
+    meta["ok"] = False
+
+    assert client.post("/ext/lead", json=LEAD, headers=HEADERS).status_code == 202
+    assert programados == [("lead-async-1", vicky_app._EXT_LEAD_BACKOFF_S[0])]
+    assert _estado(client).get_json()["asesor"] == "pendiente"
+
+    meta["ok"] = True
+    vicky_app._ext_lead_procesar("lead-async-1")
+
+    assert len(avisos) == 2 and altas == ["lead-async-1"], "Boardroom se encola una sola vez"
+    assert _estado(client).get_json()["estado"] == "completado"
+    assert vicky_app._state_store.aux_smembers(vicky_app._EXT_LEAD_INDICE) == set()
+
+
+def test_reintentos_agotados_dejan_el_lead_como_fallido(entorno):
+    client, _, _, programados, meta = entorno
+    meta["ok"] = False
+
+    client.post("/ext/lead", json=LEAD, headers=HEADERS)
+    for _ in vicky_app._EXT_LEAD_BACKOFF_S:
+        vicky_app._ext_lead_procesar("lead-async-1")
+
+    assert len(programados) == len(vicky_app._EXT_LEAD_BACKOFF_S)
+    estado = _estado(client).get_json()
+    assert estado["estado"] == "fallido" and estado["asesor"] == "fallido"
+
+
+def test_reenvio_del_mismo_lead_no_duplica_el_aviso(entorno):
+    client, avisos, _, _, _ = entorno
+
+    client.post("/ext/lead", json=LEAD, headers=HEADERS)
+    resp = client.post("/ext/lead", json=LEAD, headers=HEADERS)
+
+    assert resp.status_code == 202 and resp.get_json()["estado"] == "completado"
+    assert len(avisos) == 1
+
+
+def test_estado_requiere_token_y_lead_existente(entorno):
+    client, *_ = entorno
+    assert client.get("/ext/lead/lead-async-1").status_code == 401
+    assert _estado(client, "no-existe").status_code == 404
@@ -23,7 +23,7 @@ def _setup_common(monkeypatch):
 
     captured = {}
 
-    def fake_notify_boardroom(phone, product_code, data):
+    def fake_notify_boardroom(phone, product_code, data, event_id=None):
         captured["phone"] = phone
         captured["product_code"] = product_code
         captured["data"] = data
@@ -0,0 +1,162 @@
+"""
+/ext/leads/import: CSV o JSONL leidos del stream, telefono con la regla de
+/ext/lead, dedupe contra el lote / el reporte / el pipeline, reporte de
+Sheets en appends por lote y UN resumen al asesor.
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as vicky_app
+
+HEADERS = {"X-Internal-Token": "test-token"}
+
+
+@pytest.fixture
+def entorno(monkeypatch):
+    monkeypatch.setattr(vicky_app, "INTERNAL_TOKEN", "test-token")
+    monkeypatch.setattr(vicky_app, "_state_store", vicky_app.StateStore())
+    avisos, altas, reportes = [], [], []
+    monkeypatch.setattr(vicky_app, "notify_advisor", lambda msg: avisos.append(msg) or True)
+    monkeypatch.setattr(vicky_app, "_boardroom_outbox_lead",
+                        lambda phone, code, data, lead_id="", fuente="", diferido=False:
+                        altas.append((phone, code, lead_id)) if diferido else None)
+    monkeypatch.setattr(vicky_app, "_report_telefonos_existentes", lambda: {"6680009999"})
+    monkeypatch.setattr(vicky_app, "_report_append_leads",
+                        lambda leads: reportes.append(list(leads)) or len(leads))
+    return vicky_app.app.test_client(), avisos, altas, reportes
+
+
+def test_csv_valida_deduplica_y_manda_un_solo_resumen(entorno):
+    client, avisos, altas, reportes = entorno
+    cuerpo = (
+        "lead_id,nombre,telefono,interes,source\r\n"
+        "L1,Ana,+52 668 000 0001,prestamo_imss,socio\r\n"
+        "L2,Beto,668-000-0002,seguro auto,socio\r\n"
+        "L3,Ana bis,6680000001,prestamo_imss,socio\r\n"
+        "L4,Ya reportado,6680009999,vida,socio\r\n"
+        "L5,Sin tel,123,vida,socio\r\n"
+        "\r\n"
+    )
+
+    resp = client.post("/ext/leads/import", data=cuerpo, content_type="text/csv", headers=HEADERS)
+
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert [r["estado"] for r in body["results"]] == \
+        ["aceptado", "aceptado", "duplicado", "duplicado", "invalido"]
+    assert (body["aceptados"], body["duplicados"], body["invalidos"]) == (2, 2, 1)
+    assert body["results"][4]["error"] == "invalid_telefono"
+    assert altas == [("6680000001", "prestamo_imss_ley73", "L1"),
+                     ("6680000002", "seguro_vida", "L2")]
+    assert len(reportes) == 1 and [l["telefono"] for l in reportes[0]] == ["6680000001", "6680000002"]
+    assert len(avisos) == 1 and "Nuevos: 2" in avisos[0]
+    assert body["filas_por_segundo"] > 0
+
+
+def test_jsonl_con_lineas_malas_y_lead_ya_en_el_pipeline(entorno):
+    client, avisos, altas, _ = entorno
+    vicky_app._state_store.aux_set(vicky_app._ext_lead_key("L9"), json.dumps({"lead_id": "L9"}), 60)
+    lineas = [json.dumps({"lead_id": "L9", "telefono": "6680000009"}),
+              "{no es json",
+              json.dumps(["lista"]),
+              json.dumps({"telefono": "6680000010", "interes": "prestamo_imss"})]
+
+    resp = client.post("/ext/leads/import?formato=jsonl", data="\n".join(lineas) + "\n",
+                       headers=HEADERS)
+
+    body = resp.get_json()
+    assert [r["estado"] for r in body["results"]] == ["duplicado", "invalido", "invalido", "aceptado"]
+    assert [r["linea"] for r in body["results"]] == [1, 2, 3, 4]
+    assert altas == [("6680000010", "prestamo_imss_ley73", "")]
+
+
+def test_lead_calificado_en_un_funnel_cuenta_como_existente(entorno):
+    client, _, altas, _ = entorno
+    clave = vicky_app._boardroom_outbox_lead_clave("5216680000003", "seguro_vida", funnel="auto")
+    event_id = vicky_app._boardroom_outbox_event_id("lead", clave)
+    vicky_app._state_store.aux_set(vicky_app._boardroom_outbox_key(event_id),
+                                   json.dumps({"event_id": event_id}), 60)
+
+    body = client.post("/ext/leads/import?formato=jsonl", headers=HEADERS,
+                       data=json.dumps({"telefono": "6680000003", "interes": "seguro auto"})
+                       + "\n").get_json()
+
+    assert body["duplicados"] == 1 and altas == []
+
+
+def test_sin_nuevos_no_molesta_al_asesor(entorno):
+    client, avisos, _, reportes = entorno
+    resp = client.post("/ext/leads/import?formato=jsonl", headers=HEADERS,
+                       data=json.dumps({"telefono": "6680009999"}) + "\n")
+    assert resp.get_json()["duplicados"] == 1
+    assert avisos == [] and reportes == [[]]
+
+
+def test_requiere_token_y_limita_filas(monkeypatch, entorno):
+    client, *_ = entorno
+    assert client.post("/ext/leads/import", data="").status_code == 401
+    monkeypatch.setattr(vicky_app, "_LEAD_IMPORT_MAX_FILAS", 1)
+    resp = client.post("/ext/leads/import?formato=jsonl", headers=HEADERS,
+                       data='{"telefono": "6680000001"}\n{"telefono": "6680000002"}\n')
+    assert resp.status_code == 413
+    assert client.post("/ext/leads/import?formato=xml", headers=HEADERS, data="").status_code == 400
+
+
+def test_lote_rechazado_por_tamano_no_deja_efectos(monkeypatch, entorno):
+    client, avisos, altas, reportes = entorno
+    monkeypatch.setattr(vicky_app, "_LEAD_IMPORT_MAX_FILAS", 1)
+    lote = '{"telefono": "6680000001"}\n{"telefono": "6680000002"}\n'
+
+    assert client.post("/ext/leads/import?formato=jsonl", headers=HEADERS,
+                       data=lote).status_code == 413
+    assert altas == [] and avisos == [] and reportes == []
+    assert vicky_app._state_store.aux_get("lead_phone:6680000001") is None
+
+    # El socio parte el lote y reintenta: nada sale como duplicado.
+    monkeypatch.setattr(vicky_app, "_LEAD_IMPORT_MAX_FILAS", 2)
+    body = client.post("/ext/leads/import?formato=jsonl", headers=HEADERS, data=lote).get_json()
+    assert body["aceptados"] == 2 and body["asesor_notificado"] is True
+
+
+def test_resumen_fallido_se_reporta_y_libera_el_indice(monkeypatch, entorno):
+    client, _, _, _ = entorno
+    monkeypatch.setattr(vicky_app, "notify_advisor", lambda msg: False)
+
+    body = client.post("/ext/leads/import?formato=jsonl", headers=HEADERS,
+                       data='{"telefono": "6680000001", "interes": "vida"}\n').get_json()
+
+    assert body["aceptados"] == 1 and body["asesor_notificado"] is False
+    assert vicky_app._lead_indice_reclamar("6680000001", "asesor", "seguro_vida", "ext_lead")
+
+
+def test_reporte_en_appends_por_lote(monkeypatch):
+    llamadas = []
+
+    class Values:
+        def append(self, **kw):
+            llamadas.append(len(kw["body"]["values"]))
+            return self
+
+        def execute(self):
+            return {}
+
+    class Svc:
+        def spreadsheets(self):
+            return self
+
+        def values(self):
+            return Values()
+
+    monkeypatch.setattr(vicky_app, "_srdy", True)
+    monkeypatch.setattr(vicky_app, "_svc", Svc())
+    monkeypatch.setattr(vicky_app, "_REPORTE_LOTE_FILAS", 2)
+
+    leads = [{"telefono": f"66800000{i:02d}", "nombre": "X"} for i in range(5)]
+    assert vicky_app._report_append_leads(leads) == 5
+    assert llamadas == [2, 2, 1]
@@ -0,0 +1,126 @@
+"""
+Tabla de amortizacion mes a mes para el asesor: generador perezoso con la
+misma recurrencia del cotizador, salidas CSV/JSONL en streaming, mensaje
+opcional al asesor tras la alerta IMSS y endpoint interno
+/ext/imss/amortizacion.
+"""
+
+import json
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as vicky_app
+
+
+def test_schedule_is_a_lazy_generator():
+    tabla = vicky_app._imss_tabla_amortizacion(100000, 60)
+    assert isinstance(tabla, types.GeneratorType)
+    primera = next(tabla)
+    assert primera["mes"] == 1
+    assert set(primera) == set(vicky_app._IMSS_TABLA_CAMPOS)
+
+
+def test_schedule_amortizes_to_zero_with_calculator_payment():
+    monto, plazo = 100000, 60
+    filas = list(vicky_app._imss_tabla_amortizacion(monto, plazo))
+    cuota = vicky_app._imss_calcular_cuota(monto, plazo)
+    assert len(filas) == plazo
+    assert all(f["pago"] == cuota for f in filas)
+    assert abs(filas[-1]["saldo"]) < 0.01
+    assert abs(sum(f["capital"] for f in filas) - monto) < 0.01
+    f1 = filas[0]
+    assert f1["interes"] == monto * vicky_app.IMSS_TASA_MENSUAL
+    assert f1["iva"] == f1["interes"] * vicky_app.IMSS_IVA_RATE
+    assert abs(f1["interes"] + f1["iva"] + f1["capital"] - cuota) < 1e-9
+
+
+def test_schedule_uses_active_proposal_numbers():
+    propuesta = vicky_app.calcular_propuesta_imss(12000, 36)
+    filas = list(vicky_app._imss_tabla_amortizacion(
+        propuesta["monto"], 36, propuesta["cuota"]))
+    assert abs(sum(f["pago"] for f in filas) - propuesta["total"]) < 1e-6
+
+
+def test_csv_and_jsonl_streams():
+    csv_lineas = list(vicky_app._imss_tabla_amortizacion_csv(80000, 12))
+    assert csv_lineas[0] == "mes,pago,interes,iva,capital,saldo\n"
+    assert len(csv_lineas) == 13
+    assert csv_lineas[-1].rstrip().endswith(",0.00")
+    filas = [json.loads(l) for l in vicky_app._imss_tabla_amortizacion_jsonl(80000, 12)]
+    assert [f["mes"] for f in filas] == list(range(1, 13))
+    assert filas[-1]["saldo"] == 0.0
+
+
+def _data_lead() -> dict:
+    propuesta = vicky_app.calcular_propuesta_imss(12000, 24)
+    data = {"nombre": "Ana", "pension": 12000}
+    vicky_app._imss_set_propuesta_activa(data, propuesta["monto"], propuesta["cuota"],
+                                         24, "test")
+    return data
+
+
+class FakeResp:
+    status_code = 200
+    text = ""
+
+
+def _tabla_envios(monkeypatch, habilitada=True):
+    monkeypatch.setattr(vicky_app, "_state_store", vicky_app.StateStore())
+    monkeypatch.setattr(vicky_app, "IMSS_ADVISOR_SCHEDULE_ENABLED", habilitada)
+    monkeypatch.setattr(vicky_app, "_log", lambda *a, **k: None)
+    envios = []
+    monkeypatch.setattr(vicky_app, "_wa_post", lambda payload: envios.append(payload) or FakeResp())
+    return envios
+
+
+def test_advisor_notification_never_carries_the_schedule(monkeypatch):
+    monkeypatch.setattr(vicky_app, "user_state", {})
+    monkeypatch.setattr(vicky_app, "IMSS_ADVISOR_SCHEDULE_ENABLED", True)
+    msg = vicky_app._imss_build_advisor_notification("6680000000", _data_lead())
+    assert "Tabla de amortización" not in msg
+    assert len(msg) < vicky_app._TPL_PARAM_LIMIT
+
+
+def test_schedule_goes_as_free_text_follow_up_inside_the_window(monkeypatch):
+    envios = _tabla_envios(monkeypatch)
+    vicky_app._advisor_window_touch()
+
+    assert vicky_app._imss_advisor_tabla_seguimiento("6680000000", _data_lead()) is True
+
+    assert len(envios) == 1 and envios[0]["type"] == "text"
+    texto = envios[0]["text"]["body"]
+    assert "Tabla de amortización" in texto and "\n24 | " in texto
+    assert "6680000000" in texto and len(texto) < 4096
+
+
+def test_schedule_is_skipped_outside_the_window_or_when_disabled(monkeypatch):
+    envios = _tabla_envios(monkeypatch)
+    assert vicky_app._imss_advisor_tabla_seguimiento("6680000000", _data_lead()) is False
+    vicky_app._advisor_window_expire()
+    assert vicky_app._imss_advisor_tabla_seguimiento("6680000000", _data_lead()) is False
+
+    envios = _tabla_envios(monkeypatch, habilitada=False)
+    vicky_app._advisor_window_touch()
+    assert vicky_app._imss_advisor_tabla_seguimiento("6680000000", _data_lead()) is False
+    assert envios == []
+
+
+def test_amortization_endpoint_streams_csv_and_jsonl(monkeypatch):
+    monkeypatch.setattr(vicky_app, "INTERNAL_TOKEN", "test-token")
+    client = vicky_app.app.test_client()
+    hdr = {"X-Internal-Token": "test-token"}
+    assert client.get("/ext/imss/amortizacion?monto=80000&plazo=12").status_code == 401
+    resp = client.get("/ext/imss/amortizacion?monto=80000&plazo=12", headers=hdr)
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/csv"
+    assert resp.get_data(as_text=True).count("\n") == 13
+    resp = client.get("/ext/imss/amortizacion?monto=80000&plazo=12&formato=jsonl", headers=hdr)
+    assert len(resp.get_data(as_text=True).splitlines()) == 12
+    assert client.get("/ext/imss/amortizacion?monto=x&plazo=12", headers=hdr).status_code == 400
+    assert client.get("/ext/imss/amortizacion?monto=80000&plazo=7", headers=hdr).status_code == 400
+    for cuota in ("nan", "inf", "-500", "0"):
+        assert client.get(f"/ext/imss/amortizacion?monto=80000&plazo=12&cuota={cuota}",
+                          headers=hdr).status_code == 400
@@ -0,0 +1,50 @@
+"""
+Arnes de equivalencia de bench/bench_imss_calculadora.py: debe correr, no
+encontrar diferencias contra la biseccion de referencia en los casos frontera
+y dejar un reporte JSON legible por maquina.
+"""
+
+import json
+import os
+import sys
+
+_RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _RAIZ)
+sys.path.insert(0, os.path.join(_RAIZ, "bench"))
+
+import app as vicky_app
+import bench_imss_calculadora as bench
+
+
+def test_boundary_cases_cover_minimum_and_cap_edges():
+    tipos = {c[2] for c in bench.casos_frontera()}
+    assert tipos == {"minimo_producto", "tope_30", "extremo"}
+    plazos_minimo = {c[1] for c in bench.casos_frontera() if c[2] == "minimo_producto"}
+    assert plazos_minimo == set(vicky_app.IMSS_PLAZOS_DISPONIBLES)
+
+
+def test_engines_match_reference_on_boundary_cases():
+    resultado = bench.verificar_equivalencia(bench.casos_frontera())
+    assert set(resultado) == set(bench.MOTORES) | {"_imss_primer_plazo_viable",
+                                                 "_imss_primer_plazo_para_monto_100k"}
+    for nombre, v in resultado.items():
+        assert v["diferencias"] == 0, (nombre, v["muestra"])
+
+
+def test_harness_detects_a_wrong_engine():
+    def motor_roto(pensiones, plazos):
+        return [dict(vicky_app.calcular_propuesta_imss(p, n), monto=0.0)
+                for p, n in zip(pensiones, plazos)]
+
+    casos = bench.casos_aleatorios(5, seed=1)
+    resultado = bench.verificar_equivalencia(casos, {"roto": motor_roto})
+    assert resultado["roto"]["diferencias"] == 5
+
+
+def test_report_is_written_as_json(tmp_path):
+    salida = tmp_path / "reporte.json"
+    rc = bench.main(["--out", str(salida), "--casos", "20", "--solo-equivalencia"])
+    assert rc == 0
+    reporte = json.loads(salida.read_text(encoding="utf-8"))
+    assert reporte["constantes"]["IMSS_TASA_MENSUAL"] == vicky_app.IMSS_TASA_MENSUAL
+    assert reporte["equivalencia"]["calcular_propuesta_imss"]["diferencias"] == 0
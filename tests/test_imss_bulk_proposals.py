@@ -0,0 +1,98 @@
+"""
+Propuestas IMSS en lote (calcular_propuestas_imss_lote) y su endpoint
+interno /ext/imss/propuestas. Cada posicion del lote debe ser IDENTICA a la
+llamada escalar de calcular_propuesta_imss, no solo cercana.
+"""
+
+import json
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as vicky_app
+
+CAMPOS = ("monto", "cuota", "total", "plazo", "cuota_max")
+
+
+def _assert_identico(lote, pensiones, plazos):
+    for i, (pension, plazo) in enumerate(zip(pensiones, plazos)):
+        esperado = vicky_app.calcular_propuesta_imss(pension, plazo)
+        for campo in CAMPOS:
+            assert lote[campo][i] == esperado[campo], (pension, plazo, campo)
+
+
+def test_batch_is_identical_to_scalar_for_every_plazo():
+    rnd = random.Random(28)
+    pensiones = [rnd.uniform(500, 90000) for _ in range(400)] + [8000, 10000, 12000]
+    plazos = [rnd.choice(vicky_app.IMSS_PLAZOS_DISPONIBLES) for _ in pensiones]
+    _assert_identico(vicky_app.calcular_propuestas_imss_lote(pensiones, plazos),
+                     pensiones, plazos)
+
+
+def test_batch_default_and_scalar_plazo():
+    pensiones = [6000, 12000, 25000]
+    _assert_identico(vicky_app.calcular_propuestas_imss_lote(pensiones),
+                     pensiones, [vicky_app.IMSS_PLAZO_MESES] * 3)
+    _assert_identico(vicky_app.calcular_propuestas_imss_lote(pensiones, 18),
+                     pensiones, [18] * 3)
+
+
+def test_batch_scalar_fallback_without_numpy(monkeypatch):
+    monkeypatch.setattr(vicky_app, "_numpy_libs", False)
+    pensiones = [6000, 12000]
+    lote = vicky_app.calcular_propuestas_imss_lote(pensiones, [12, 60])
+    assert isinstance(lote["monto"], list)
+    _assert_identico(lote, pensiones, [12, 60])
+
+
+def _post(client, lineas, token="test-token"):
+    cuerpo = "\n".join(l if isinstance(l, str) else json.dumps(l) for l in lineas)
+    return client.post("/ext/imss/propuestas", data=cuerpo,
+                       headers={"X-Internal-Token": token,
+                                "Content-Type": "application/x-ndjson"})
+
+
+def test_endpoint_requires_internal_token(monkeypatch):
+    monkeypatch.setattr(vicky_app, "INTERNAL_TOKEN", "test-token")
+    client = vicky_app.app.test_client()
+    assert _post(client, [{"pension": 12000}], token="otro").status_code == 401
+
+
+def test_endpoint_returns_one_row_per_line_in_order(monkeypatch):
+    monkeypatch.setattr(vicky_app, "INTERNAL_TOKEN", "test-token")
+    client = vicky_app.app.test_client()
+    resp = _post(client, [
+        {"id": "a", "pension": 12000},
+        "no es json",
+        {"id": "b", "pension": 12000, "plazo": 18},
+        {"id": "c", "pension": -5},
+        "",
+        {"id": "d", "pension": 12000, "plazo": 7},
+        {"id": "e", "pension": 2000, "plazo": 6},
+    ])
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body["count"] == 6
+    assert body["errors"] == 3
+    filas = body["results"]
+    assert [f.get("id") for f in filas] == ["a", None, "b", "c", "d", "e"]
+    assert filas[1]["error"] == "invalid_json"
+    assert filas[3]["error"] == "invalid_pension"
+    assert filas[4]["error"] == "invalid_plazo"
+
+    esperado = vicky_app.calcular_propuesta_imss(12000, 18)
+    for campo in ("monto", "cuota", "total", "cuota_max"):
+        assert filas[2][campo] == esperado[campo]
+    assert filas[0]["plazo"] == vicky_app.IMSS_PLAZO_MESES
+    assert filas[2]["viable"] is True
+    assert filas[5]["viable"] is False
+
+
+def test_endpoint_caps_rows(monkeypatch):
+    monkeypatch.setattr(vicky_app, "INTERNAL_TOKEN", "test-token")
+    monkeypatch.setattr(vicky_app, "_IMSS_LOTE_MAX_FILAS", 2)
+    client = vicky_app.app.test_client()
+    resp = _post(client, [{"pension": 9000}] * 3)
+    assert resp.status_code == 413
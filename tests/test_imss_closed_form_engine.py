@@ -0,0 +1,68 @@
+"""
+Motor de forma cerrada de la calculadora IMSS.
+
+_imss_calcular_cuota ya no simula la amortizacion mes a mes dentro de cada
+paso de la biseccion: evalua el saldo final con la forma cerrada
+monto * g - cuota * s. La biseccion y sus criterios de paro no cambian; el
+redondeo de la forma cerrada no es el de la suma mes a mes, asi que el
+contrato es coincidir AL CENTAVO con el puerto original del cotizador,
+que vive en bench/imss_referencia.py (la misma referencia del benchmark).
+"""
+
+import os
+import random
+import sys
+
+_RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _RAIZ)
+sys.path.insert(0, os.path.join(_RAIZ, "bench"))
+
+import app as vicky_app
+import imss_referencia as ref
+
+
+def _centavos(x: float) -> int:
+    return round(x * 100)
+
+
+def test_closed_form_balance_matches_month_by_month_loop():
+    for plazo in vicky_app.IMSS_PLAZOS_DISPONIBLES:
+        g, s = vicky_app._imss_factores_amortizacion(plazo)
+        for monto, cuota in ((40000, 1200.0), (100000, 2992.6), (650000, 19000.0)):
+            saldo = monto
+            for _m in range(plazo):
+                interes = saldo * vicky_app.IMSS_TASA_MENSUAL
+                saldo -= cuota - interes - interes * vicky_app.IMSS_IVA_RATE
+            assert abs((monto * g - cuota * s) - saldo) < 1e-6
+
+
+def test_proposal_matches_bisection_reference_on_dense_grid():
+    """Rejilla densa de pensiones x todos los plazos vigentes, al centavo."""
+    pensiones = list(range(1000, 40001, 250)) + [1234.56, 8000, 10000, 12000, 33333.33]
+    for pension in pensiones:
+        for plazo in vicky_app.IMSS_PLAZOS_DISPONIBLES:
+            got = vicky_app.calcular_propuesta_imss(pension, plazo)
+            esperado = ref.propuesta(pension, plazo)
+            for campo in ("monto", "cuota", "total", "cuota_max"):
+                assert _centavos(got[campo]) == _centavos(esperado[campo]), (pension, plazo, campo)
+            assert got["plazo"] == plazo
+
+
+def test_proposal_matches_bisection_reference_on_random_pensions():
+    rnd = random.Random(2026)
+    for _ in range(200):
+        pension = round(rnd.uniform(500, 120000), 2)
+        plazo = rnd.choice(vicky_app.IMSS_PLAZOS_DISPONIBLES)
+        got = vicky_app.calcular_propuesta_imss(pension, plazo)
+        esperado = ref.propuesta(pension, plazo)
+        assert _centavos(got["monto"]) == _centavos(esperado["monto"]), (pension, plazo)
+        assert _centavos(got["cuota"]) == _centavos(esperado["cuota"]), (pension, plazo)
+
+
+def test_cuota_for_requested_amount_matches_reference():
+    """_imss_calcular_cuota tambien se usa directo (monto solicitado por el
+    cliente a un plazo dado), no solo dentro de la propuesta."""
+    for monto in (40000, 60000, 80000, 100000, 250000, 650000):
+        for plazo in vicky_app.IMSS_PLAZOS_DISPONIBLES:
+            assert _centavos(vicky_app._imss_calcular_cuota(monto, plazo)) == \
+                _centavos(ref.cuota(monto, plazo)), (monto, plazo)
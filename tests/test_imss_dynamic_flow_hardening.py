@@ -45,6 +45,16 @@ PHONE = "5216681234567"
 _BOARDROOM_REAL = vicky_app._notify_boardroom_lead_qualified
 
 
+class ImmediateThread:
+    def __init__(self, target, args=(), kwargs=None, daemon=None):
+        self.target = target
+        self.args = args
+        self.kwargs = kwargs or {}
+
+    def start(self):
+        self.target(*self.args, **self.kwargs)
+
+
 class FakeResp:
     def __init__(self, status_code=200, text=""):
         self.status_code = status_code
@@ -59,6 +69,11 @@ def _aislar(monkeypatch):
     monkeypatch.setattr(vicky_app, "user_data", {})
     monkeypatch.setattr(vicky_app, "_state_store", vicky_app.StateStore())
     monkeypatch.setattr(vicky_app, "_log", lambda *a, **k: None)
+    # Los efectos del handoff corren en un trabajo en segundo plano: aqui en
+    # linea, y los reintentos con backoff no se programan (un reintento de
+    # Meta sobre el mismo handoff es lo que los vuelve a disparar).
+    monkeypatch.setattr(vicky_app.threading, "Thread", ImmediateThread)
+    monkeypatch.setattr(vicky_app, "_imss_flow_job_programar", lambda token, espera: None)
     monkeypatch.setattr(vicky_app, "_nombre", lambda phone: "Test")
     monkeypatch.setattr(vicky_app, "_imss_log_lead_backup", lambda *a, **k: None)
     # True = Boardroom confirmo el alta. El stub tiene que declararlo
@@ -157,7 +172,7 @@ def test_si_no_se_puede_persistir_la_correlacion_no_se_envia_el_flow(monkeypatch
     enviados = []
     monkeypatch.setattr(vicky_app, "_wa_post",
                         lambda payload: enviados.append(payload) or FakeResp(200))
-    _romper_aux_set(monkeypatch, "imss_flow_token:")
+    _romper_aux_set(monkeypatch, "imss_flow_session:")
 
     assert vicky_app.send_imss_dynamic_flow(PHONE) == vicky_app.IMSS_FLOW_FALLIDO
     assert enviados == [], "no debe salir NADA hacia Meta si la correlacion no quedo asegurada"
@@ -169,7 +184,7 @@ def test_correlacion_fallida_es_FALLIDO_no_AMBIGUO(monkeypatch):
     ninguna respuesta."""
     monkeypatch.setattr(vicky_app, "_wa_post", lambda payload: FakeResp(200))
     monkeypatch.setattr(vicky_app, "WHATSAPP_IMSS_DYNAMIC_FLOW_ENABLED", True)
-    _romper_aux_set(monkeypatch, "imss_flow_token:")
+    _romper_aux_set(monkeypatch, "imss_flow_session:")
 
     llamadas_legacy = []
     monkeypatch.setattr(vicky_app, "funnel_imss",
@@ -183,9 +198,10 @@ def test_envio_exitoso_deja_la_correlacion_consultable(monkeypatch):
     monkeypatch.setattr(vicky_app, "_wa_post", lambda payload: FakeResp(200))
     assert vicky_app.send_imss_dynamic_flow(PHONE) == vicky_app.IMSS_FLOW_ENVIADO
 
-    tokens = [k for k in _claves_aux() if k.startswith("imss_flow_token:")]
-    assert len(tokens) == 1
-    assert vicky_app._state_store.aux_get(tokens[0]) == PHONE
+    claves = [k for k in _claves_aux() if k.startswith("imss_flow_session:")]
+    assert len(claves) == 1
+    token = claves[0].split(":", 1)[1]
+    assert vicky_app._imss_flow_sesion(token)["phone"] == PHONE
 
 
 def _claves_aux():
@@ -404,20 +420,20 @@ def test_boardroom_se_notifica_una_sola_vez_aunque_se_reintente(monkeypatch, avi
 def test_marca_no_persistida_queda_registrada_con_motivo(monkeypatch, caplog):
     _romper_aux_set(monkeypatch, "imss_flow_")
     with caplog.at_level("ERROR"):
-        assert vicky_app._imss_flow_marcar("imss_flow_notif:tok:handoff") is False
+        assert vicky_app._imss_flow_marcar("tok", "notif:handoff") is False
     assert "imss_flow_marca_no_persistida" in caplog.text
 
 
 def test_marca_persistida_no_registra_error(monkeypatch, caplog):
     with caplog.at_level("ERROR"):
-        assert vicky_app._imss_flow_marcar("imss_flow_notif:tok:handoff") is True
+        assert vicky_app._imss_flow_marcar("tok", "notif:handoff") is True
     assert "imss_flow_marca_no_persistida" not in caplog.text
 
 
 def test_dedupe_del_asesor_caido_no_rompe_el_paso(monkeypatch, avisos, caplog):
     """Con el store rechazando writes, el asesor sigue recibiendo su alerta
     (el efecto importante NO se pierde) y la degradacion queda registrada."""
-    _romper_aux_set(monkeypatch, "imss_flow_notif:")
+    _romper_aux_set(monkeypatch, "imss_flow_session:")
     token = imss_flow.generate_flow_token()
 
     with caplog.at_level("ERROR"):
@@ -436,7 +452,7 @@ def test_dedupe_de_boardroom_caido_no_rompe_el_handoff(monkeypatch, avisos, capl
     monkeypatch.setattr(vicky_app, "_notify_boardroom_lead_qualified",
                         lambda phone, code, data: altas.append(phone) or True)
     monkeypatch.setattr(vicky_app, "send_msg", lambda to, text: True)
-    _romper_aux_set(monkeypatch, "imss_flow_boardroom:")
+    _romper_aux_set(monkeypatch, "imss_flow_session:")
 
     with caplog.at_level("ERROR"):
         r = vicky_app._imss_flow_handle_handoff(
@@ -475,13 +491,13 @@ def test_boardroom_fallido_se_reintenta_y_solo_despues_deja_de_intentarse(monkey
 
     vicky_app._imss_flow_handle_handoff(PHONE, paso, token)
     assert len(intentos) == 1, "primer intento"
-    assert not vicky_app._state_store.aux_get(f"imss_flow_boardroom:{token}"), \
+    assert not vicky_app._imss_flow_tiene_marca(token, "boardroom"), \
         "un alta NO confirmada no puede quedar marcada como hecha"
 
     boardroom_disponible["ok"] = True
     vicky_app._imss_flow_handle_handoff(PHONE, paso, token)
     assert len(intentos) == 2, "el reintento SI debe volver a intentar el alta"
-    assert vicky_app._state_store.aux_get(f"imss_flow_boardroom:{token}")
+    assert vicky_app._imss_flow_tiene_marca(token, "boardroom")
 
     vicky_app._imss_flow_handle_handoff(PHONE, paso, token)
     assert len(intentos) == 2, "ya confirmada, no se vuelve a dar de alta"
@@ -500,7 +516,7 @@ def test_boardroom_no_configurado_no_marca_dedupe(monkeypatch, avisos):
     vicky_app._imss_flow_handle_handoff(
         PHONE, {"nombre": "Juan Pérez", "ciudad": "Culiacán"}, token)
 
-    assert not vicky_app._state_store.aux_get(f"imss_flow_boardroom:{token}")
+    assert not vicky_app._imss_flow_tiene_marca(token, "boardroom")
 
 
 def test_boardroom_http_no_exitoso_cuenta_como_fallo(monkeypatch):
@@ -530,7 +546,7 @@ def test_marca_de_completado_caida_queda_registrada(monkeypatch, avisos, caplog)
     token = imss_flow.generate_flow_token()
     _preparar_prospecto_con_propuesta(token, avisos)
     monkeypatch.setattr(vicky_app, "send_msg", lambda to, text: True)
-    _romper_aux_set(monkeypatch, "imss_flow_handoff_completado:")
+    _romper_aux_set(monkeypatch, "imss_flow_session:")
 
     with caplog.at_level("ERROR"):
         r = vicky_app._imss_flow_handle_handoff(
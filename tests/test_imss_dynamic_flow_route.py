@@ -73,6 +73,16 @@ def _decrypt_response(response_text: str, aes_key: bytes, iv: bytes) -> dict:
 PHONE = "5216681234567"
 
 
+class ImmediateThread:
+    def __init__(self, target, args=(), kwargs=None, daemon=None):
+        self.target = target
+        self.args = args
+        self.kwargs = kwargs or {}
+
+    def start(self):
+        self.target(*self.args, **self.kwargs)
+
+
 @pytest.fixture
 def cliente(monkeypatch, keypair):
     _, private_pem = keypair
@@ -82,6 +92,10 @@ def cliente(monkeypatch, keypair):
     monkeypatch.setattr(vicky_app, "_verify_sig", lambda raw, hdr: True)
     monkeypatch.setattr(vicky_app, "IMSS_FLOW_PRIVATE_KEY", private_pem)
     monkeypatch.setattr(vicky_app, "WHATSAPP_IMSS_DYNAMIC_FLOW_ENABLED", True)
+    monkeypatch.setattr(vicky_app.threading, "Thread", ImmediateThread)
+    programados = []
+    monkeypatch.setattr(vicky_app, "_imss_flow_job_programar",
+                        lambda token, espera: programados.append((token, espera)))
 
     sent = []
     monkeypatch.setattr(vicky_app, "send_msg", lambda to, text: sent.append((to, text)) or True)
@@ -105,7 +119,7 @@ def cliente(monkeypatch, keypair):
 
 def _correlate(phone: str) -> str:
     token = imss_flow.generate_flow_token()
-    vicky_app._state_store.aux_set(f"imss_flow_token:{token}", phone, vicky_app._IMSS_FLOW_TOKEN_TTL)
+    vicky_app._imss_flow_sesion_crear(token, phone)
     return token
 
 
@@ -160,6 +174,34 @@ def test_ping_responde_health_check_cifrado(cliente, keypair):
     assert decrypted == {"data": {"status": "active"}}
 
 
+def test_rotacion_acepta_la_llave_anterior(monkeypatch, cliente, keypair):
+    client, *_ = cliente
+    public_key, private_pem = keypair
+    nueva = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    nueva_pem = nueva.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    ).decode("utf-8")
+    monkeypatch.setattr(vicky_app, "IMSS_FLOW_PRIVATE_KEY", nueva_pem)
+    monkeypatch.setattr(vicky_app, "IMSS_FLOW_PRIVATE_KEY_PREVIOUS", private_pem)
+    monkeypatch.setattr(vicky_app, "INTERNAL_TOKEN", "test-token")
+    imss_flow.clear_key_cache()
+
+    # Meta todavia cifra con la llave publica anterior...
+    assert _post_and_decrypt(client, public_key, {"action": "ping"}) == {"data": {"status": "active"}}
+    # ...y con la nueva.
+    assert _post_and_decrypt(client, nueva.public_key(), {"action": "ping"}) == \
+        {"data": {"status": "active"}}
+
+    metricas = client.get("/ext/metrics", headers={"X-Internal-Token": "test-token"}).get_json()
+    llaves = metricas["imss_flow_keys"]
+    assert llaves["anterior"]["decrypted"] == 1
+    assert llaves["vigente"]["decrypted"] == 1
+    assert llaves["anterior"]["fingerprint"] == imss_flow.key_fingerprint(private_pem)
+    assert "BEGIN" not in json.dumps(metricas)
+
+
 def test_accion_error_responde_ack_cifrado(cliente, keypair):
     client, *_ = cliente
     public_key, _ = keypair
@@ -322,3 +364,315 @@ def test_pantalla_desconocida_responde_ack_sin_lanzar(cliente, keypair):
         "data": {}, "flow_token": token,
     })
     assert r == {"data": {"acknowledged": True}}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Cache de respuestas ante reintentos de Meta
+# ─────────────────────────────────────────────────────────────────────────────
+
+def _replay_stats():
+    return vicky_app._imss_flow_replay_stats_snapshot()
+
+
+def test_reintento_identico_reusa_respuesta_sin_volver_a_correr_el_handler(
+        monkeypatch, cliente, keypair):
+    client, sent, advisor_calls, _ = cliente
+    public_key, _ = keypair
+    token = _correlate(PHONE)
+    payload = {"action": "data_exchange", "screen": imss_flow.SCREEN_PENSION,
+               "data": {"profile": "1", "pension": "12000"}, "flow_token": token}
+
+    antes = _replay_stats()
+    r1 = _post_and_decrypt(client, public_key, payload)
+
+    llamadas = []
+    monkeypatch.setattr(vicky_app, "calcular_propuesta_imss",
+                        lambda *a, **k: llamadas.append(a) or {})
+    # Nueva llave AES/IV: el reintento se cifra con las suyas.
+    r2 = _post_and_decrypt(client, public_key, payload)
+
+    assert r2 == r1
+    assert llamadas == []
+    assert len(advisor_calls) == 1
+    despues = _replay_stats()
+    assert despues["hits"] == antes["hits"] + 1
+    assert despues["stored"] == antes["stored"] + 1
+
+
+def test_payload_distinto_no_usa_la_respuesta_cacheada(cliente, keypair):
+    client, _, advisor_calls, _ = cliente
+    public_key, _ = keypair
+    token = _correlate(PHONE)
+
+    r1 = _post_and_decrypt(client, public_key, {
+        "action": "data_exchange", "screen": imss_flow.SCREEN_PENSION,
+        "data": {"profile": "1", "pension": "12000"}, "flow_token": token})
+    r2 = _post_and_decrypt(client, public_key, {
+        "action": "data_exchange", "screen": imss_flow.SCREEN_PENSION,
+        "data": {"profile": "1", "pension": "15000"}, "flow_token": token})
+
+    assert r1["data"]["monto"] != r2["data"]["monto"]
+    assert len(advisor_calls) == 2
+
+
+def test_volver_a_la_misma_pantalla_con_los_mismos_datos_corre_el_handler(
+        monkeypatch, cliente, keypair):
+    client, *_ = cliente
+    public_key, _ = keypair
+    token = _correlate(PHONE)
+    original = vicky_app.calcular_propuesta_imss
+    llamadas = []
+    monkeypatch.setattr(vicky_app, "calcular_propuesta_imss",
+                        lambda *a, **k: llamadas.append(a) or original(*a, **k))
+    pension = {"action": "data_exchange", "screen": imss_flow.SCREEN_PENSION,
+               "data": {"profile": "1", "pension": "12000"}, "flow_token": token}
+    otra = {**pension, "data": {"profile": "1", "pension": "15000"}}
+
+    antes = _replay_stats()
+    _post_and_decrypt(client, public_key, pension)
+    _post_and_decrypt(client, public_key, otra)
+    n = len(llamadas)
+    _post_and_decrypt(client, public_key, pension)
+
+    assert len(llamadas) > n
+    assert _replay_stats()["hits"] == antes["hits"]
+
+
+def test_fallo_al_notificar_no_se_cachea_y_el_reintento_vuelve_a_intentar(
+        monkeypatch, cliente, keypair):
+    client, *_ = cliente
+    public_key, _ = keypair
+    token = _correlate(PHONE)
+    intentos = []
+    monkeypatch.setattr(vicky_app, "notify_advisor", lambda msg: intentos.append(msg) and False)
+    payload = {"action": "data_exchange", "screen": imss_flow.SCREEN_PENSION,
+               "data": {"profile": "1", "pension": "12000"}, "flow_token": token}
+
+    antes = _replay_stats()
+    _post_and_decrypt(client, public_key, payload)
+    monkeypatch.setattr(vicky_app, "notify_advisor", lambda msg: intentos.append(msg) or True)
+    _post_and_decrypt(client, public_key, payload)
+
+    assert len(intentos) == 2
+    despues = _replay_stats()
+    assert despues["not_stored_retryable"] == antes["not_stored_retryable"] + 1
+    assert despues["hits"] == antes["hits"]
+
+
+def test_cierre_no_entregado_no_se_cachea(monkeypatch, cliente, keypair):
+    client, sent, *_ = cliente
+    public_key, _ = keypair
+    token = _correlate(PHONE)
+    monkeypatch.setattr(vicky_app, "send_msg", lambda to, text: sent.append((to, text)) and False)
+    payload = {"action": "data_exchange", "screen": imss_flow.SCREEN_HANDOFF,
+               "data": {"nombre": "Juan Pérez", "ciudad": "Culiacán"}, "flow_token": token}
+
+    _post_and_decrypt(client, public_key, payload)
+    enviados = len(sent)
+    _post_and_decrypt(client, public_key, payload)
+
+    assert len(sent) > enviados
+
+
+def test_metricas_exponen_el_cache_de_respuestas(monkeypatch, cliente):
+    client, *_ = cliente
+    monkeypatch.setattr(vicky_app, "INTERNAL_TOKEN", "t")
+    resp = client.get("/ext/metrics", headers={"X-Internal-Token": "t"})
+    assert resp.status_code == 200
+    assert set(resp.get_json()["imss_flow_replay"]) >= {"hits", "misses", "stored"}
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Latencia por pantalla y presupuesto de tiempo
+# ─────────────────────────────────────────────────────────────────────────────
+
+def test_latencias_por_fase_se_registran_por_pantalla(monkeypatch, cliente, keypair):
+    client, *_ = cliente
+    public_key, _ = keypair
+    monkeypatch.setattr(vicky_app, "_imss_flow_latencias", {})
+    token = _correlate(PHONE)
+
+    _post_and_decrypt(client, public_key, {
+        "action": "data_exchange", "screen": imss_flow.SCREEN_PENSION,
+        "data": {"profile": "1", "pension": "12000"}, "flow_token": token})
+    _post_and_decrypt(client, public_key, {"action": "ping"})
+
+    stats = vicky_app._imss_flow_latency_stats()
+    fases = {k.split(":", 1)[1] for k in stats["histogramas"] if k.startswith("IMSS_PENSION:")}
+    assert {"descifrado", "store", "calculo", "asesor", "sheets",
+            "handler", "cifrado", "total"} <= fases
+    total = stats["histogramas"][f"{imss_flow.SCREEN_PENSION}:total"]
+    assert total["count"] == 1
+    assert total["buckets"]["le_inf"] == 1
+    assert "ping:total" in stats["histogramas"]
+
+
+def test_cerca_del_limite_la_alerta_al_asesor_se_va_a_segundo_plano(
+        monkeypatch, cliente, keypair):
+    client, _, advisor_calls, _ = cliente
+    public_key, _ = keypair
+    token = _correlate(PHONE)
+    diferidos = []
+
+    class CapturedThread:
+        def __init__(self, target=None, args=(), kwargs=None, daemon=None):
+            diferidos.append((target, args, kwargs or {}))
+
+        def start(self):
+            pass
+
+    monkeypatch.setattr(vicky_app.threading, "Thread", CapturedThread)
+    monkeypatch.setattr(vicky_app, "_imss_flow_cerca_del_limite", lambda: True)
+
+    r = _post_and_decrypt(client, public_key, {
+        "action": "data_exchange", "screen": imss_flow.SCREEN_PENSION,
+        "data": {"profile": "1", "pension": "12000"}, "flow_token": token})
+
+    assert r["screen"] == imss_flow.SCREEN_PROPOSAL
+    assert advisor_calls == []
+    assert [a[1].__name__ for _, a, _ in diferidos] == ["_imss_flow_notify_once", "_report_upsert_lead"]
+    for target, args, kwargs in diferidos:
+        target(*args, **kwargs)
+    assert len(advisor_calls) == 1
+    assert "PROPUESTA CALCULADA" in advisor_calls[0]
+
+
+def test_alerta_diferida_fallida_invalida_la_respuesta_en_cache(
+        monkeypatch, cliente, keypair):
+    client, _, _, _ = cliente
+    public_key, _ = keypair
+    token = _correlate(PHONE)
+    diferidos = []
+
+    class CapturedThread:
+        def __init__(self, target=None, args=(), kwargs=None, daemon=None):
+            diferidos.append((target, args, kwargs or {}))
+
+        def start(self):
+            pass
+
+    monkeypatch.setattr(vicky_app.threading, "Thread", CapturedThread)
+    monkeypatch.setattr(vicky_app, "_imss_flow_cerca_del_limite", lambda: True)
+    monkeypatch.setattr(vicky_app, "notify_advisor", lambda msg, urgente=False: False)
+    body = {"action": "data_exchange", "screen": imss_flow.SCREEN_PENSION,
+            "data": {"profile": "1", "pension": "12000"}, "flow_token": token}
+
+    _post_and_decrypt(client, public_key, body)
+    for target, args, kwargs in diferidos:
+        target(*args, **kwargs)
+    diferidos.clear()
+    antes = vicky_app._imss_flow_replay_stats_snapshot()["hits"]
+
+    # El reintento de Meta no se sirve desde cache: vuelve a intentar la alerta.
+    _post_and_decrypt(client, public_key, body)
+
+    assert vicky_app._imss_flow_replay_stats_snapshot()["hits"] == antes
+    assert [a[1].__name__ for _, a, _ in diferidos][0] == "_imss_flow_notify_once"
+
+
+def test_solicitud_que_excede_el_deadline_se_cuenta(monkeypatch, cliente, keypair):
+    client, *_ = cliente
+    public_key, _ = keypair
+    monkeypatch.setattr(vicky_app, "IMSS_FLOW_DEADLINE_MS", 0)
+    antes = vicky_app._imss_flow_latency_stats()["deadline_exceeded"]
+
+    _post_and_decrypt(client, public_key, {"action": "ping"})
+
+    assert vicky_app._imss_flow_latency_stats()["deadline_exceeded"] == antes + 1
+
+
+# ─────────────────────────────────────────────────────────────────────────────
+# Registro unico de sesion por flow_token
+# ─────────────────────────────────────────────────────────────────────────────
+
+def test_sesion_unica_agrupa_telefono_pasos_y_marcas(cliente, keypair):
+    client, *_ = cliente
+    public_key, _ = keypair
+    token = _correlate(PHONE)
+
+    _post_and_decrypt(client, public_key, {
+        "action": "data_exchange", "screen": imss_flow.SCREEN_PROFILE,
+        "data": {"profile": "1"}, "flow_token": token})
+    _post_and_decrypt(client, public_key, {
+        "action": "data_exchange", "screen": imss_flow.SCREEN_PENSION,
+        "data": {"profile": "1", "pension": "12000"}, "flow_token": token})
+    _post_and_decrypt(client, public_key, {
+        "action": "data_exchange", "screen": imss_flow.SCREEN_HANDOFF,
+        "data": {"nombre": "Juan Pérez"}, "flow_token": token})
+
+    sesion = vicky_app._imss_flow_sesion(token)
+    assert sesion["phone"] == PHONE
+    assert sesion["pasos"] == [imss_flow.SCREEN_PROFILE, imss_flow.SCREEN_PENSION,
+                               imss_flow.SCREEN_HANDOFF]
+    assert set(sesion["marcas"]) == {"notif:pension:12000", "notif:handoff",
+                                     "boardroom", "handoff_completado"}
+    claves = list(vicky_app._state_store._aux_mem)
+    assert not [k for k in claves if k.startswith(("imss_flow_token:", "imss_flow_notif:",
+                                                   "imss_flow_boardroom:",
+                                                   "imss_flow_handoff_completado:"))]
+
+
+def test_la_sesion_se_lee_una_sola_vez_por_solicitud(monkeypatch, cliente, keypair):
+    client, *_ = cliente
+    public_key, _ = keypair
+    token = _correlate(PHONE)
+    store = vicky_app._state_store
+    lecturas, escrituras = [], []
+    real_aux_get, real_aux_update = store.aux_get, store.aux_update
+    en_update = {"activo": False}
+
+    def aux_get_contado(key):
+        if not en_update["activo"]:
+            lecturas.append(key)
+        return real_aux_get(key)
+
+    def aux_update_contado(key, fn, ttl):
+        escrituras.append(key)
+        en_update["activo"] = True
+        try:
+            return real_aux_update(key, fn, ttl)
+        finally:
+            en_update["activo"] = False
+
+    monkeypatch.setattr(store, "aux_get", aux_get_contado)
+    monkeypatch.setattr(store, "aux_update", aux_update_contado)
+    _post_and_decrypt(client, public_key, {
+        "action": "data_exchange", "screen": imss_flow.SCREEN_PENSION,
+        "data": {"profile": "1", "pension": "12000"}, "flow_token": token})
+
+    assert lecturas.count(f"imss_flow_session:{token}") == 1
+    assert not [k for k in lecturas if k.startswith(("imss_flow_notif:", "imss_flow_token:"))]
+    # Marca de la alerta al asesor + paso completado, cada una atomica.
+    assert escrituras == [f"imss_flow_session:{token}"] * 2
+
+
+def test_handler_que_falla_no_deja_la_sesion_en_el_hilo(monkeypatch, cliente, keypair):
+    client, *_ = cliente
+    public_key, _ = keypair
+    token = _correlate(PHONE)
+
+    def explota(*a, **k):
+        raise RuntimeError("handler roto")
+
+    monkeypatch.setattr(vicky_app, "_imss_flow_dispatch_screen", explota)
+    with pytest.raises(RuntimeError):
+        _post(client, public_key, {
+            "action": "data_exchange", "screen": imss_flow.SCREEN_PENSION,
+            "data": {"profile": "1", "pension": "12000"}, "flow_token": token})
+
+    assert getattr(vicky_app._tl, "imss_flow_sesion", None) is None
+    assert getattr(vicky_app._tl, "imss_flow_replay_clave", None) is None
+
+
+def test_flow_enviado_antes_del_registro_unico_sigue_resolviendo_el_telefono(cliente, keypair):
+    client, *_ = cliente
+    public_key, _ = keypair
+    token = imss_flow.generate_flow_token()
+    vicky_app._state_store.aux_set(f"imss_flow_token:{token}", PHONE, vicky_app._IMSS_FLOW_TOKEN_TTL)
+
+    r = _post_and_decrypt(client, public_key, {
+        "action": "data_exchange", "screen": imss_flow.SCREEN_PROFILE,
+        "data": {"profile": "1"}, "flow_token": token})
+
+    assert r["screen"] == imss_flow.SCREEN_PENSION
+    assert vicky_app._imss_flow_sesion(token)["pasos"] == [imss_flow.SCREEN_PROFILE]
@@ -0,0 +1,80 @@
+"""
+Tabla de factores de amortizacion por plazo.
+
+La tabla se construye al importar para IMSS_PLAZOS_DISPONIBLES y se
+reconstruye sola si cambian IMSS_TASA_MENSUAL / IMSS_IVA_RATE. La busqueda del
+primer plazo viable la usa para descartar plazos sin correr la biseccion; el
+plazo y la propuesta devueltos deben ser exactamente los del recorrido
+completo de antes.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as vicky_app
+
+
+def _recorrido_completo(pension: float, monto_objetivo: float):
+    for p in sorted(vicky_app.IMSS_PLAZOS_DISPONIBLES):
+        propuesta = vicky_app.calcular_propuesta_imss(pension, p)
+        if propuesta["monto"] >= monto_objetivo:
+            return p, propuesta
+    return None
+
+
+def test_table_is_built_for_every_available_plazo():
+    plazos = vicky_app._imss_tabla_vigente()
+    for plazo in vicky_app.IMSS_PLAZOS_DISPONIBLES:
+        assert plazos[plazo] == vicky_app._imss_calcular_factores(plazo)
+
+
+def test_table_rebuilds_when_rate_constants_change(monkeypatch):
+    antes = vicky_app._imss_factores_amortizacion(60)
+    monkeypatch.setattr(vicky_app, "IMSS_TASA_MENSUAL", 0.02)
+    despues = vicky_app._imss_factores_amortizacion(60)
+    assert despues != antes
+    assert despues == vicky_app._imss_calcular_factores(60)
+    monkeypatch.setattr(vicky_app, "IMSS_IVA_RATE", 0.0)
+    assert vicky_app._imss_factores_amortizacion(60) == vicky_app._imss_calcular_factores(60)
+    monkeypatch.undo()
+    assert vicky_app._imss_factores_amortizacion(60) == antes
+
+
+def test_off_catalog_plazo_is_computed_on_demand():
+    assert vicky_app._imss_factores_amortizacion(7) == vicky_app._imss_calcular_factores(7)
+
+
+def test_estimated_max_amount_brackets_the_bisection_result():
+    for pension in (3000, 8000, 12000, 25000):
+        cuota_max = pension * vicky_app.IMSS_LIMITE_DESCUENTO
+        for plazo in vicky_app.IMSS_PLAZOS_DISPONIBLES:
+            monto = vicky_app.calcular_propuesta_imss(pension, plazo)["monto"]
+            assert vicky_app._imss_monto_maximo_estimado(cuota_max - 0.02, plazo) <= monto
+            assert monto <= vicky_app._imss_monto_maximo_estimado(cuota_max + 0.02, plazo)
+
+
+def test_plazo_search_matches_full_scan():
+    objetivos = (vicky_app.IMSS_MONTO_MINIMO, 60000, 100000, 250000, 900000)
+    for pension in range(1500, 40001, 500):
+        for objetivo in objetivos:
+            assert vicky_app._imss_primer_plazo_para_monto(pension, objetivo) == \
+                _recorrido_completo(pension, objetivo), (pension, objetivo)
+
+
+def test_plazo_search_runs_bisection_only_for_candidates(monkeypatch):
+    llamadas = []
+    original = vicky_app.calcular_propuesta_imss
+
+    def contar(pension, plazo=vicky_app.IMSS_PLAZO_MESES):
+        llamadas.append(plazo)
+        return original(pension, plazo)
+
+    monkeypatch.setattr(vicky_app, "calcular_propuesta_imss", contar)
+    vicky_app._imss_memo_plazos.clear()
+    assert vicky_app._imss_primer_plazo_viable(12000)[0] == 18
+    assert llamadas == [18]
+    llamadas.clear()
+    assert vicky_app._imss_primer_plazo_viable(2000) is None
+    assert llamadas == []
@@ -0,0 +1,160 @@
+"""Efectos del HANDOFF del Flow dinamico como trabajo durable en segundo plano.
+
+La respuesta del handoff ya no espera a notify_advisor(), al reporte en
+Sheets ni al alta en Boardroom: escribe imss_flow_job:<token>, lo indexa en
+imss_flow_jobs y lo lanza en un hilo. Aqui se verifica que la respuesta no
+depende de esos efectos, que el trabajo sobrevive a un "reinicio" (se retoma
+desde el indice) y que cada efecto conserva su dedupe de siempre.
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as vicky_app
+import imss_flow
+
+PHONE = "5216681234567"
+PASO = {"nombre": "Juan Pérez", "ciudad": "Culiacán"}
+
+
+class CapturedThread:
+    """No ejecuta nada: deja el trabajo pendiente, como si el proceso se
+    detuviera justo despues de responder a Meta."""
+    lanzados = []
+
+    def __init__(self, target, args=(), kwargs=None, daemon=None):
+        CapturedThread.lanzados.append((target, args, kwargs or {}))
+
+    def start(self):
+        pass
+
+
+class ImmediateThread:
+    def __init__(self, target, args=(), kwargs=None, daemon=None):
+        self.target = target
+        self.args = args
+        self.kwargs = kwargs or {}
+
+    def start(self):
+        self.target(*self.args, **self.kwargs)
+
+
+@pytest.fixture
+def entorno(monkeypatch):
+    monkeypatch.setattr(vicky_app, "user_state", {})
+    monkeypatch.setattr(vicky_app, "user_data", {})
+    monkeypatch.setattr(vicky_app, "_state_store", vicky_app.StateStore())
+    monkeypatch.setattr(vicky_app, "_log", lambda *a, **k: None)
+    monkeypatch.setattr(vicky_app, "_nombre", lambda phone: "Test")
+    monkeypatch.setattr(vicky_app, "send_msg", lambda to, text: True)
+    CapturedThread.lanzados = []
+
+    avisos, altas, respaldos, programados = [], [], [], []
+    monkeypatch.setattr(vicky_app, "notify_advisor", lambda msg: avisos.append(msg) or True)
+    monkeypatch.setattr(vicky_app, "_notify_boardroom_lead_qualified",
+                        lambda phone, code, data: altas.append(phone) or True)
+    monkeypatch.setattr(vicky_app, "_imss_log_lead_backup",
+                        lambda phone, data, resultado="advisor_notify_failed": respaldos.append(resultado))
+    monkeypatch.setattr(vicky_app, "_imss_flow_job_programar",
+                        lambda token, espera: programados.append((token, espera)))
+
+    # Propuesta previa, calculada con hilos en linea.
+    monkeypatch.setattr(vicky_app.threading, "Thread", ImmediateThread)
+    token = imss_flow.generate_flow_token()
+    vicky_app._imss_flow_handle_profile(PHONE, {"profile": "1"}, token)
+    vicky_app._imss_flow_handle_pension(PHONE, {"profile": "1", "pension": "12000"}, token)
+    avisos.clear()
+    return token, avisos, altas, respaldos, programados
+
+
+def _job(token):
+    return json.loads(vicky_app._state_store.aux_get(f"imss_flow_job:{token}"))
+
+
+def test_respuesta_del_handoff_no_espera_los_efectos(monkeypatch, entorno):
+    token, avisos, altas, _, _ = entorno
+    monkeypatch.setattr(vicky_app.threading, "Thread", CapturedThread)
+
+    r = vicky_app._imss_flow_handle_handoff(PHONE, PASO, token)
+
+    assert r["data"]["extension_message_response"]["params"]["resultado"] == "calificado"
+    assert avisos == [] and altas == []
+    assert _job(token)["pendientes"] == ["asesor", "sheets", "boardroom"]
+    assert token in vicky_app._state_store.aux_smembers(vicky_app._IMSS_FLOW_JOB_INDICE)
+    assert len(CapturedThread.lanzados) == 1
+
+
+def test_trabajo_pendiente_se_retoma_tras_reinicio(monkeypatch, entorno):
+    token, avisos, altas, _, _ = entorno
+    monkeypatch.setattr(vicky_app.threading, "Thread", CapturedThread)
+    vicky_app._imss_flow_handle_handoff(PHONE, PASO, token)
+
+    retomados = []
+    monkeypatch.setattr(vicky_app, "_imss_flow_job_programar",
+                        lambda t, espera: retomados.append(t) or vicky_app._imss_flow_job_correr(t))
+    vicky_app._imss_flow_jobs_reanudar()
+
+    assert retomados == [token]
+    assert len(avisos) == 1 and "PROSPECTO IMSS CALIFICADO" in avisos[0]
+    assert altas == [PHONE]
+    assert _job(token)["pendientes"] == []
+    assert vicky_app._state_store.aux_smembers(vicky_app._IMSS_FLOW_JOB_INDICE) == set()
+    assert vicky_app.user_data[PHONE]["advisor_notify_ok"] is True
+
+
+def test_efecto_fallido_se_reintenta_con_backoff_sin_duplicar_los_exitosos(monkeypatch, entorno):
+    token, avisos, _, _, programados = entorno
+    monkeypatch.setattr(vicky_app.threading, "Thread", ImmediateThread)
+    boardroom = {"ok": False, "intentos": 0}
+
+    def alta(phone, code, data):
+        boardroom["intentos"] += 1
+        return boardroom["ok"]
+
+    monkeypatch.setattr(vicky_app, "_notify_boardroom_lead_qualified", alta)
+
+    vicky_app._imss_flow_handle_handoff(PHONE, PASO, token)
+    assert _job(token)["pendientes"] == ["boardroom"]
+    assert programados == [(token, vicky_app._IMSS_FLOW_JOB_BACKOFF_S[0])]
+    assert not vicky_app._imss_flow_tiene_marca(token, "boardroom")
+
+    boardroom["ok"] = True
+    vicky_app._imss_flow_job_correr(token)
+
+    assert boardroom["intentos"] == 2
+    assert vicky_app._imss_flow_tiene_marca(token, "boardroom")
+    assert len(avisos) == 1, "el asesor ya tenia la ficha: no se reenvia"
+    assert _job(token)["pendientes"] == []
+
+
+def test_asesor_fallido_respalda_una_vez_y_agota_reintentos(monkeypatch, entorno):
+    token, _, _, respaldos, programados = entorno
+    monkeypatch.setattr(vicky_app.threading, "Thread", ImmediateThread)
+    monkeypatch.setattr(vicky_app, "notify_advisor", lambda msg: False)
+
+    vicky_app._imss_flow_handle_handoff(PHONE, PASO, token)
+    for _ in vicky_app._IMSS_FLOW_JOB_BACKOFF_S:
+        vicky_app._imss_flow_job_correr(token)
+
+    assert respaldos == ["advisor_notify_failed", "flow_job_agotado"]
+    assert len(programados) == len(vicky_app._IMSS_FLOW_JOB_BACKOFF_S)
+    assert vicky_app.user_data[PHONE]["advisor_notify_ok"] is False
+    assert vicky_app._state_store.aux_smembers(vicky_app._IMSS_FLOW_JOB_INDICE) == set()
+
+
+def test_reintento_de_meta_no_reescribe_el_trabajo(monkeypatch, entorno):
+    token, avisos, altas, _, _ = entorno
+    monkeypatch.setattr(vicky_app.threading, "Thread", ImmediateThread)
+    monkeypatch.setattr(vicky_app, "send_msg", lambda to, text: False)
+
+    vicky_app._imss_flow_handle_handoff(PHONE, PASO, token)
+    vicky_app._imss_flow_handle_handoff(PHONE, {"nombre": "Otro Nombre"}, token)
+
+    assert len(avisos) == 1
+    assert altas == [PHONE]
+    assert "Juan Pérez" in _job(token)["mensaje_asesor"]
@@ -0,0 +1,49 @@
+"""
+Arnes de carga bench/bench_imss_flow_carga.py: una corrida chica en proceso
+debe completar sesiones PROFILE -> PENSION -> HANDOFF sin errores, con firma
+real, y reportar percentiles por pantalla.
+"""
+
+import os
+import sys
+
+_RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, _RAIZ)
+sys.path.insert(0, os.path.join(_RAIZ, "bench"))
+
+import app as vicky_app
+import bench_imss_flow_carga as carga
+
+
+def test_sesiones_completas_sin_errores(monkeypatch):
+    # El arnes reemplaza globals del modulo sin restaurarlos; monkeypatch
+    # los deja como estaban al terminar el test.
+    for nombre in ("APP_SECRET", "send_msg", "notify_advisor", "_report_upsert_lead", "_log",
+                   "_imss_log_lead_backup", "_notify_boardroom_lead_qualified",
+                   "IMSS_FLOW_PRIVATE_KEY", "IMSS_FLOW_PRIVATE_KEY_PREVIOUS"):
+        monkeypatch.setattr(vicky_app, nombre, getattr(vicky_app, nombre))
+    monkeypatch.setattr(vicky_app, "user_state", {})
+    monkeypatch.setattr(vicky_app, "user_data", {})
+    monkeypatch.setattr(vicky_app, "_state_store", vicky_app.StateStore())
+    # Los efectos del handoff (trabajo en segundo plano) no se lanzan: sus
+    # hilos podrian sobrevivir al test y correr con los globals ya restaurados.
+    monkeypatch.setattr(vicky_app, "_imss_flow_job_encolar", lambda *a, **k: None)
+
+    resumen = carga.ejecutar(sesiones=6, concurrencia=2, modo="inproc")
+
+    assert resumen["tasa_error"] == 0
+    assert resumen["solicitudes"] == 18
+    for pantalla in carga.PANTALLAS:
+        v = resumen["pantallas"][pantalla]
+        assert v["solicitudes"] == 6
+        assert v["p50_ms"] <= v["p95_ms"] <= v["p99_ms"] <= v["max_ms"]
+    assert resumen["llamadas_dobles"]["whatsapp"] >= 6
+
+
+def test_resumen_cuenta_errores_por_pantalla():
+    muestras = [("IMSS_PROFILE", 5.0, True), ("IMSS_PROFILE", 7.0, False),
+                ("IMSS_PENSION", 9.0, True)]
+    resumen = carga.resumir(muestras, sesiones=2, segundos=1.0)
+    assert resumen["pantallas"]["IMSS_PROFILE"]["errores"] == 1
+    assert resumen["tasa_error"] == round(1 / 3, 4)
+    assert resumen["pantallas"]["IMSS_HANDOFF"]["solicitudes"] == 0
@@ -23,7 +23,7 @@ def _base_patches(monkeypatch):
     advisor_msgs = []
 
     monkeypatch.setattr(vicky_app, "send_msg", lambda to, text: sent.append((to, text)) or True)
-    monkeypatch.setattr(vicky_app, "notify_advisor", lambda msg: advisor_msgs.append(msg) or True)
+    monkeypatch.setattr(vicky_app, "notify_advisor", lambda msg, urgente=False: advisor_msgs.append(msg) or True)
 
     return sent, advisor_msgs
 
@@ -61,6 +61,20 @@ def test_second_invalid_reply_notifies_advisor_once_with_clarified_message(monke
     assert "asesor" in last_reply.lower()
 
 
+def test_stuck_alert_is_urgent_and_skips_the_digest(monkeypatch):
+    _base_patches(monkeypatch)
+    urgentes = []
+    monkeypatch.setattr(vicky_app, "notify_advisor",
+                        lambda msg, urgente=False: urgentes.append(urgente) or True)
+    phone = "6681112222"
+    _set_state(phone)
+
+    vicky_app.funnel_imss(phone, "no entiendo")
+    vicky_app.funnel_imss(phone, "no se que me quiere decir")
+
+    assert urgentes == [True]
+
+
 def test_third_invalid_reply_does_not_spam_advisor_again(monkeypatch):
     sent, advisor_msgs = _base_patches(monkeypatch)
     phone = "6681112222"
@@ -0,0 +1,100 @@
+"""
+Memo LRU de propuestas IMSS: calcular_propuesta_imss y la busqueda de plazo
+se sirven desde memoria cuando la pension (al centavo) y el plazo se repiten,
+y el memo se vacia solo si cambian las constantes financieras.
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as vicky_app
+
+
+@pytest.fixture(autouse=True)
+def _memo_limpio():
+    vicky_app._imss_memo_propuestas.clear()
+    vicky_app._imss_memo_plazos.clear()
+    yield
+    vicky_app._imss_memo_propuestas.clear()
+    vicky_app._imss_memo_plazos.clear()
+
+
+def _contar_biseccion(monkeypatch):
+    llamadas = []
+    original = vicky_app._imss_calcular_monto_maximo
+
+    def contar(cuota_max, plazo):
+        llamadas.append(plazo)
+        return original(cuota_max, plazo)
+
+    monkeypatch.setattr(vicky_app, "_imss_calcular_monto_maximo", contar)
+    return llamadas
+
+
+def test_repeated_proposal_is_served_from_memo(monkeypatch):
+    llamadas = _contar_biseccion(monkeypatch)
+    primera = vicky_app.calcular_propuesta_imss(12000)
+    segunda = vicky_app.calcular_propuesta_imss(12000.0)
+    assert primera == segunda
+    assert llamadas == [60]
+    stats = vicky_app._imss_memo_stats()["propuestas"]
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5
+
+
+def test_key_is_pension_rounded_to_the_cent_plus_plazo(monkeypatch):
+    llamadas = _contar_biseccion(monkeypatch)
+    a = vicky_app.calcular_propuesta_imss(12000.001, 24)
+    b = vicky_app.calcular_propuesta_imss(11999.999, 24)
+    assert a == b
+    vicky_app.calcular_propuesta_imss(12000, 30)
+    assert llamadas == [24, 30]
+
+
+def test_returned_dict_is_a_copy():
+    propuesta = vicky_app.calcular_propuesta_imss(9000)
+    propuesta["monto"] = -1
+    assert vicky_app.calcular_propuesta_imss(9000)["monto"] > 0
+
+
+def test_memo_invalidated_when_rate_constants_change(monkeypatch):
+    antes = vicky_app.calcular_propuesta_imss(12000)
+    monkeypatch.setattr(vicky_app, "IMSS_TASA_MENSUAL", 0.025)
+    despues = vicky_app.calcular_propuesta_imss(12000)
+    assert despues["monto"] < antes["monto"]
+    assert vicky_app._imss_memo_stats()["propuestas"]["invalidations"] == 1
+    monkeypatch.setattr(vicky_app, "IMSS_LIMITE_DESCUENTO", 0.20)
+    assert vicky_app.calcular_propuesta_imss(12000)["cuota_max"] == 12000 * 0.20
+
+
+def test_lru_is_bounded():
+    memo = vicky_app._MemoLRU(3)
+    for i in range(5):
+        memo.get(i, "v")
+        memo.put(i, "v", i)
+    assert memo.stats()["size"] == 3
+    assert memo.get(0, "v") == (False, None)
+    assert memo.get(4, "v") == (True, 4)
+
+
+def test_plazo_search_is_memoized_and_tracks_catalog(monkeypatch):
+    primera = vicky_app._imss_primer_plazo_viable(12000)
+    assert vicky_app._imss_primer_plazo_viable(12000) == primera
+    assert vicky_app._imss_memo_stats()["plazos"]["hits"] == 1
+    # El catalogo es parte de la llave: restringirlo no sirve el resultado viejo.
+    monkeypatch.setattr(vicky_app, "IMSS_PLAZOS_DISPONIBLES", (60,))
+    assert vicky_app._imss_primer_plazo_viable(12000)[0] == 60
+
+
+def test_metrics_endpoint_exposes_memo_stats(monkeypatch):
+    monkeypatch.setattr(vicky_app, "INTERNAL_TOKEN", "test-token")
+    client = vicky_app.app.test_client()
+    assert client.get("/ext/metrics").status_code == 401
+    vicky_app.calcular_propuesta_imss(10000)
+    vicky_app.calcular_propuesta_imss(10000)
+    body = client.get("/ext/metrics", headers={"X-Internal-Token": "test-token"}).get_json()
+    assert body["imss_memo"]["propuestas"]["hits"] == 1
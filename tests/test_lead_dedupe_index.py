@@ -0,0 +1,128 @@
+"""
+Indice de leads por telefono (lead_phone:<10 digitos>): la misma persona que
+llega por /ext/lead, por un anuncio y por WhatsApp directo no dispara dos
+alertas "lead nuevo" al asesor ni dos altas en Boardroom dentro de
+LEAD_DEDUPE_WINDOW_S.
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as vicky_app
+
+HEADERS = {"X-Internal-Token": "test-token"}
+PHONE = "5216680000000"
+LEAD = {"nombre": "Ana", "telefono": "6680000000", "interes": "prestamo_imss",
+        "source": "cohifis.com.mx"}
+
+
+@pytest.fixture
+def entorno(monkeypatch):
+    monkeypatch.setattr(vicky_app, "INTERNAL_TOKEN", "test-token")
+    monkeypatch.setattr(vicky_app, "EXT_LEAD_ASYNC_ENABLED", False)
+    monkeypatch.setattr(vicky_app, "LEAD_DEDUPE_WINDOW_S", 3600)
+    monkeypatch.setattr(vicky_app, "_state_store", vicky_app.StateStore())
+    monkeypatch.setattr(vicky_app, "_lead_indice_contadores",
+                        dict.fromkeys(vicky_app._lead_indice_contadores, 0))
+    avisos, altas, meta = [], [], {"ok": True}
+    monkeypatch.setattr(vicky_app, "notify_advisor", lambda msg: avisos.append(msg) or meta["ok"])
+    monkeypatch.setattr(vicky_app, "_boardroom_outbox_registrar",
+                        lambda tipo, clave, args, diferido=False: altas.append(clave) or clave)
+    return vicky_app.app.test_client(), avisos, altas, meta
+
+
+def _registro():
+    return json.loads(vicky_app._state_store.aux_get("lead_phone:6680000000"))
+
+
+def test_segundo_lead_del_mismo_telefono_no_repite_la_alerta(entorno):
+    client, avisos, altas, _ = entorno
+
+    r1 = client.post("/ext/lead", json={**LEAD, "lead_id": "web-1"}, headers=HEADERS)
+    r2 = client.post("/ext/lead", json={**LEAD, "lead_id": "meta-1", "source": "meta_ads"},
+                     headers=HEADERS)
+
+    assert r1.status_code == 200 and "duplicado" not in r1.get_json()
+    assert r2.status_code == 200 and r2.get_json()["duplicado"] is True
+    assert len(avisos) == 1 and altas == ["web-1"]
+    registro = _registro()
+    assert registro["primera_fuente"] == "cohifis.com.mx"
+    assert registro["ultimo_producto"] == "prestamo_imss_ley73"
+    st = vicky_app._lead_indice_stats()
+    assert st["suprimidos_asesor"] == 1 and st["suprimidos_boardroom"] == 1
+
+
+def test_aviso_del_funnel_marca_y_suprime_el_ext_lead_posterior(entorno):
+    client, avisos, altas, _ = entorno
+    vicky_app._lead_indice_marcar(PHONE, "asesor", "prestamo_imss_ley73", "whatsapp")
+    vicky_app._boardroom_outbox_lead(PHONE, "prestamo_imss_ley73", {})
+
+    resp = client.post("/ext/lead", json={**LEAD, "lead_id": "web-2"}, headers=HEADERS)
+
+    assert resp.get_json()["duplicado"] is True
+    assert avisos == [] and len(altas) == 1
+    assert _registro()["primera_fuente"] == "whatsapp"
+
+
+def test_calificacion_del_funnel_llega_a_boardroom_aunque_ya_hubiera_ext_lead(entorno):
+    client, _, altas, _ = entorno
+    client.post("/ext/lead", json={**LEAD, "lead_id": "web-6"}, headers=HEADERS)
+
+    vicky_app._boardroom_outbox_lead(PHONE, "prestamo_imss_ley73", {"pension": 12000},
+                                     funnel="imss")
+
+    assert altas == ["web-6", "5216680000000:prestamo_imss_ley73:imss"]
+    assert vicky_app._lead_indice_stats()["suprimidos_boardroom"] == 0
+
+
+def test_otro_producto_o_ventana_vencida_si_notifica(entorno):
+    assert vicky_app._lead_indice_reclamar(PHONE, "asesor", "seguro_vida", "whatsapp")
+    assert vicky_app._lead_indice_reclamar(PHONE, "asesor", "nomina_empresarial", "whatsapp")
+    assert not vicky_app._lead_indice_reclamar(PHONE, "asesor", "seguro_vida", "meta_ads")
+
+    registro = _registro()
+    registro["notificaciones"]["asesor:seguro_vida"] -= 3601
+    vicky_app._state_store.aux_set("lead_phone:6680000000", json.dumps(registro), 60)
+
+    assert vicky_app._lead_indice_reclamar(PHONE, "asesor", "seguro_vida", "meta_ads")
+
+
+def test_aviso_fallido_libera_la_marca_para_el_reintento(entorno):
+    client, avisos, altas, meta = entorno
+    meta["ok"] = False
+    assert client.post("/ext/lead", json={**LEAD, "lead_id": "web-3"},
+                       headers=HEADERS).status_code == 502
+
+    meta["ok"] = True
+    resp = client.post("/ext/lead", json={**LEAD, "lead_id": "web-3"}, headers=HEADERS)
+
+    assert resp.status_code == 200 and "duplicado" not in resp.get_json()
+    assert len(avisos) == 2 and altas == ["web-3"]
+
+
+def test_ventana_cero_desactiva_el_indice(monkeypatch, entorno):
+    client, avisos, altas, _ = entorno
+    monkeypatch.setattr(vicky_app, "LEAD_DEDUPE_WINDOW_S", 0)
+
+    client.post("/ext/lead", json={**LEAD, "lead_id": "web-4"}, headers=HEADERS)
+    client.post("/ext/lead", json={**LEAD, "lead_id": "web-5"}, headers=HEADERS)
+
+    assert len(avisos) == 2 and altas == ["web-4", "web-5"]
+    assert vicky_app._state_store.aux_get("lead_phone:6680000000") is None
+
+
+def test_metricas_exponen_los_suprimidos(entorno):
+    client, _, _, _ = entorno
+    vicky_app._lead_indice_reclamar(PHONE, "boardroom", "seguro_vida", "whatsapp")
+    vicky_app._lead_indice_reclamar(PHONE, "boardroom", "seguro_vida", "whatsapp")
+
+    body = client.get("/ext/metrics", headers=HEADERS).get_json()
+
+    assert body["lead_dedupe"]["ventana_s"] == 3600
+    assert body["lead_dedupe"]["suprimidos_boardroom"] == 1
+    assert body["lead_dedupe"]["reclamados"] == 1
@@ -0,0 +1,139 @@
+"""
+Ingesta de media entrante (MEDIA_PIPELINE_ENABLED): streaming desde la Graph
+API a disco en bloques, sha256 para dedupe, limites de tipo/tamano y una
+referencia estable (media_ref) en el aviso a Boardroom.
+"""
+
+import hashlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as vicky_app
+
+PHONE = "5216681234567"
+CONTENIDO = b"%PDF-1.4 " + b"x" * 200_000
+
+
+class ImmediateThread:
+    def __init__(self, target, args=(), kwargs=None, daemon=None):
+        self.target = target
+        self.args = args
+        self.kwargs = kwargs or {}
+
+    def start(self):
+        self.target(*self.args, **self.kwargs)
+
+
+class FakeGet:
+    def __init__(self, status=200, json_body=None, contenido=b"", tipo="application/pdf"):
+        self.status_code = status
+        self._json = json_body
+        self._contenido = contenido
+        self.headers = {"Content-Type": tipo}
+        self.bloques = []
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise vicky_app.requests.HTTPError(str(self.status_code))
+
+    def json(self):
+        return self._json
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self._contenido), chunk_size):
+            self.bloques.append(chunk_size)
+            yield self._contenido[i:i + chunk_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def pipeline(monkeypatch, tmp_path):
+    monkeypatch.setattr(vicky_app.threading, "Thread", ImmediateThread)
+    monkeypatch.setattr(vicky_app, "MEDIA_PIPELINE_ENABLED", True)
+    monkeypatch.setattr(vicky_app, "MEDIA_STORAGE_DIR", str(tmp_path))
+    monkeypatch.setattr(vicky_app, "META_TOKEN", "meta-token")
+    monkeypatch.setattr(vicky_app, "_state_store", vicky_app.StateStore())
+    monkeypatch.setattr(vicky_app, "_media_pool", vicky_app._EmisorBoardroom(1, 10))
+    monkeypatch.setattr(vicky_app, "_media_contadores", dict.fromkeys(vicky_app._media_contadores, 0))
+    avisos = []
+    monkeypatch.setattr(vicky_app, "_boardroom_outbox_documento",
+                        lambda phone, media_id, doc_type, media=None: avisos.append((media_id, media)))
+    estado = {"meta": {"url": "https://lookaside.test/f", "mime_type": "application/pdf",
+                       "file_size": len(CONTENIDO)},
+              "contenido": CONTENIDO, "tipo": "application/pdf", "descargas": []}
+
+    def fake_get(url, **kwargs):
+        if url.startswith(vicky_app._WA_BASE):
+            return FakeGet(json_body=estado["meta"])
+        assert kwargs.get("stream") is True
+        r = FakeGet(contenido=estado["contenido"], tipo=estado["tipo"])
+        estado["descargas"].append(r)
+        return r
+
+    monkeypatch.setattr(vicky_app.requests, "get", fake_get)
+    return tmp_path, avisos, estado
+
+
+def test_descarga_por_bloques_y_referencia_estable(pipeline):
+    tmp_path, avisos, estado = pipeline
+    sha = hashlib.sha256(CONTENIDO).hexdigest()
+
+    vicky_app._media_encolar(PHONE, "media-1", "document")
+
+    assert avisos == [("media-1", {"media_ref": f"sha256:{sha}", "sha256": sha,
+                                   "mime_type": "application/pdf", "bytes": len(CONTENIDO)})]
+    guardado = tmp_path / sha[:2] / f"{sha}.pdf"
+    assert guardado.read_bytes() == CONTENIDO
+    assert len(estado["descargas"][0].bloques) > 1, "se descarga en bloques, no de un jalon"
+    assert not list(tmp_path.glob("*.part"))
+
+
+def test_mismo_contenido_con_otro_media_id_se_deduplica(pipeline):
+    _, avisos, _ = pipeline
+    vicky_app._media_encolar(PHONE, "media-1", "document")
+    vicky_app._media_encolar(PHONE, "media-2", "document")
+    vicky_app._media_encolar(PHONE, "media-2", "document")
+
+    assert avisos[0][1]["sha256"] == avisos[1][1]["sha256"] == avisos[2][1]["sha256"]
+    st = vicky_app._media_stats()
+    assert st["descargados"] == 1 and st["duplicados"] == 2
+
+
+def test_archivo_mas_grande_que_el_limite_se_corta_y_avisa_sin_referencia(monkeypatch, pipeline):
+    tmp_path, avisos, estado = pipeline
+    monkeypatch.setattr(vicky_app, "MEDIA_MAX_BYTES", 100_000)
+    estado["meta"]["file_size"] = 0  # Meta no siempre lo declara: se corta al descargar.
+
+    vicky_app._media_encolar(PHONE, "media-3", "document")
+
+    assert avisos == [("media-3", None)]
+    assert vicky_app._media_stats()["rechazados_tamano"] == 1
+    assert list(tmp_path.rglob("*")) == []
+
+
+def test_tipo_no_permitido_no_se_descarga(pipeline):
+    _, avisos, estado = pipeline
+    estado["meta"]["mime_type"] = "video/mp4"
+
+    vicky_app._media_encolar(PHONE, "media-4", "document")
+
+    assert avisos == [("media-4", None)] and estado["descargas"] == []
+    assert vicky_app._media_stats()["rechazados_tipo"] == 1
+
+
+def test_flag_apagado_conserva_el_aviso_de_siempre(monkeypatch, pipeline):
+    _, avisos, estado = pipeline
+    monkeypatch.setattr(vicky_app, "MEDIA_PIPELINE_ENABLED", False)
+
+    vicky_app._media_encolar(PHONE, "media-5", "image")
+
+    assert avisos == [("media-5", None)] and estado["descargas"] == []
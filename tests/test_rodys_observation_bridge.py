@@ -88,8 +88,10 @@ class _FakeResponse:
 def _base_patches(monkeypatch, *, post_side_effect=None, post_status=200):
     """Aisla handle() de I/O real y captura cada POST a /bus/event.
 
-    Se parchea requests.post (no _emit_boardroom_observation) a proposito: asi
+    Se parchea el POST HTTP (no _emit_boardroom_observation) a proposito: asi
     la prueba ejercita el helper real, sus headers y su manejo de errores.
+    Los envios al bus pasan por la sesion keep-alive _boardroom_http_post;
+    requests.post se parchea igual para que nada salga a la red.
     """
     monkeypatch.setattr(vicky_app.threading, "Thread", ImmediateThread)
     monkeypatch.setattr(vicky_app, "user_state", {})
@@ -102,6 +104,8 @@ def _base_patches(monkeypatch, *, post_side_effect=None, post_status=200):
     monkeypatch.setattr(vicky_app, "_BUS_ACTIVE", True)
     monkeypatch.setattr(vicky_app, "BUS_URL", "https://boardroom-engine.test")
     monkeypatch.setattr(vicky_app, "BUS_INTERNAL_TOKEN", "token-de-prueba")
+    # Circuito limpio por prueba: las fallas de una no deben abrirlo en otra.
+    monkeypatch.setattr(vicky_app, "_circuito_boardroom", vicky_app._CircuitoBoardroom())
 
     sent = []
     monkeypatch.setattr(vicky_app, "send_msg", lambda to, text: sent.append((to, text)) or True)
@@ -117,6 +121,7 @@ def _base_patches(monkeypatch, *, post_side_effect=None, post_status=200):
             raise post_side_effect
         return _FakeResponse(post_status)
 
+    monkeypatch.setattr(vicky_app, "_boardroom_http_post", fake_post)
     monkeypatch.setattr(vicky_app.requests, "post", fake_post)
     return sent, posts
 
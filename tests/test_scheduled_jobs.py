@@ -0,0 +1,144 @@
+"""
+Programador compartido (trabajos_programados): los reintentos y las
+reanudaciones del outbox de Boardroom, /ext/lead asincrono y los handoffs del
+Flow IMSS son miembros de un solo conjunto ordenado que un hilo drena por
+lotes, en vez de un threading.Timer por evento.
+"""
+
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as vicky_app
+
+PHONE = "5216681234567"
+
+
+class FakeEmisor:
+    def __init__(self, acepta=True):
+        self.acepta = acepta
+        self.recibidos = []
+        self.reservas = []
+        self.capacidad = 500
+
+    def enviar(self, tipo, fn, *args, reserva=0):
+        self.reservas.append(reserva)
+        if self.acepta:
+            self.recibidos.append(args[0])
+        return self.acepta
+
+
+@pytest.fixture
+def programador(monkeypatch):
+    monkeypatch.setattr(vicky_app, "_state_store", vicky_app.StateStore())
+    monkeypatch.setattr(vicky_app, "_programador_arrancar", lambda: None)
+    monkeypatch.setattr(vicky_app, "PROGRAMADOR_BATCH", 10)
+    monkeypatch.setattr(vicky_app, "_programador_contadores",
+                        dict.fromkeys(vicky_app._programador_contadores, 0))
+    emisor = FakeEmisor(acepta=False)
+    monkeypatch.setattr(vicky_app, "_boardroom_emisor", emisor)
+    return emisor
+
+
+def _programados():
+    return vicky_app._state_store.aux_zcard(vicky_app._PROGRAMADOR_ZSET)
+
+
+def _vencer_todo():
+    for miembro, _ in vicky_app._state_store.aux_zvencidos(
+            vicky_app._PROGRAMADOR_ZSET, time.time() + 10 ** 6, 10 ** 6):
+        vicky_app._state_store.aux_zadd(vicky_app._PROGRAMADOR_ZSET, miembro, 0, 60)
+
+
+def test_reanudar_el_outbox_se_drena_por_lotes(programador):
+    for i in range(25):
+        vicky_app._boardroom_outbox_documento(PHONE, f"media-{i}", "image")
+    assert _programados() == 25
+
+    programador.acepta = True
+    vicky_app._boardroom_outbox_reanudar()
+    assert _programados() == 25
+
+    assert vicky_app._programador_procesar() == 10
+    assert len(programador.recibidos) == 10 and _programados() == 15
+    vicky_app._programador_procesar()
+    vicky_app._programador_procesar()
+    assert len(set(programador.recibidos)) == 25 and _programados() == 0
+
+
+def test_emisor_lleno_reagenda_sin_gastar_intento(programador):
+    event_id = vicky_app._boardroom_outbox_documento(PHONE, "media-1", "image")
+    _vencer_todo()
+
+    vicky_app._programador_procesar()
+
+    vencidos = vicky_app._state_store.aux_zvencidos(
+        vicky_app._PROGRAMADOR_ZSET, time.time() + 10 ** 6, 10)
+    assert [m for m, _ in vencidos] == [f"outbox|{event_id}"]
+    assert vencidos[0][1] > time.time() + 1
+    assert vicky_app._boardroom_outbox_cargar(event_id)["intentos"] == 0
+
+
+def test_cada_tipo_va_a_su_handler_y_lo_futuro_espera(monkeypatch, programador):
+    corridos = []
+    monkeypatch.setattr(vicky_app, "_ext_lead_procesar", lambda i: corridos.append(("lead", i)))
+    monkeypatch.setattr(vicky_app, "_imss_flow_job_correr",
+                        lambda t: corridos.append(("flow", t)))
+
+    vicky_app._ext_lead_programar("L1", 0)
+    vicky_app._imss_flow_job_programar("tok-1", 0)
+    vicky_app._ext_lead_programar("L2", 600)
+
+    assert vicky_app._programador_procesar() == 2
+    assert sorted(corridos) == [("flow", "tok-1"), ("lead", "L1")]
+    assert _programados() == 1
+    st = vicky_app._programador_stats()
+    assert st["agendados"] == 3 and st["ejecutados"] == 2
+
+
+def test_handler_que_falla_no_detiene_el_lote(monkeypatch, programador):
+    corridos = []
+
+    def procesar(lead_id):
+        corridos.append(lead_id)
+        if lead_id == "L1":
+            raise RuntimeError("boom")
+
+    monkeypatch.setattr(vicky_app, "_ext_lead_procesar", procesar)
+    vicky_app._ext_lead_programar("L1", 0)
+    vicky_app._ext_lead_programar("L2", 0)
+
+    assert vicky_app._programador_procesar() == 2
+    assert sorted(corridos) == ["L1", "L2"]
+    assert vicky_app._programador_stats()["fallidos"] == 1
+
+
+def test_reintentos_del_asesor_corren_en_el_mismo_hilo(monkeypatch, programador):
+    monkeypatch.setattr(vicky_app, "_programador_periodicos", [])
+    monkeypatch.setattr(vicky_app, "ADVISOR_RETRY_ENABLED", True)
+    ticks = []
+    monkeypatch.setattr(vicky_app, "_advisor_reintentos_procesar", lambda: ticks.append(1))
+
+    vicky_app._advisor_reintentos_arrancar()
+    vicky_app._programador_procesar()
+    assert ticks == []
+
+    vicky_app._programador_periodicos[0]["proxima"] = 0
+    vicky_app._programador_procesar()
+    assert ticks == [1]
+
+
+def test_altas_diferidas_no_pasan_directo_al_emisor(programador):
+    programador.acepta = True
+    for i in range(15):
+        vicky_app._boardroom_outbox_lead(f"66800000{i:02d}", "seguro_vida", {}, lead_id=f"L{i}",
+                                         diferido=True)
+
+    assert programador.recibidos == [] and _programados() == 15
+    vicky_app._programador_procesar()
+    assert len(programador.recibidos) == 10
+    assert set(programador.reservas) == {programador.capacidad // 2}